@@ -0,0 +1,231 @@
+"""
+Statistics of one memory metric over a capture: the deltas, a rolling
+baseline, how fast it grows, percentile bands and the spikes.
+
+Everything works on a pair of sequences, the timestamps and the values,
+as returned by load(). With NumPy installed those are arrays and the work
+is vectorised (and a columnar file isn't even copied, the arrays are
+views onto the mmap). Without it they're lists and the same is done in
+plain Python, with the same results.
+
+ $ python analytics.py [--metric=rss] [--window=N] /tmp/zope-memory-readings.dat
+"""
+import os
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from record import METRICS, Reading
+
+HOUR = 3600.0
+
+
+def load(filename, metric='memory', first=None, last=None):
+    """ return (timestamps, values) of the @metric (one of record.METRICS)
+    of the readings in @filename from @first to @last, see
+    generate_graph.iter_readings(). Readings without a value are left
+    out. """
+    from columnar import is_columnar, ColumnarCapture
+    if numpy is not None and not os.path.isdir(filename) and \
+       is_columnar(filename):
+        capture = ColumnarCapture(filename)
+        start, end = capture.time_range(first, last)
+        timestamps = numpy.frombuffer(capture.view('timestamp', start, end),
+                                      '<f8')
+        values = numpy.frombuffer(capture.view(metric, start, end), '<i4')
+        known = values != -1
+        if not known.all():
+            timestamps, values = timestamps[known], values[known]
+        return timestamps, values.astype(numpy.float64)
+    from generate_graph import iter_readings
+    readings = iter_readings(filename, first, last)[0]
+    index = Reading._fields.index(metric)
+    timestamps = []
+    values = []
+    for reading in readings:
+        value = reading[index]
+        if value is not None:
+            timestamps.append(reading[2])
+            values.append(float(value))
+    if numpy is not None:
+        return numpy.array(timestamps), numpy.array(values)
+    return timestamps, values
+
+
+def deltas(values):
+    """ each value minus the one before it """
+    if numpy is not None:
+        return numpy.diff(values)
+    return [b - a for a, b in zip(values, values[1:])]
+
+
+def rolling_baseline(values, window):
+    """ the mean of the @window values before each value (of all of them
+    before it, for the first @window), and the first value for the first
+    one """
+    if not len(values):
+        return [] if numpy is None else numpy.array([])
+    if numpy is not None:
+        sums = numpy.concatenate(([0.0], numpy.cumsum(values)))
+        i = numpy.arange(len(values))
+        lo = numpy.maximum(i - window, 0)
+        n = numpy.maximum(i - lo, 1)
+        baseline = (sums[i] - sums[lo]) / n
+        baseline[0] = values[0]
+        return baseline
+    baseline = [values[0]]
+    total = 0.0
+    for i in xrange(1, len(values)):
+        total += values[i - 1]
+        if i > window:
+            total -= values[i - 1 - window]
+        baseline.append(total / min(i, window))
+    return baseline
+
+
+def growth_rate(timestamps, values):
+    """ the slope of the least squares line through the values, in units
+    (kB) per hour, or None with fewer than two timestamps """
+    n = len(values)
+    if n < 2:
+        return None
+    if numpy is not None:
+        t = timestamps - timestamps.mean()
+        v = values - values.mean()
+        tt = numpy.dot(t, t)
+        if not tt:
+            return None
+        return numpy.dot(t, v) / tt * HOUR
+    t_mean = math.fsum(timestamps) / n
+    v_mean = math.fsum(values) / n
+    tv = tt = 0.0
+    for t, v in zip(timestamps, values):
+        t -= t_mean
+        tv += t * (v - v_mean)
+        tt += t * t
+    if not tt:
+        return None
+    return tv / tt * HOUR
+
+
+def _percentile(sorted_values, p):
+    """ the @p th percentile of @sorted_values, interpolated linearly like
+    numpy.percentile() does """
+    position = (len(sorted_values) - 1) * p / 100.0
+    lo = int(position)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    fraction = position - lo
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * \
+           fraction
+
+
+def percentile_bands(timestamps, values, buckets=100,
+                     percentiles=(5, 50, 95)):
+    """ split the values into @buckets of (nearly) the same number of
+    values and return a row per bucket: its first timestamp followed by
+    each of @percentiles of its values """
+    n = len(values)
+    buckets = min(buckets, n)
+    rows = []
+    for b in xrange(buckets):
+        start = b * n // buckets
+        end = (b + 1) * n // buckets
+        if numpy is not None:
+            bands = numpy.percentile(values[start:end], percentiles)
+            rows.append((timestamps[start],) + tuple(bands))
+        else:
+            bucket = sorted(values[start:end])
+            rows.append((timestamps[start],) +
+                        tuple([_percentile(bucket, p) for p in percentiles]))
+    return rows
+
+
+def spikes(values, window=60, threshold=4.0):
+    """ the indexes of the values that are more than @threshold standard
+    deviations away from the rolling_baseline() of the @window before
+    them, where the standard deviation is of those differences over all
+    the values """
+    baseline = rolling_baseline(values, window)
+    if numpy is not None:
+        residuals = values - baseline
+        sigma = residuals.std()
+        if not sigma:
+            return []
+        return list(numpy.nonzero(abs(residuals) > threshold * sigma)[0])
+    residuals = [v - b for v, b in zip(values, baseline)]
+    if not residuals:
+        return []
+    mean = math.fsum(residuals) / len(residuals)
+    sigma = math.sqrt(math.fsum([(r - mean) ** 2 for r in residuals]) /
+                      len(residuals))
+    if not sigma:
+        return []
+    limit = threshold * sigma
+    return [i for i, r in enumerate(residuals) if abs(r) > limit]
+
+
+#### The command line handler ##################################################
+
+import CommandLineApp
+
+class analytics_app(CommandLineApp.CommandLineApp):
+    """ print how fast the memory grew in a capture, its percentiles over
+    time and the biggest spikes
+    """
+
+    metric = 'memory'
+    def optionHandler_metric(self, name):
+        """ which memory metric to use: memory (VmSize, the default), rss,
+        swap, rss_anon, rss_file or pss """
+        if name not in METRICS:
+            raise ValueError("Unknown metric %r" % name)
+        self.metric = name
+        return
+
+    window = 60
+    def optionHandler_window(self, n):
+        """ how many readings the baseline spikes are measured against is
+        the mean of (default 60) """
+        self.window = int(n)
+        return
+
+    bands = 10
+    def optionHandler_bands(self, n):
+        """ how many time buckets to print the percentiles of (default
+        10) """
+        self.bands = int(n)
+        return
+
+    def main(self, capture_file):
+        """ Start! """
+        import time
+        timestamps, values = load(capture_file, self.metric)
+        if not len(values):
+            print "No %s readings" % self.metric
+            return 4
+        rate = growth_rate(timestamps, values)
+        if rate is not None:
+            print "%.1f kB/hour" % rate
+        print
+        print "%-20s %10s %10s %10s" % ('from', '5%', 'median', '95%')
+        for row in percentile_bands(timestamps, values, self.bands):
+            print "%-20s %10.0f %10.0f %10.0f" % (
+              time.strftime('%Y/%m/%d %H:%M:%S', time.localtime(row[0])),
+              row[1], row[2], row[3])
+        found = spikes(values, self.window)
+        print
+        print "%d spikes" % len(found)
+        baseline = rolling_baseline(values, self.window)
+        for i in found[:20]:
+            print "%-20s %10d %+10.0f" % (
+              time.strftime('%Y/%m/%d %H:%M:%S',
+                            time.localtime(timestamps[i])),
+              values[i], values[i] - baseline[i])
+        return 0
+
+
+if __name__=='__main__':
+    analytics_app().run()
@@ -0,0 +1,257 @@
+"""
+Work out which URLs grow the memory of the Zope.
+
+Every reading after the first has a delta: its memory minus the memory of
+the reading before it, and that delta is put down to the URL of the
+reading. URLStats adds those up per URL in one pass over the readings and
+only keeps a handful of numbers per distinct URL, so it can be run over
+captures of any size.
+
+That blames whatever request happened to be logged next. With the whole
+log and the memory samples, InFlight instead shares every delta between
+the requests that were running while it happened (see replay.py).
+
+ $ python attribution.py [--top=N] [--metric=rss] /tmp/zope-memory-readings.dat
+"""
+from collections import deque
+
+from record import METRICS, Reading
+
+# the columns of a row in URLStats.rows()
+COLUMNS = ('hits', 'growths', 'total', 'mean', 'max', 'net')
+
+# what each URL's list in URLStats.stats holds
+_HITS, _GROWTHS, _TOTAL, _MAX, _NET = range(5)
+
+
+class URLStats(object):
+    """ per URL id: how many hits, how many of those grew the memory, by how
+    much in total and on average, the biggest single delta and the net
+    delta. @metric is the name of the memory metric to use, one of
+    record.METRICS.
+
+    The delta of a reading is against the reading before it of the same
+    Zope instance.
+    """
+
+    def __init__(self, metric='memory'):
+        self.metric = metric
+        # where the metric is in a record.Reading
+        self.index = Reading._fields.index(metric)
+        self.stats = {}
+        # the last value of the metric per instance
+        self.prev = {}
+
+    def add(self, reading):
+        """ account for the record.Reading @reading """
+        value = reading[self.index]
+        if value is None:
+            return
+        # called for every reading of a report: the URL's stats are looked
+        # up inline and the instance by index rather than by name
+        try:
+            s = self.stats[reading[0]]
+        except KeyError:
+            s = self._stats(reading[0])
+        s[_HITS] += 1
+        instance = reading[-1]
+        prev = self.prev.get(instance)
+        self.prev[instance] = value
+        if prev is not None:
+            self._delta(s, value - prev)
+
+    def _stats(self, url):
+        try:
+            return self.stats[url]
+        except KeyError:
+            s = self.stats[url] = [0, 0, 0, None, 0]
+            return s
+
+    def add_hit(self, url):
+        """ count a hit on @url without a delta """
+        self._stats(url)[_HITS] += 1
+
+    def add_delta(self, url, delta):
+        """ put the memory delta @delta down to @url """
+        self._delta(self._stats(url), delta)
+
+    def _delta(self, s, delta):
+        if delta > 0:
+            s[_GROWTHS] += 1
+            s[_TOTAL] += delta
+        if s[_MAX] is None or delta > s[_MAX]:
+            s[_MAX] = delta
+        s[_NET] += delta
+
+    def add_all(self, readings):
+        for reading in readings:
+            self.add(reading)
+        return self
+
+    def rows(self):
+        """ return a list of (url id, hits, growths, total, mean, max, net)
+        where mean is the average of the deltas that grew the memory """
+        rows = []
+        for url, (hits, growths, total, max_, net) in self.stats.iteritems():
+            if growths:
+                mean = float(total) / growths
+            else:
+                mean = 0.0
+            rows.append((url, hits, growths, total, mean, max_, net))
+        return rows
+
+    def top(self, n=20, key='total'):
+        """ the @n rows() with the biggest @key (one of COLUMNS) """
+        i = COLUMNS.index(key) + 1
+        rows = self.rows()
+        rows.sort(key=lambda row: (row[i], -row[0]), reverse=True)
+        return rows[:n]
+
+
+class InFlight(object):
+    """ share every memory delta between the requests in flight while it
+    happened, in proportion to how long each of them was running between
+    the two samples, and add the shares up in self.stats (a URLStats).
+
+    Requests are added with add_request() as they're logged, i.e. as they
+    finish, and the samples with add_sample(), both in time order. A
+    delta is only shared out once no request still to be logged can
+    overlap it, which is @max_duration seconds after it. Deltas while
+    nothing was in flight add up in self.unattributed.
+    """
+
+    def __init__(self, max_duration=60.0, stats=None):
+        self.max_duration = max_duration
+        if stats is None:
+            stats = URLStats()
+        self.stats = stats
+        self.unattributed = 0
+        # (start, end, url id) of the requests that may still overlap a
+        # delta not shared out yet, in the order they were added
+        self.requests = deque()
+        # (start, end, delta) of the deltas not shared out yet
+        self.deltas = deque()
+        self.prev = None
+        # the latest end of a request seen
+        self.watermark = None
+
+    def add_request(self, url, start, end):
+        """ add a request for the URL id @url that was running from @start
+        to @end. Log timestamps are only to the second, so a request is
+        taken to last at least a second. """
+        self.stats.add_hit(url)
+        end = max(end, start + 1)
+        self.requests.append((start, end, url))
+        if self.watermark is None or end > self.watermark:
+            self.watermark = end
+        until = self.watermark - self.max_duration
+        self._share(until)
+        # the deltas still to share out, and those still to come, start
+        # after the oldest one waiting or the last sample
+        if self.deltas:
+            until = min(until, self.deltas[0][0])
+        elif self.prev is not None:
+            until = min(until, self.prev[0])
+        self._prune(until)
+
+    def add_sample(self, timestamp, value):
+        """ add a memory sample of @value taken at @timestamp """
+        if value is None:
+            return
+        if self.prev is not None:
+            prev_timestamp, prev_value = self.prev
+            if value != prev_value:
+                self.deltas.append((prev_timestamp, timestamp,
+                                    value - prev_value))
+        self.prev = timestamp, value
+
+    def _share(self, until):
+        """ share out the deltas that ended by @until """
+        deltas = self.deltas
+        while deltas and deltas[0][1] <= until:
+            start, end, delta = deltas.popleft()
+            # requests that ended before this delta can't overlap any
+            # later one either
+            self._prune(start)
+            overlaps = []
+            total = 0.0
+            for r_start, r_end, url in self.requests:
+                overlap = min(r_end, end) - max(r_start, start)
+                if overlap > 0:
+                    overlaps.append((url, overlap))
+                    total += overlap
+            if not overlaps:
+                self.unattributed += delta
+                continue
+            for url, overlap in overlaps:
+                self.stats.add_delta(url, delta * overlap / total)
+
+    def _prune(self, until):
+        """ forget the requests from the oldest on that ended by @until """
+        requests = self.requests
+        while requests and requests[0][1] <= until:
+            requests.popleft()
+
+    def flush(self):
+        """ share out all the deltas, once there are no more requests """
+        self._share(float('inf'))
+        return self
+
+
+def print_top(stats, urls, n=20, key='total'):
+    """ print the top @n rows of the URLStats @stats, the URLs of which
+    are in @urls """
+    from urltable import uri_of
+    print "%8s %8s %10s %10s %10s %10s  %s" % (
+      'hits', 'growths', 'total', 'mean', 'max', 'net', 'URI')
+    for row in stats.top(n, key):
+        url, hits, growths, total, mean, max_, net = row
+        if isinstance(max_, float):
+            max_ = '%.1f' % max_
+        print "%8d %8d %10d %10.1f %10s %10d  %s" % (
+          hits, growths, total, mean, max_, net, uri_of(urls[url]))
+
+
+#### The command line handler ##################################################
+
+import CommandLineApp
+
+class attribution_app(CommandLineApp.CommandLineApp):
+    """ print the URLs that grew the memory the most in a capture
+    """
+
+    top = 20
+    def optionHandler_top(self, n):
+        """ how many URLs to show (default 20) """
+        self.top = int(n)
+        return
+
+    metric = 'memory'
+    def optionHandler_metric(self, name):
+        """ which memory metric to use: memory (VmSize, the default), rss,
+        swap, rss_anon, rss_file or pss """
+        if name not in METRICS:
+            raise ValueError("Unknown metric %r" % name)
+        self.metric = name
+        return
+
+    sort = 'total'
+    def optionHandler_sort(self, column):
+        """ what to sort by: hits, growths, total (the default), mean, max
+        or net """
+        if column not in COLUMNS:
+            raise ValueError("Can't sort by %r" % column)
+        self.sort = column
+        return
+
+    def main(self, capture_file):
+        """ Start! """
+        from generate_graph import iter_readings
+        readings, urls, instances = iter_readings(capture_file)
+        stats = URLStats(self.metric).add_all(readings)
+        print_top(stats, urls, self.top, self.sort)
+        return 0
+
+
+if __name__=='__main__':
+    attribution_app().run()
@@ -0,0 +1,60 @@
+"""
+How long analytics.py takes over a lot of readings, with and without
+NumPy.
+
+ $ python bench_analytics.py [readings]
+
+Times each of the statistics on the VmSize of synthetic readings (10
+million by default) in plain Python and, if it's installed, with NumPy.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, '..')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import analytics
+from synthetic import readings
+
+
+def run(timestamps, values):
+    """ the seconds each statistic takes, by name """
+    times = []
+    for name, func in (
+      ('deltas', lambda: analytics.deltas(values)),
+      ('rolling_baseline', lambda: analytics.rolling_baseline(values, 60)),
+      ('growth_rate', lambda: analytics.growth_rate(timestamps, values)),
+      ('percentile_bands', lambda: analytics.percentile_bands(timestamps,
+                                                              values)),
+      ('spikes', lambda: analytics.spikes(values, 60))):
+        t0 = time.time()
+        func()
+        times.append((name, time.time() - t0))
+    return times
+
+
+def main(n=10000000):
+    n = int(n)
+    timestamps = []
+    values = []
+    for reading in readings(n):
+        timestamps.append(reading[2])
+        values.append(float(reading[1]))
+    numpy = analytics.numpy
+    analytics.numpy = None
+    python = run(timestamps, values)
+    analytics.numpy = numpy
+    if numpy is None:
+        print "NumPy isn't installed, plain Python only"
+        for name, seconds in python:
+            print "%-18s %8.2f s" % (name, seconds)
+        return
+    vectorised = run(numpy.array(timestamps), numpy.array(values))
+    print "%-18s %10s %10s" % ('', 'Python', 'NumPy')
+    for (name, slow), (name, fast) in zip(python, vectorised):
+        print "%-18s %8.2f s %8.3f s %6.0fx" % (name, slow, fast,
+                                                 slow / max(fast, 1e-6))
+
+
+if __name__=='__main__':
+    main(*sys.argv[1:])
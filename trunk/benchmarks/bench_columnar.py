@@ -0,0 +1,79 @@
+"""
+Time and peak RSS of opening a big columnar capture and making a report
+of an hour of it.
+
+ $ python bench_columnar.py [readings]
+
+Writes synthetic readings (10 a second) to a columnar file, then in a
+fresh process opens it, finds the min and max VmSize of the lot and
+generates a report of the last hour.
+"""
+import os
+import sys
+import time
+import shutil
+import resource
+import tempfile
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+
+
+def _rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def child(filename):
+    from columnar import ColumnarCapture
+    from generate_graph import generate
+    t0 = time.time()
+    capture = ColumnarCapture(filename)
+    print "open:           %8.3f ms  peak RSS %.1f MB" % (
+      (time.time() - t0) * 1000, _rss())
+    t0 = time.time()
+    last = capture.timestamp(len(capture) - 1)
+    start, end = capture.time_range(last - 3600, last)
+    print "find last hour: %8.3f ms  (%d readings)" % (
+      (time.time() - t0) * 1000, end - start)
+    t0 = time.time()
+    lo, hi = capture.min_max('memory')
+    print "min/max VmSize: %8.3f s   peak RSS %.1f MB" % (
+      time.time() - t0, _rss())
+    t0 = time.time()
+    sys.stdout = open(os.devnull, 'w')
+    report = generate(filename, last - 3600, last)
+    sys.stdout = sys.__stdout__
+    print "report of hour: %8.3f s   peak RSS %.1f MB" % (
+      time.time() - t0, _rss())
+    shutil.rmtree(os.path.dirname(report))
+
+
+def main(n=10000000):
+    n = int(n)
+    from synthetic import readings
+    from columnar import write_columnar
+    from urltable import URLTable
+    workdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(workdir, 'readings.zmcc')
+        urls = URLTable()
+        def interned():
+            for reading in readings(n):
+                yield reading._replace(url=urls.intern(reading[0]))
+        t0 = time.time()
+        write_columnar(filename, interned(), urls.urls)
+        print "%d readings, %.1f MB, written in %.1f s" % (
+          n, os.path.getsize(filename) / 1024.0 / 1024, time.time() - t0)
+        subprocess.call([sys.executable, os.path.abspath(__file__),
+                         '--child', filename], cwd=workdir)
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__=='__main__':
+    if sys.argv[1:2] == ['--child']:
+        child(*sys.argv[2:])
+    else:
+        main(*sys.argv[1:])
@@ -0,0 +1,62 @@
+"""
+Time and peak RSS of comparing two captures, to show the memory used
+doesn't grow with their size.
+
+ $ python bench_compare.py [readings]...
+
+For each number of readings writes two synthetic captures of that many,
+the second with a different seed, then compares them in a fresh process.
+"""
+import os
+import sys
+import time
+import shutil
+import resource
+import tempfile
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+
+
+def _rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def child(before, after, n):
+    from compare import compare, changes
+    t0 = time.time()
+    sides = compare(before, after)
+    rows = changes(sides)
+    elapsed = time.time() - t0
+    print "%9s readings each: %7.2f s  %8.0f readings/s  peak RSS %.1f MB" % (
+      n, elapsed, (sides[0].count + sides[1].count) / elapsed, _rss())
+
+
+def main(*sizes):
+    from synthetic import readings
+    from capture import CaptureWriter
+    sizes = [int(n) for n in sizes] or [10000, 100000, 1000000]
+    workdir = tempfile.mkdtemp()
+    try:
+        for n in sizes:
+            names = []
+            for seed in (0, 1):
+                filename = os.path.join(workdir, 'readings%d.dat' % seed)
+                writer = CaptureWriter(filename)
+                for reading in readings(n, seed=seed):
+                    writer.write(reading)
+                writer.close()
+                names.append(filename)
+            subprocess.call([sys.executable, os.path.abspath(__file__),
+                             '--child'] + names + [str(n)])
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__=='__main__':
+    if sys.argv[1:2] == ['--child']:
+        child(*sys.argv[2:])
+    else:
+        main(*sys.argv[1:])
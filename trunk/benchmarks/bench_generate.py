@@ -0,0 +1,159 @@
+"""
+Peak RSS and time taken to generate a report.
+
+ $ python bench_generate.py [readings]
+
+Runs the report generation of version 1.1 (marshal.load, one big string
+substituted into the template) and the current streaming one, each in a
+fresh process, on the same synthetic readings.
+"""
+import os
+import sys
+import time
+import shutil
+import marshal
+import resource
+import tempfile
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+
+# template.html as it was in 1.1, the current one doesn't take the data
+TEMPLATE_1_1 = """\
+<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01 Transitional//EN" "http://www.w3.org/TR/html4/loose.dtd">
+<html>
+ <head>
+    <meta http-equiv="Content-Type" content="text/html; charset=utf-8">
+    <title>{{title}}</title>
+    <link href="../layout.css" rel="stylesheet" type="text/css" /> 
+    <!--[if IE]><script language="javascript" type="text/javascript" src="../flot/excanvas.pack.js"></script><![endif]-->
+    <script language="javascript" type="text/javascript" src="../jquery.js"></script>
+    
+    
+
+ </head>
+    <body>
+    <h1>{{title}}</h1>
+
+    <div id="placeholder" style="width:900px;height:350px;"></div>
+
+    <p>Memory usage over time. Select an area with the mouse on the big plot and it will show what URLs were hit at that point.</p>
+      
+    <table id="urls" cellpadding="1" cellspacing="0">
+    </table>
+      
+
+    <!--
+    Commented out until this is solved
+    http://groups.google.com/group/flot-graphs/browse_thread/thread/10a7eee60fd25d32
+    <div id="overview" style="margin-left:50px;margin-top:20px;width:400px;height:50px"></div>
+    -->
+
+
+
+<p><a href="." onclick="resetPlotSelection();return false;">Reset zoom</a></p>
+<!--
+<form action="#">
+<input type="button" value="Reset zoom" onclick="resetPlotSelection()" />
+</form>
+-->
+
+
+
+<script id="source" language="javascript" type="text/javascript">
+var plot;
+var overview;
+var d = {{data_array}};
+var max_value = {{max_value}};
+var min_value = {{min_value}};
+</script>
+<script language="javascript" type="text/javascript" src="../flot/jquery.flot.js"></script>
+<script language="javascript" type="text/javascript" src="../flotter.js"></script>
+
+
+ </body>
+</html>
+"""
+
+
+def generate_1_1(marshal_file):
+    """ how generate_graph.generate() worked in 1.1 """
+    from generate_graph import _generate_title, _title2foldername
+    readings = marshal.load(open(marshal_file, 'rb'))
+    html = TEMPLATE_1_1
+    d = []
+    first_timestamp = readings[0][2]
+    last_timestamp = readings[-1][2]
+    min_memory = None
+    max_memory = 0
+    for (method, uri), memory, timestamp in readings:
+        timestamp = round(timestamp, 2)
+        d.append("[%s,%s,'%s']" % (timestamp, memory, uri))
+        if min_memory is None:
+            min_memory = memory
+        elif memory < min_memory:
+            min_memory = memory
+        if memory > max_memory:
+            max_memory = memory
+    html = html.replace('{{max_value}}', str(max_memory))
+    html = html.replace('{{min_value}}', str(min_memory))
+    html = html.replace('{{data_array}}', '[%s]' % ', '.join([str(x) for x in d]))
+    title = _generate_title(first_timestamp, last_timestamp)
+    html = html.replace('{{title}}', title)
+    save_dir = _title2foldername(title)
+    if not os.path.isdir(save_dir):
+        os.mkdir(save_dir)
+    open(os.path.join(save_dir, 'index.html'),'w').write(html)
+    return os.path.join(save_dir, 'index.html')
+
+
+def child(which, filename):
+    """ run in a fresh process: generate and print seconds and peak RSS """
+    t0 = time.time()
+    if which == 'old':
+        report = generate_1_1(filename)
+    else:
+        from generate_graph import generate
+        sys.stdout = open(os.devnull, 'w')
+        report = generate(filename)
+        sys.stdout = sys.__stdout__
+    seconds = time.time() - t0
+    shutil.rmtree(os.path.dirname(report))
+    print seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main(n=1000000):
+    n = int(n)
+    from synthetic import readings
+    from capture import CaptureWriter
+    workdir = tempfile.mkdtemp()
+    try:
+        marshal_file = os.path.join(workdir, 'readings.marshal')
+        capture_file = os.path.join(workdir, 'readings.dat')
+        marshal.dump([(r[0], r[1], r[2]) for r in readings(n)],
+                     open(marshal_file, 'wb'))
+        writer = CaptureWriter(capture_file)
+        for reading in readings(n):
+            writer.write(reading)
+        writer.close()
+
+        print "%d readings" % n
+        for which, filename in (('old', marshal_file), ('new', capture_file)):
+            out = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                                    '--child', which, filename],
+                                   cwd=workdir, stdout=subprocess.PIPE
+                                   ).communicate()[0]
+            seconds, maxrss = out.split()
+            print "%s: %.2f seconds, peak RSS %.1f MB" % (
+              which, float(seconds), int(maxrss) / 1024.0)
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__=='__main__':
+    if sys.argv[1:2] == ['--child']:
+        child(*sys.argv[2:])
+    else:
+        main(*sys.argv[1:])
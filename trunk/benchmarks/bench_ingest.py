@@ -0,0 +1,62 @@
+"""
+How does ingest.py scale with the number of workers?
+
+ $ python bench_ingest.py [lines] [max workers]
+
+Writes a synthetic Z2.log, plain and gzipped, and times ingest() with 1
+up to max workers (default one per CPU). The result has to be the same
+every time.
+"""
+import os
+import sys
+import time
+import gzip
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, '..')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ingest import ingest
+from synthetic import write_log_file
+
+
+def main(lines=2000000, max_workers=None):
+    lines = int(lines)
+    if max_workers is None:
+        max_workers = multiprocessing.cpu_count()
+    max_workers = int(max_workers)
+    directory = tempfile.mkdtemp()
+    try:
+        # two files, the older one gzipped
+        plain = os.path.join(directory, 'Z2.log')
+        write_log_file(plain, lines // 2, t0=1212143496.0 + lines)
+        older = os.path.join(directory, 'Z2.log.1')
+        write_log_file(older, lines // 2, seed=1)
+        g = gzip.open(older + '.gz', 'wb')
+        g.write(open(older).read())
+        g.close()
+        os.remove(older)
+        filenames = [plain, older + '.gz']
+
+        expected = None
+        for workers in xrange(1, max_workers + 1):
+            t0 = time.time()
+            result = ingest(filenames, workers=workers,
+                            chunk_bytes=16 * 1024 * 1024)
+            took = time.time() - t0
+            urls, totals = result
+            if expected is None:
+                expected = urls.urls, totals
+                base = took
+            elif (urls.urls, totals) != expected:
+                print "%d workers got a different result!" % workers
+            print "%2d workers %10.0f lines/sec  %5.2fx" % (
+              workers, lines / took, base / took)
+    finally:
+        for filename in os.listdir(directory):
+            os.remove(os.path.join(directory, filename))
+        os.rmdir(directory)
+
+
+if __name__=='__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,104 @@
+"""
+How long does leaks.py take to notice a leak, and what does it cost per
+reading?
+
+ $ python bench_leaks.py [readings per second] [threshold kB/hour]
+
+Replays synthetic readings: two hours of noisy but flat memory, then two
+hours of a leak. The leak is either steady growth at a few rates or one
+URL that grows the memory a little every hit. Prints how long after the
+start of the leak each kind of alert came, and the false alarms: any
+alert before it, or a 'url' one about another URL.
+
+Fails if there were false alarms, or if no 'url' alert came for a URL
+leaking faster than the threshold.
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, '..')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from leaks import LeakDetector
+from record import Reading
+from urltable import URLTable
+
+HOUR = 3600
+
+
+def replay(rate, threshold, kb_per_hour=0, leaky_kb=0, estimator='regression',
+           seed=0):
+    """ return ({kind: seconds after the leak started to the first alert},
+    false alarms, microseconds per reading) """
+    urls = URLTable()
+    detector = LeakDetector(urls, threshold, estimator=estimator)
+    r = random.Random(seed)
+    ids = [urls.intern(('GET', '/site/page%d' % i)) for i in range(300)]
+    leaky = ids[7]
+    leaky_uri = '/site/page7'
+    start = 2 * HOUR
+    memory = 100000.0
+    first = {}
+    false_alarms = 0
+    n = int(4 * HOUR * rate)
+    t0 = time.time()
+    for i in xrange(n):
+        t = i / float(rate)
+        url = ids[r.randint(0, 299)]
+        if t >= start:
+            memory += kb_per_hour / 3600.0 / rate
+            if url == leaky:
+                memory += leaky_kb
+        # and a garbage collector's worth of noise around that
+        reading = Reading(url, int(memory + r.gauss(0, 200)), t, None, None,
+                          None, None, None, 0)
+        for alert in detector.add(reading):
+            if t < start or \
+               alert.kind == 'url' and alert.url != leaky_uri:
+                false_alarms += 1
+            elif alert.kind not in first:
+                first[alert.kind] = t - start
+    return first, false_alarms, (time.time() - t0) * 1e6 / n
+
+
+def main(rate=10, threshold=1024):
+    rate = float(rate)
+    threshold = float(threshold)
+    print "%.0f readings/sec, threshold %.0f kB/hour" % (rate, threshold)
+    print "%-28s %9s %9s %9s %6s %8s" % ('leak', 'growth', 'cusum', 'url',
+                                          'false', 'us/read')
+    failed = [0]
+    def show(name, result):
+        first, false_alarms, cost = result
+        if false_alarms:
+            failed[0] = 1
+        cells = []
+        for kind in ('growth', 'cusum', 'url'):
+            if kind in first:
+                cells.append('%7.1fm' % (first[kind] / 60.0))
+            else:
+                cells.append('-')
+        print "%-28s %9s %9s %9s %6d %8.1f" % ((name,) + tuple(cells) +
+                                               (false_alarms, cost))
+    show('none', replay(rate, threshold))
+    for multiple in (1, 2, 4, 16):
+        kb = threshold * multiple
+        show('%.0f kB/hour' % kb, replay(rate, threshold, kb_per_hour=kb))
+        show('%.0f kB/hour (Theil-Sen)' % kb,
+             replay(rate, threshold, kb_per_hour=kb, estimator='theil-sen'))
+    # the leaky URL is one of 300 picked at random
+    hits_per_hour = rate * HOUR / 300
+    for kb in (5, 20, 50):
+        result = replay(rate, threshold, leaky_kb=kb)
+        show('%d kB a hit on one URL' % kb, result)
+        if kb * hits_per_hour > threshold and 'url' not in result[0]:
+            print "NO URL ALERT for %.0f kB/hour" % (kb * hits_per_hour)
+            failed[0] = 1
+    if failed[0]:
+        print "FALSE ALARMS OR MISSED LEAKS"
+    return failed[0]
+
+
+if __name__=='__main__':
+    sys.exit(main(*sys.argv[1:]))
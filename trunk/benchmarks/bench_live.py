@@ -0,0 +1,118 @@
+"""
+Does the live server stay flat however long it runs?
+
+ $ python bench_live.py [readings] [readings per second]
+
+Feeds synthetic readings to a LiveFeed at a steady pace (by default ten
+times RECENT_ROWS of them, 5000 a second) with a browser-like client
+following the event stream. Prints the time per reading, the RSS of the
+process and what the client has been sent every tenth of the way, then
+waits for the last batch to reach the client.
+
+Fails if the client didn't get every reading, or if the RSS still grew
+once the RECENT_ROWS buffer was full: it's compared between the first
+tenth after twice RECENT_ROWS readings and the end.
+"""
+import os
+import sys
+import time
+import socket
+import threading
+
+sys.path.insert(0, '..')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from live import LiveFeed, LiveServer, RECENT_ROWS, BATCH_INTERVAL
+from urltable import URLTable
+from synthetic import readings
+
+# how much the RSS may still grow once the buffer is full, in MB
+RSS_SLACK = 2.0
+# readings are added in bursts this often, in seconds
+TICK = 0.1
+
+
+def _rss():
+    for line in open('/proc/self/status'):
+        if line.startswith('VmRSS:'):
+            return int(line.split()[1]) / 1024.0
+
+
+def follow(address, received):
+    """ read the event stream like a browser would. @received is
+    [bytes, the id of the last event] """
+    s = socket.create_connection(address)
+    s.sendall('GET /live/events?since=0 HTTP/1.0\r\n\r\n')
+    rest = ''
+    while 1:
+        data = s.recv(65536)
+        if not data:
+            break
+        received[0] += len(data)
+        lines = (rest + data).split('\n')
+        rest = lines.pop()
+        for line in lines:
+            if line.startswith('id: '):
+                received[1] = int(line[4:])
+
+
+def main(n=10 * RECENT_ROWS, rate=5000):
+    n = int(n)
+    rate = float(rate)
+    urls = URLTable()
+    feed = LiveFeed(urls)
+    server = LiveServer(feed, 0).start()
+    received = [0, 0]
+    client = threading.Thread(target=follow,
+                              args=(server.server_address, received))
+    client.setDaemon(True)
+    client.start()
+    full_rss = None
+    try:
+        step = max(1, n // 10)
+        per_tick = max(1, int(rate * TICK))
+        start = time.time()
+        adding = 0.0
+        for i, reading in enumerate(readings(n)):
+            if not i % per_tick:
+                # keep to the pace whatever the adding took
+                delay = start + i / rate - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            t0 = time.time()
+            feed.add(reading._replace(url=urls.intern(reading[0])))
+            adding += time.time() - t0
+            if not (i + 1) % step:
+                rss = _rss()
+                if full_rss is None and i + 1 >= 2 * RECENT_ROWS:
+                    full_rss = rss
+                print "%9d readings %6.1f us/reading  RSS %6.1f MB  " \
+                      "%6.1f MB sent" % (i + 1, adding * 1e6 / step, rss,
+                                         received[0] / 1048576.0)
+                adding = 0.0
+        # the last batch goes out within BATCH_INTERVAL or so
+        deadline = time.time() + 20 * BATCH_INTERVAL
+        while received[1] < n and time.time() < deadline:
+            time.sleep(BATCH_INTERVAL / 5)
+        rss = _rss()
+    finally:
+        server.stop()
+    print "client got %.1f MB, up to reading %d of %d" % (
+      received[0] / 1048576.0, received[1], n)
+    failed = 0
+    if not received[0] or received[1] != n:
+        print "CLIENT MISSED READINGS"
+        failed = 1
+    if full_rss is None:
+        print "not enough readings to fill the buffer twice"
+        failed = 1
+    else:
+        print "RSS grew %.1f MB once the buffer was full (%.1f allowed)" % (
+          rss - full_rss, RSS_SLACK)
+        if rss - full_rss > RSS_SLACK:
+            print "RSS STILL GROWING"
+            failed = 1
+    return failed
+
+
+if __name__=='__main__':
+    sys.exit(main(*sys.argv[1:]))
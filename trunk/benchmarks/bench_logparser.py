@@ -0,0 +1,76 @@
+"""
+How many Z2.log lines a second can we parse?
+
+ $ python bench_logparser.py [lines]
+
+Writes a synthetic log of that many lines (10 million by default, about
+1.3GB) and reads it back with the regular expression get_url() used to
+use, logparser.request_of() and logparser.parse_line(), once for the
+lines of the file and once for the lines of each block the way replay.py
+and ingest.py read the log.
+"""
+import os
+import re
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, '..')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from logparser import parse_line, request_of
+from replay import _lines
+from synthetic import write_log_file
+
+# what get_readings.get_url() was up to 1.1
+old_url_regex = re.compile(r'"(GET|POST) (.*?) HTTP', re.DOTALL)
+def old_get_url(logline):
+    try:
+        return old_url_regex.findall(logline)[0]
+    except IndexError:
+        return repr(logline)
+
+
+def per_line(func):
+    def run(filename):
+        count = 0
+        for line in open(filename):
+            func(line)
+            count += 1
+        return count
+    return run
+
+
+def in_blocks(filename):
+    count = 0
+    f = open(filename, 'rb')
+    for line in _lines(f):
+        parse_line(line)
+        count += 1
+    f.close()
+    return count
+
+
+def main(lines=10 * 1000 * 1000):
+    lines = int(lines)
+    fd, filename = tempfile.mkstemp(suffix='Z2.log')
+    os.close(fd)
+    try:
+        t0 = time.time()
+        write_log_file(filename, lines)
+        print "wrote %d lines (%d MB) in %.1fs" % (
+          lines, os.path.getsize(filename) >> 20, time.time() - t0)
+        for name, func in (('old get_url()', per_line(old_get_url)),
+                           ('request_of()', per_line(request_of)),
+                           ('parse_line()', per_line(parse_line)),
+                           ('parse_line() blocks', in_blocks)):
+            t0 = time.time()
+            count = func(filename)
+            seconds = time.time() - t0
+            print "%-20s %10.0f lines/sec (%d in %.1fs)" % (
+              name, lines / seconds, count, seconds)
+    finally:
+        os.remove(filename)
+
+
+if __name__=='__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,76 @@
+"""
+What does probe.py cost the Zope it's in?
+
+ $ python bench_probe.py [objects] [requests per second]
+
+Times a snapshot with and without the type census in a process with
+that many objects for gc to track, and what that comes to per request at
+the default interval (a snapshot a second, a census every minute) when
+the Zope serves that many requests a second. Fails if it's over
+REQUEST_BUDGET.
+"""
+import sys
+import time
+
+sys.path.insert(0, '..')
+from probe import Probe, ProbeListener, BUDGET
+
+# what the probe may cost per request, in seconds
+REQUEST_BUDGET = 20e-6
+
+ADDRESS = '/tmp/bench-probe.sock'
+
+
+class _Cache(object):
+    """ looks like a ZODB.DB to the probe """
+    def cacheDetailSize(self):
+        return [{'connection': 'c%d' % i, 'ngsize': 4000, 'size': 10000}
+                for i in range(4)]
+
+
+def best_of(f, repeat=5):
+    best = None
+    for i in range(repeat):
+        t0 = time.time()
+        f()
+        elapsed = time.time() - t0
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main(objects=300000, rate=50):
+    heap = [[i] for i in xrange(objects)]
+    listener = ProbeListener(ADDRESS)
+    probe = Probe(ADDRESS, db=_Cache())
+    try:
+        def plain():
+            probe.count = 1
+            assert probe.send(probe.snapshot())
+        def census():
+            probe.count = 0
+            assert probe.send(probe.snapshot())
+        # the socket only queues a few, receive as get_readings.py would
+        plain_s = best_of(lambda: plain() or listener.receive(), 50)
+        census_s = best_of(lambda: census() or listener.receive())
+    finally:
+        listener.close()
+        probe.socket.close()
+    per_second = plain_s / probe.interval + \
+                 census_s / (probe.interval * probe.census_every)
+    per_request = per_second / rate
+    print "%d objects tracked by gc" % len(heap)
+    print "snapshot          %8.1f us" % (plain_s * 1e6)
+    print "with census       %8.1f us" % (census_s * 1e6)
+    print "per second        %8.1f us (%.3f%% of a CPU, budget %.3f%%)" % (
+      per_second * 1e6, per_second * 100, BUDGET * 100)
+    print "per request       %8.1f us at %d requests/s (budget %.1f us)" % (
+      per_request * 1e6, rate, REQUEST_BUDGET * 1e6)
+    if per_request > REQUEST_BUDGET:
+        print "OVER BUDGET"
+        return 1
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main(*[int(x) for x in sys.argv[1:]]))
@@ -0,0 +1,76 @@
+"""
+How many Z2.log lines per second can replay.py join with a memory
+timeline?
+
+ $ python bench_replay.py [lines] [requests per second]
+
+Writes a synthetic log, plain and gzipped, with a memory sample every
+second and times iter_log() on its own and the whole replay().
+"""
+import os
+import sys
+import time
+import gzip
+import random
+import tempfile
+
+sys.path.insert(0, '..')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from replay import iter_log, replay
+from synthetic import z2_log_line
+
+
+def write_logs(directory, lines, rate):
+    t0 = 1212143496.0
+    plain = os.path.join(directory, 'Z2.log')
+    f = open(plain, 'w')
+    r = random.Random(0)
+    for i in xrange(lines):
+        f.write(z2_log_line('/site/page%d' % r.randint(0, 299), 
+                            t0 + i / float(rate)))
+    f.close()
+    gzipped = plain + '.1.gz'
+    g = gzip.open(gzipped, 'wb')
+    g.write(open(plain).read())
+    g.close()
+    
+    memory = 100000
+    timeline = []
+    for second in xrange(int(lines / rate) + 2):
+        memory = max(50000, memory + r.randint(-40, 44))
+        timeline.append((t0 + second, (memory, memory - 20000, None, None,
+                                       None, None)))
+    return plain, gzipped, timeline
+
+
+def lines_per_second(func, lines):
+    t0 = time.time()
+    func()
+    return lines / (time.time() - t0)
+
+
+def main(lines=500000, rate=200):
+    lines = int(lines)
+    rate = float(rate)
+    directory = tempfile.mkdtemp()
+    try:
+        plain, gzipped, timeline = write_logs(directory, lines, rate)
+        for name, filename in (('plain', plain), ('gzip', gzipped)):
+            def scan():
+                for x in iter_log([filename]):
+                    pass
+            def join():
+                for x in replay([filename], timeline):
+                    pass
+            print "%-6s iter_log() %10.0f lines/sec" % (
+              name, lines_per_second(scan, lines))
+            print "%-6s replay()   %10.0f lines/sec" % (
+              name, lines_per_second(join, lines))
+    finally:
+        for filename in os.listdir(directory):
+            os.remove(os.path.join(directory, filename))
+        os.rmdir(directory)
+
+
+if __name__=='__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,44 @@
+"""
+How many memory samples per second can we take of a process?
+
+ $ python bench_sampler.py [seconds] [pid]
+
+Compares get_readings.get_mem_size() with sampler.ProcSampler reading
+/proc/<pid>/status and /proc/<pid>/statm.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, '..')
+from get_readings import get_mem_size
+from sampler import ProcSampler
+
+
+def rate(func, seconds):
+    count = 0
+    t0 = time.time()
+    end = t0 + seconds
+    while time.time() < end:
+        for i in xrange(100):
+            func()
+        count += 100
+    return count / (time.time() - t0)
+
+
+def main(seconds=2, pid=None):
+    seconds = float(seconds)
+    if pid is None:
+        pid = os.getpid()
+    status = ProcSampler(pid, 'status')
+    statm = ProcSampler(pid, 'statm')
+    old = rate(lambda: int(get_mem_size(pid)), seconds)
+    print "%-24s %10.0f samples/sec" % ('get_mem_size()', old)
+    for name, sampler in (('ProcSampler(status)', status),
+                          ('ProcSampler(statm)', statm)):
+        r = rate(sampler.vmsize, seconds)
+        print "%-24s %10.0f samples/sec (%.1fx)" % (name, r, r / old)
+
+
+if __name__=='__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,76 @@
+"""
+How far behind the log does each tailer backend fall, and how much CPU
+does it burn doing it?
+
+ $ python bench_tailer.py [rate] [duration]
+
+A child process appends synthetic Z2.log lines at a fixed rate while this
+process follows the file and measures the lag of every line it gets.
+"""
+import os
+import sys
+import time
+import tempfile
+from multiprocessing import Process
+
+sys.path.insert(0, '..')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from tailer import BACKENDS
+from synthetic import write_log, written_at
+
+
+def bench(backend, rate, duration):
+    fd, filename = tempfile.mkstemp(suffix='Z2.log')
+    os.close(fd)
+    try:
+        tail = BACKENDS[backend](filename)
+        writer = Process(target=write_log, args=(filename, rate, duration))
+        cpu_before = os.times()
+        writer.start()
+        lags = []
+        reads = 0
+        while writer.is_alive() or not lags:
+            lines = tail.read_lines()
+            if lines:
+                reads += 1
+                now = time.time()
+                for line in lines:
+                    lags.append(now - written_at(line))
+            else:
+                tail.wait(1.0)
+        writer.join()
+        for line in tail.read_lines():
+            lags.append(time.time() - written_at(line))
+        cpu_after = os.times()
+        tail.close()
+    finally:
+        os.remove(filename)
+
+    cpu = (cpu_after[0] - cpu_before[0]) + (cpu_after[1] - cpu_before[1])
+    lags.sort()
+    return {
+      'backend': backend,
+      'lines': len(lags),
+      'reads': reads,
+      'lag_mean': sum(lags) / len(lags),
+      'lag_p99': lags[int(len(lags) * 0.99)],
+      'lag_max': lags[-1],
+      'cpu_seconds': cpu,
+      'cpu_percent': 100.0 * cpu / duration,
+    }
+
+
+def main(rate=5000, duration=5):
+    rate = int(rate)
+    duration = float(duration)
+    print "%d lines/sec for %s seconds" % (rate, duration)
+    for backend in sorted(BACKENDS):
+        r = bench(backend, rate, duration)
+        print "%(backend)8s: %(lines)d lines in %(reads)d reads, " \
+              "lag mean %(lag_mean).4fs p99 %(lag_p99).4fs " \
+              "max %(lag_max).4fs, cpu %(cpu_seconds).2fs " \
+              "(%(cpu_percent).1f%%)" % r
+
+
+if __name__=='__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,270 @@
+"""
+The whole pipeline from tailing the log to the report, measured the same
+way every run and written out as JSON so two runs can be compared.
+
+ $ python suite.py [--sizes=3,4,5] [--seconds=N] [--out=results.json]
+ $ python suite.py --compare old.json new.json [--tolerance=0.2]
+
+It measures:
+
+  tail      how far behind a FakeZope's log lines are when read, for
+            each tailer backend, at --rate lines a second
+  sample    memory samples a second of a FakeZope, from status and statm
+  write     capture write throughput at each size
+  report    report generation time and peak RSS at each size
+
+Sizes are powers of ten of readings, 10^3 to 10^5 by default and up to
+10^7 if you have the time. The synthetic readings are the same for the
+same size. Each write and report runs in a fresh process so its peak RSS
+is its own.
+
+--compare prints the change in every number of two results files and
+exits with 1 if any got worse by more than the tolerance (20%) and by
+more than the NOISE of that kind of number.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import getopt
+import platform
+import resource
+import tempfile
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+
+# the version of the layout of the results
+VERSION = 1
+
+# for --compare, which way is better for each kind of number
+LOWER_IS_BETTER = ('seconds', 'lag_p50_ms', 'lag_p99_ms', 'lag_max_ms',
+                   'peak_rss_mb', 'cpu_seconds')
+HIGHER_IS_BETTER = ('readings_per_second', 'samples_per_second')
+# and the differences too small to be anything but noise
+NOISE = {'lag_p50_ms': 2.0, 'lag_p99_ms': 5.0, 'lag_max_ms': 20.0,
+         'cpu_seconds': 0.05, 'seconds': 0.01, 'peak_rss_mb': 1.0}
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def tail_latency(workdir, rate=200, seconds=5.0):
+    """ the lag of the lines of a FakeZope's log when each tailer backend
+    reads them, in ms """
+    from synthetic import FakeZope, written_at
+    from tailer import BACKENDS
+    results = {}
+    for name in sorted(BACKENDS):
+        zope = FakeZope(os.path.join(workdir, 'tail-%s' % name),
+                        pattern='flat', rate=rate)
+        zope.start()
+        try:
+            tail = BACKENDS[name](zope.log_filename)
+            lags = []
+            cpu = sum(os.times()[:2])
+            end = time.time() + seconds
+            while time.time() < end:
+                lines = tail.read_lines()
+                now = time.time()
+                for line in lines:
+                    lags.append(now - written_at(line))
+                if not lines:
+                    tail.wait(1.0)
+            cpu = sum(os.times()[:2]) - cpu
+            tail.close()
+        finally:
+            zope.stop()
+        result = results[name] = {'lines': len(lags), 'cpu_seconds': cpu}
+        if not lags:
+            # too slow a box or too short a run, --compare skips the nulls
+            result.update({'lag_p50_ms': None, 'lag_p99_ms': None,
+                           'lag_max_ms': None,
+                           'note': 'no lines read in %.1f seconds' % seconds})
+            continue
+        result['lag_p50_ms'] = _percentile(lags, 50) * 1000
+        result['lag_p99_ms'] = _percentile(lags, 99) * 1000
+        result['lag_max_ms'] = max(lags) * 1000
+    return results
+
+
+def sample_rate(workdir, seconds=2.0):
+    """ how many memory samples a second can be taken of a FakeZope whose
+    memory moves, from each /proc file """
+    from synthetic import FakeZope
+    from sampler import ProcSampler
+    zope = FakeZope(os.path.join(workdir, 'sample'), pattern='sawtooth',
+                    rate=10)
+    zope.start()
+    results = {}
+    try:
+        time.sleep(0.2)
+        for source in ('status', 'statm'):
+            sampler = ProcSampler(zope.pid, source)
+            count = 0
+            t0 = time.time()
+            end = t0 + seconds
+            while time.time() < end:
+                for i in xrange(100):
+                    sampler.sample()
+                count += 100
+            results[source] = {'samples_per_second':
+                               count / (time.time() - t0)}
+            sampler.close()
+    finally:
+        zope.stop()
+    return results
+
+
+def child_write(filename, n):
+    """ write @n synthetic readings to the capture @filename """
+    from synthetic import readings
+    from capture import CaptureWriter
+    writer = CaptureWriter(filename)
+    t0 = time.time()
+    for reading in readings(n):
+        writer.write(reading)
+    writer.close()
+    elapsed = time.time() - t0
+    return {'seconds': elapsed, 'readings_per_second': n / elapsed,
+            'megabytes': os.path.getsize(filename) / 1024.0 / 1024,
+            'peak_rss_mb': _peak_rss_mb()}
+
+
+def child_report(filename, n):
+    """ make the report of the capture @filename """
+    from generate_graph import generate
+    t0 = time.time()
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        report = generate(filename)
+    finally:
+        sys.stdout = sys.__stdout__
+    elapsed = time.time() - t0
+    shutil.rmtree(os.path.dirname(report))
+    return {'seconds': elapsed, 'readings_per_second': n / elapsed,
+            'peak_rss_mb': _peak_rss_mb()}
+
+
+CHILDREN = {'write': child_write, 'report': child_report}
+
+
+def _in_child(what, filename, n, cwd):
+    out = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                   '--child', what, filename, str(n)],
+                                  cwd=cwd)
+    return json.loads(out.splitlines()[-1])
+
+
+def pipeline(workdir, sizes):
+    """ the write and report results of each size, keyed by the number of
+    readings """
+    write = {}
+    report = {}
+    for power in sizes:
+        n = 10 ** power
+        filename = os.path.join(workdir, 'readings-%d.dat' % n)
+        write[str(n)] = _in_child('write', filename, n, workdir)
+        report[str(n)] = _in_child('report', filename, n, workdir)
+        os.remove(filename)
+    return write, report
+
+
+def run(sizes=(3, 4, 5), seconds=5.0, rate=200):
+    workdir = tempfile.mkdtemp()
+    try:
+        results = {}
+        results['tail'] = tail_latency(workdir, rate, seconds)
+        results['sample'] = sample_rate(workdir, min(seconds, 2.0))
+        results['write'], results['report'] = pipeline(workdir, sizes)
+    finally:
+        shutil.rmtree(workdir)
+    return {'version': VERSION,
+            'time': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.sysconf('SC_NPROCESSORS_ONLN'),
+            'results': results}
+
+
+def _flatten(results, prefix=''):
+    """ {'a/b/c': number} of the nested dicts @results """
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, prefix + key + '/'))
+        elif isinstance(value, (int, long, float)):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(old, new, tolerance=0.2):
+    """ return [(name, old value, new value, change, worse)] for every
+    number in both results dicts @old and @new, where change is new / old
+    - 1 and worse says whether it's a regression of more than
+    @tolerance (and more than the NOISE) """
+    old, new = _flatten(old['results']), _flatten(new['results'])
+    rows = []
+    for name in sorted(set(old) & set(new)):
+        a, b = old[name], new[name]
+        if not a:
+            continue
+        change = float(b) / a - 1
+        kind = name.rsplit('/', 1)[-1]
+        worse = (kind in LOWER_IS_BETTER and change > tolerance) or \
+                (kind in HIGHER_IS_BETTER and change < -tolerance)
+        if abs(b - a) <= NOISE.get(kind, 0):
+            worse = False
+        rows.append((name, a, b, change, worse))
+    return rows
+
+
+def main(args):
+    opts, args = getopt.getopt(args, '', ['sizes=', 'seconds=', 'rate=',
+                                          'out=', 'compare', 'tolerance=',
+                                          'child'])
+    opts = dict(opts)
+    if '--child' in opts:
+        what, filename, n = args
+        print json.dumps(CHILDREN[what](filename, int(n)))
+        return 0
+    if '--compare' in opts:
+        old, new = [json.load(open(name)) for name in args]
+        tolerance = float(opts.get('--tolerance', 0.2))
+        regressions = 0
+        for name, a, b, change, worse in compare(old, new, tolerance):
+            print "%s %-45s %12.3f %12.3f %+7.1f%%" % (
+              '!' if worse else ' ', name, a, b, change * 100)
+            regressions += worse
+        if regressions:
+            print "%d regressions" % regressions
+            return 1
+        return 0
+    sizes = [int(x) for x in opts.get('--sizes', '3,4,5').split(',')]
+    results = run(sizes, float(opts.get('--seconds', 5.0)),
+                  int(opts.get('--rate', 200)))
+    out = opts.get('--out')
+    data = json.dumps(results, indent=1, sort_keys=True)
+    if out:
+        f = open(out, 'w')
+        f.write(data + '\n')
+        f.close()
+        print "written to", out
+    else:
+        print data
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main(sys.argv[1:]))
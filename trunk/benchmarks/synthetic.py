@@ -0,0 +1,188 @@
+"""
+Synthetic workloads for the benchmarks.
+
+All of them are deterministic for a given seed: the same lines, readings
+and memory pattern every run, so runs can be compared.
+"""
+import os
+import time
+
+
+def z2_log_line(url, when=None, method='GET', status=200, size=1234):
+    """ return one line (with newline) looking like what Zope writes to
+    Z2.log """
+    if when is None:
+        when = time.time()
+    stamp = time.strftime('%d/%b/%Y:%H:%M:%S +0000', time.gmtime(when))
+    return '127.0.0.1 - Anonymous [%s] "%s %s HTTP/1.1" %d %d "-" ' \
+           '"Mozilla/5.0 (benchmark)"\n' % (stamp, method, url, status, size)
+
+
+def write_log(filename, rate, duration, tick=0.01):
+    """ append synthetic Z2.log lines to @filename at @rate lines per second
+    for @duration seconds. Lines are written in bursts every @tick seconds
+    and each URL carries the time it was written as '?t=...' so that a
+    reader can work out how far behind it is.
+    """
+    f = open(filename, 'a')
+    per_tick = max(1, int(round(rate * tick)))
+    start = time.time()
+    written = 0
+    while 1:
+        now = time.time()
+        if now - start >= duration:
+            break
+        due = int((now - start) * rate) + per_tick
+        burst = []
+        while written < due:
+            burst.append(z2_log_line('/bench/%d?t=%.6f' % (written, now), now))
+            written += 1
+        f.write(''.join(burst))
+        f.flush()
+        time.sleep(tick)
+    f.close()
+    return written
+
+
+def write_log_file(filename, lines, t0=1212143496.0, rate=200, seed=0):
+    """ write @lines lines of a Z2.log at @rate requests a second, with a
+    mix of methods, a few hundred URLs and the odd line that isn't a
+    request, like a real log """
+    import random
+    r = random.Random(seed)
+    methods = ['GET'] * 90 + ['POST'] * 6 + ['HEAD', 'PUT', 'DELETE', 
+                                            'PROPFIND']
+    f = open(filename, 'w')
+    burst = []
+    for i in xrange(lines):
+        if not i % 5000:
+            burst.append('garbage in the log\n')
+        burst.append(z2_log_line('/site/page%d?id=%d' % (r.randint(0, 299), i),
+                                 t0 + i / float(rate), r.choice(methods)))
+        if len(burst) >= 10000:
+            f.write(''.join(burst))
+            burst = []
+    f.write(''.join(burst))
+    f.close()
+
+
+def written_at(line):
+    """ the time a line from write_log() was written """
+    i = line.find('?t=')
+    return float(line[i+3:line.find(' ', i)])
+
+
+def readings(n, t0=1212143496.0, urls=300, seed=0):
+    """ generator of @n record.Reading tuples with a slowly leaking,
+    noisy memory pattern spread over @urls different URLs """
+    import random
+    from record import Reading
+    r = random.Random(seed)
+    memory = 100000
+    for i in xrange(n):
+        memory = max(50000, memory + r.randint(-40, 44))
+        url = ('GET', '/site/page%d' % r.randint(0, urls - 1))
+        yield Reading(url, memory, t0 + i * 0.1, memory - 20000, 0,
+                      memory - 30000, 10000, None, 0)
+
+
+# how FakeZope's memory moves, see memory_pattern()
+PATTERNS = ('flat', 'leak', 'sawtooth', 'spiky')
+
+
+def memory_pattern(name, t, kb_per_second=256, period=60.0, seed=0):
+    """ how many kB above where it started the memory of a FakeZope with
+    the pattern @name is @t seconds in: 'flat' stays put, 'leak' grows
+    @kb_per_second, 'sawtooth' does the same but is all freed every
+    @period seconds and 'spiky' is flat with a spike of ten seconds of
+    growth for one second in ten (which seconds is decided by @seed) """
+    if name == 'flat':
+        return 0
+    if name == 'leak':
+        return int(t * kb_per_second)
+    if name == 'sawtooth':
+        return int((t % period) * kb_per_second)
+    if name == 'spiky':
+        import random
+        if random.Random(seed * 1000003 + int(t)).random() < 0.1:
+            return int(10 * kb_per_second)
+        return 0
+    raise ValueError("Unknown memory pattern %r" % name)
+
+
+# the memory is taken in chunks of this many kB
+CHUNK_KB = 64
+
+
+def _run_fake_zope(log_filename, pattern, rate, kb_per_second, seed,
+                   tick=0.01):
+    chunks = []
+    f = open(log_filename, 'a')
+    start = time.time()
+    written = 0
+    while 1:
+        now = time.time()
+        t = now - start
+        wanted = memory_pattern(pattern, t, kb_per_second, seed=seed) // \
+                 CHUNK_KB
+        while len(chunks) < wanted:
+            # a new string every time, its pages are written to so they
+            # count in the RSS
+            chunks.append(('%08d' % len(chunks)) * (CHUNK_KB * 128))
+        del chunks[wanted:]
+        due = int(t * rate)
+        burst = []
+        while written < due:
+            burst.append(z2_log_line('/bench/%d?t=%.6f' % (written, now),
+                                     now))
+            written += 1
+        if burst:
+            f.write(''.join(burst))
+            f.flush()
+        time.sleep(tick)
+
+
+class FakeZope(object):
+    """ a process that get_readings.py can't tell from a Zope: the
+    directory @home has log/Z2.log, written to at @rate requests a
+    second, and var/Z2.pid, and its memory follows memory_pattern() with
+    @pattern, @kb_per_second and @seed. Each line's URL carries the time
+    it was written like write_log()'s. """
+
+    def __init__(self, home, pattern='leak', rate=100, kb_per_second=256,
+                 seed=0):
+        self.home = home
+        self.pattern = pattern
+        self.rate = rate
+        self.kb_per_second = kb_per_second
+        self.seed = seed
+        self.log_filename = os.path.join(home, 'log', 'Z2.log')
+        self.pid_filename = os.path.join(home, 'var', 'Z2.pid')
+        self.process = None
+
+    def start(self):
+        from multiprocessing import Process
+        for name in (self.log_filename, self.pid_filename):
+            if not os.path.isdir(os.path.dirname(name)):
+                os.makedirs(os.path.dirname(name))
+        open(self.log_filename, 'a').close()
+        self.process = Process(target=_run_fake_zope,
+                               args=(self.log_filename, self.pattern,
+                                     self.rate, self.kb_per_second,
+                                     self.seed))
+        self.process.daemon = True
+        self.process.start()
+        f = open(self.pid_filename, 'w')
+        f.write('%d\n' % self.process.pid)
+        f.close()
+        return self
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
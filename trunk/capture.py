@@ -0,0 +1,309 @@
+"""
+The on-disk format readings are recorded in.
+
+A capture file is the 6 byte header ('ZMRC' and a version number)
+followed by frames. Every frame is a one character type, the length of
+the payload and the payload:
+
+  'I'  the name of a Zope instance: its id and the name
+  'U'  a URL for the string table: its id, the method, a NUL and the URL
+  'R'  a reading: timestamp, URL id, the memory metrics in kB and the
+       instance id (version 1 files have no instance id)
+  'E'  a record.Event: timestamp, instance id, the kind, a NUL and the
+       detail
+  'P'  a record.Snapshot of probe.py: timestamp, instance id and the data
+       as JSON
+  'S'  the footer: what recording it cost, as JSON (see selfstats.py)
+
+URLs are written once, the first time they're seen, and readings refer to
+them by id. The instances are all written at the start. Frames are only
+ever appended, so if the recording process is killed everything up to the
+last complete frame can still be read. Readers skip frames of kinds they
+don't know, which is why the event, snapshot and footer frames didn't
+need a new version.
+"""
+import os
+import time
+import json
+import struct
+
+from record import Reading, Event, Snapshot
+from urltable import URLTable
+
+MAGIC = 'ZMRC'
+VERSION = 2
+HEADER = struct.Struct('<4sH')
+
+FRAME = struct.Struct('<cH')
+URL_ID = struct.Struct('<I')
+# timestamp, url id, the metrics of record.METRICS (-1 is None), instance
+READING = struct.Struct('<dI6iH')
+READING_V1 = struct.Struct('<dI6i')
+# timestamp, instance, of events and snapshots
+EVENT = struct.Struct('<dH')
+
+INSTANCE_FRAME = 'I'
+URL_FRAME = 'U'
+READING_FRAME = 'R'
+EVENT_FRAME = 'E'
+SNAPSHOT_FRAME = 'P'
+FOOTER_FRAME = 'S'
+
+
+def is_capture(filename):
+    """ True if @filename is a capture file rather than an old marshal dump """
+    f = open(filename, 'rb')
+    try:
+        return f.read(len(MAGIC)) == MAGIC
+    finally:
+        f.close()
+
+
+class CaptureWriter(object):
+    """ append readings to the capture file @filename.
+
+    Frames are collected in memory and written @batch_size at a time, or
+    after @flush_interval seconds, whichever comes first. As that's only
+    looked at when something is written, call tick() every so often when
+    there's nothing to write. The file is fsync()'ed at most every
+    @fsync_interval seconds.
+
+    @urls is the urltable.URLTable the URL ids of the readings come from.
+    If it's not given, readings that carry the URL itself are interned
+    into a table of the writer's own.
+
+    @instances is the list of names of the Zope instances, the instance
+    of a reading is its index in the list.
+    """
+
+    def __init__(self, filename, urls=None, instances=('',), batch_size=512,
+                 flush_interval=1.0, fsync_interval=10.0):
+        self.filename = filename
+        self.file = open(filename, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION))
+        self.instances = list(instances)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        if urls is None:
+            urls = URLTable()
+        self.urls = urls
+        # how many entries of self.urls have been written to the file
+        self._urls_written = 0
+        self.count = 0
+        self._frames = []
+        self._pending = 0
+        self._last_flush = self._last_fsync = time.time()
+        for id, name in enumerate(self.instances):
+            self._frame(INSTANCE_FRAME, URL_ID.pack(id) + name)
+
+    def _frame(self, kind, payload):
+        self._frames.append(FRAME.pack(kind, len(payload)))
+        self._frames.append(payload)
+
+    def _write_urls(self):
+        """ add the URLs interned since last time to the string table """
+        urls = self.urls.urls
+        for id in xrange(self._urls_written, len(urls)):
+            url = urls[id]
+            if isinstance(url, tuple):
+                method, uri = url
+            else:
+                method, uri = '', url
+            payload = URL_ID.pack(id) + method + '\0' + uri
+            # the length of a frame has to fit in 16 bits
+            self._frame(URL_FRAME, payload[:0xffff])
+        self._urls_written = len(urls)
+
+    def write(self, reading):
+        """ append the record.Reading @reading """
+        url = reading[0]
+        if not isinstance(url, int):
+            url = self.urls.intern(url)
+        if url >= self._urls_written:
+            self._write_urls()
+        metrics = [-1 if x is None else x for x in reading[3:-1]]
+        metrics.append(reading.instance)
+        self._frame(READING_FRAME,
+                    READING.pack(reading[2], url, reading[1], *metrics))
+        self.count += 1
+        self._added()
+
+    def _added(self):
+        """ a frame has been collected, write them out if there are enough
+        or they've waited long enough """
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.flush()
+        else:
+            self.tick()
+
+    def tick(self, now=None):
+        """ write out what's been collected if it's been waiting
+        @flush_interval seconds """
+        if now is None:
+            now = time.time()
+        if self._frames and now - self._last_flush >= self.flush_interval:
+            self.flush(now)
+
+    def write_event(self, event):
+        """ append the record.Event @event, and write it out right away """
+        payload = EVENT.pack(event.timestamp, event.instance) + \
+                  event.kind + '\0' + event.detail
+        self._frame(EVENT_FRAME, payload[:0xffff])
+        self.flush()
+
+    def write_snapshot(self, snapshot):
+        """ append the record.Snapshot @snapshot. It's dropped if its JSON
+        doesn't fit in a frame. """
+        payload = EVENT.pack(snapshot.timestamp, snapshot.instance) + \
+                  json.dumps(snapshot.data, separators=(',', ':'))
+        if len(payload) <= 0xffff:
+            self._frame(SNAPSHOT_FRAME, payload)
+            self._added()
+
+    def write_footer(self, data):
+        """ append the footer, the dict @data, usually right before
+        close() """
+        payload = json.dumps(data, separators=(',', ':'))
+        self._frame(FOOTER_FRAME, payload[:0xffff])
+        self.flush()
+
+    def flush(self, now=None):
+        """ write out everything collected so far """
+        if now is None:
+            now = time.time()
+        if self._frames:
+            self.file.write(''.join(self._frames))
+            self._frames = []
+            self._pending = 0
+        self.file.flush()
+        self._last_flush = now
+        if now - self._last_fsync >= self.fsync_interval:
+            os.fsync(self.file.fileno())
+            self._last_fsync = now
+
+    def close(self):
+        if self.file is not None:
+            self._last_fsync = 0
+            self.flush()
+            self.file.close()
+            self.file = None
+
+
+class CaptureReader(object):
+    """ iterate over the readings in the capture file @filename, with the
+    URL of each reading as its id in self.urls (a list). self.urls grows as
+    the file is read. The names of the instances are in self.instances and
+    the record.Events read so far in self.events. Once it's all been read
+    self.footer is the footer, or None if it hasn't got one (e.g. because
+    the recording was killed). A frame cut short at the end of the file is
+    ignored.
+
+    If @snapshots is set the record.Snapshots are generated too, in
+    between the readings. """
+
+    def __init__(self, filename, block_size=1024 * 1024, snapshots=False):
+        self.filename = filename
+        self.block_size = block_size
+        self.with_snapshots = snapshots
+        self.urls = []
+        self.instances = ['']
+        self.events = []
+        self.footer = None
+
+    def __iter__(self):
+        f = open(self.filename, 'rb')
+        try:
+            magic, version = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError("%s is not a capture file" % self.filename)
+            if version > VERSION:
+                raise ValueError("%s is version %s, only up to %s is "
+                                 "supported" % (self.filename, version,
+                                                VERSION))
+
+            urls = self.urls
+            del urls[:]
+            instances = self.instances
+            del instances[:]
+            events = self.events
+            del events[:]
+            self.footer = None
+            frame_size = FRAME.size
+            unpack_frame = FRAME.unpack_from
+            if version == 1:
+                instances.append('')
+                unpack_reading = READING_V1.unpack_from
+                # every reading is of instance 0
+                tail = (0,)
+            else:
+                unpack_reading = READING.unpack_from
+                tail = ()
+            # skips the argument handling of Reading.__new__
+            new_reading = tuple.__new__
+            with_snapshots = self.with_snapshots
+            buf = ''
+            while 1:
+                block = f.read(self.block_size)
+                if not block:
+                    break
+                buf = buf + block
+                pos = 0
+                end = len(buf)
+                while pos + frame_size <= end:
+                    kind, length = unpack_frame(buf, pos)
+                    start = pos + frame_size
+                    if start + length > end:
+                        break
+                    if kind == READING_FRAME:
+                        values = unpack_reading(buf, start) + tail
+                        metrics = values[3:]
+                        if -1 in metrics:
+                            metrics = tuple([None if x == -1 else x
+                                             for x in metrics])
+                        yield new_reading(Reading, (values[1], values[2],
+                                                    values[0]) + metrics)
+                    elif kind == INSTANCE_FRAME:
+                        instances.append(buf[start + URL_ID.size:
+                                             start + length])
+                    elif kind == URL_FRAME:
+                        payload = buf[start + URL_ID.size:start + length]
+                        method, uri = payload.split('\0', 1)
+                        if method:
+                            urls.append((method, uri))
+                        else:
+                            urls.append(uri)
+                    elif kind == EVENT_FRAME:
+                        timestamp, instance = EVENT.unpack_from(buf, start)
+                        payload = buf[start + EVENT.size:start + length]
+                        event_kind, detail = payload.split('\0', 1)
+                        events.append(Event(timestamp, instance, event_kind,
+                                            detail))
+                    elif kind == SNAPSHOT_FRAME and with_snapshots:
+                        timestamp, instance = EVENT.unpack_from(buf, start)
+                        data = json.loads(buf[start + EVENT.size:
+                                              start + length])
+                        yield Snapshot(timestamp, instance, data)
+                    elif kind == FOOTER_FRAME:
+                        self.footer = json.loads(buf[start:start + length])
+                    pos = start + length
+                buf = buf[pos:]
+        finally:
+            f.close()
+
+
+def read_snapshots(filename):
+    """ generator of the record.Snapshots in the capture file @filename """
+    for item in CaptureReader(filename, snapshots=True):
+        if isinstance(item, Snapshot):
+            yield item
+
+
+def read_capture(filename, block_size=1024 * 1024):
+    """ generator of record.Reading tuples read from the capture file
+    @filename, with the URLs filled in """
+    reader = CaptureReader(filename, block_size=block_size)
+    urls = reader.urls
+    for reading in reader:
+        yield reading._replace(url=urls[reading[0]])
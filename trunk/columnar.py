@@ -0,0 +1,310 @@
+"""
+A columnar layout of a capture for making reports of big ones.
+
+A capture file has to be read from start to end to find anything in it.
+This is the same readings with every field in an array of its own, so
+the file can be mmap()'ed and a time range found by binary search and
+read a column at a time, without reading the rest:
+
+  header     'ZMCC', the version, the number of readings n and where the
+             string table is
+  timestamp  n little-endian doubles
+  url        n unsigned 32 bit URL ids
+  memory ..  n signed 32 bit kB values for each of record.METRICS, -1 is
+             None
+  instance   n unsigned 16 bit instance ids
+  strings    the instance names and then the URLs, each one the length
+             and the bytes, with a NUL between method and URL
+
+Every array starts at a multiple of 8 bytes. Make one of a capture with
+
+ $ python columnar.py /tmp/zope-memory-readings.dat readings.zmcc
+
+and generate_graph.py takes it like any other capture.
+"""
+import os
+import sys
+import mmap
+import array
+import struct
+from bisect import bisect_left
+
+from record import Reading, METRICS
+from capture import CaptureReader
+
+MAGIC = 'ZMCC'
+VERSION = 1
+# magic, version, number of readings, offset and length of the strings
+HEADER = struct.Struct('<4sHxxQQQ')
+STRING_LENGTH = struct.Struct('<I')
+
+# the name and array typecode of each column, in the order of a Reading
+# except that the timestamp comes first
+COLUMNS = (('timestamp', 'd'), ('url', 'I'), ('memory', 'i')) + \
+          tuple([(name, 'i') for name in METRICS[1:]]) + \
+          (('instance', 'H'),)
+
+# readings are read and written this many at a time
+BLOCK_ROWS = 65536
+
+_SWAP = sys.byteorder != 'little'
+
+
+def _aligned(size):
+    return (size + 7) & ~7
+
+
+def _offsets(count):
+    """ the offset of each of COLUMNS in a file of @count readings, and
+    where the string table goes """
+    offsets = {}
+    offset = _aligned(HEADER.size)
+    for name, typecode in COLUMNS:
+        offsets[name] = offset
+        offset += _aligned(array.array(typecode).itemsize * count)
+    return offsets, offset
+
+
+def is_columnar(filename):
+    f = open(filename, 'rb')
+    try:
+        return f.read(len(MAGIC)) == MAGIC
+    finally:
+        f.close()
+
+
+def write_columnar(filename, readings, urls, instances=('',)):
+    """ write the record.Reading tuples @readings, with the id of their
+    URL in the list @urls, to @filename. @instances is the list of names of
+    the Zope instances. Each column is collected in a file of its own
+    next to @filename first, as the number of readings isn't known until
+    the end. Returns the number of readings. """
+    parts = {}
+    for name, typecode in COLUMNS:
+        parts[name] = open('%s.%s' % (filename, name), 'w+b')
+    try:
+        count = 0
+        blocks = [array.array(typecode) for name, typecode in COLUMNS]
+        # where the field of each column is in a Reading
+        fields = [Reading._fields.index(name) for name, typecode in COLUMNS]
+        def write_blocks():
+            for (name, typecode), block in zip(COLUMNS, blocks):
+                if _SWAP:
+                    block.byteswap()
+                block.tofile(parts[name])
+                del block[:]
+        for reading in readings:
+            for i, block in zip(fields, blocks):
+                value = reading[i]
+                if value is None:
+                    value = -1
+                block.append(value)
+            count += 1
+            if not count % BLOCK_ROWS:
+                write_blocks()
+        write_blocks()
+
+        offsets, strings_offset = _offsets(count)
+        strings = []
+        for name in instances:
+            strings.append(STRING_LENGTH.pack(len(name)) + name)
+        for url in urls:
+            if isinstance(url, tuple):
+                url = '\0'.join(url)
+            else:
+                url = '\0' + url
+            strings.append(STRING_LENGTH.pack(len(url)) + url)
+        strings = STRING_LENGTH.pack(len(instances)) + ''.join(strings)
+
+        f = open(filename, 'wb')
+        try:
+            f.write(HEADER.pack(MAGIC, VERSION, count, strings_offset,
+                                len(strings)))
+            for name, typecode in COLUMNS:
+                f.seek(offsets[name])
+                part = parts[name]
+                part.seek(0)
+                while 1:
+                    data = part.read(BLOCK_ROWS * 8)
+                    if not data:
+                        break
+                    f.write(data)
+            f.seek(strings_offset)
+            f.write(strings)
+        finally:
+            f.close()
+        return count
+    finally:
+        for name, part in parts.items():
+            part.close()
+            os.remove(part.name)
+
+
+class ColumnarCapture(object):
+    """ the columnar file @filename, mmap()'ed. Only the header and the
+    string table are read up front: self.urls is the list of URLs by id
+    and self.instances the names of the instances. """
+
+    def __init__(self, filename):
+        self.filename = filename
+        f = open(filename, 'rb')
+        try:
+            magic, version, count, strings_offset, strings_length = \
+              HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError("%s is not a columnar capture" % filename)
+            if version > VERSION:
+                raise ValueError("%s is version %s, only up to %s is "
+                                 "supported" % (filename, version, VERSION))
+            if count:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                # an empty file can't be mapped
+                self.map = ''
+        finally:
+            f.close()
+        self.count = count
+        self.offsets = _offsets(count)[0]
+        self.urls, self.instances = self._strings(strings_offset,
+                                                  strings_length)
+
+    def _strings(self, offset, length):
+        if self.count:
+            data = self.map[offset:offset + length]
+        else:
+            f = open(self.filename, 'rb')
+            f.seek(offset)
+            data = f.read(length)
+            f.close()
+        size = STRING_LENGTH.size
+        n, = STRING_LENGTH.unpack_from(data)
+        pos = size
+        strings = []
+        while pos < len(data):
+            length, = STRING_LENGTH.unpack_from(data, pos)
+            strings.append(data[pos + size:pos + size + length])
+            pos += size + length
+        instances = strings[:n]
+        urls = []
+        for url in strings[n:]:
+            method, uri = url.split('\0', 1)
+            if method:
+                urls.append((method, uri))
+            else:
+                urls.append(uri)
+        return urls, instances
+
+    def __len__(self):
+        return self.count
+
+    def view(self, name, start=0, end=None):
+        """ the readings @start to @end of the column @name as a buffer
+        onto the file, without copying anything """
+        if end is None or end > self.count:
+            end = self.count
+        typecode = dict(COLUMNS)[name]
+        size = array.array(typecode).itemsize
+        start = max(0, min(start, end))
+        return buffer(self.map, self.offsets[name] + start * size,
+                      (end - start) * size)
+
+    def column(self, name, start=0, end=None):
+        """ the readings @start to @end of the column @name as an
+        array.array. -1 in a memory column is None. """
+        a = array.array(dict(COLUMNS)[name])
+        a.fromstring(self.view(name, start, end))
+        if _SWAP:
+            a.byteswap()
+        return a
+
+    def timestamp(self, i):
+        """ the timestamp of reading @i """
+        return struct.unpack_from('<d', self.map,
+                                  self.offsets['timestamp'] + 8 * i)[0]
+
+    def find(self, timestamp):
+        """ the index of the first reading at or after @timestamp, by
+        binary search of the mapped timestamps """
+        return bisect_left(_Timestamps(self), timestamp)
+
+    def time_range(self, first=None, last=None):
+        """ the (start, end) indexes of the readings from @first to @last,
+        both included and None for no limit """
+        start = 0
+        end = self.count
+        if first is not None:
+            start = self.find(first)
+        if last is not None:
+            end = bisect_left(_Timestamps(self), last, start)
+            while end < self.count and self.timestamp(end) <= last:
+                end += 1
+        return start, end
+
+    def min_max(self, name, start=0, end=None):
+        """ the (min, max) of the column @name from @start to @end, None
+        values left out, or (None, None) if there are none """
+        lo = hi = None
+        if end is None or end > self.count:
+            end = self.count
+        for block_start in xrange(start, end, BLOCK_ROWS):
+            a = self.column(name, block_start,
+                            min(end, block_start + BLOCK_ROWS))
+            if a.typecode == 'i' and -1 in a:
+                a = [x for x in a if x != -1]
+                if not a:
+                    continue
+            block_lo, block_hi = min(a), max(a)
+            if lo is None or block_lo < lo:
+                lo = block_lo
+            if hi is None or block_hi > hi:
+                hi = block_hi
+        return lo, hi
+
+    def readings(self, start=0, end=None):
+        """ generator of the record.Reading tuples from @start to @end,
+        with the URL as its id in self.urls """
+        if end is None or end > self.count:
+            end = self.count
+        new_reading = tuple.__new__
+        for block_start in xrange(start, end, BLOCK_ROWS):
+            block_end = min(end, block_start + BLOCK_ROWS)
+            columns = [self.column(name, block_start, block_end)
+                       for name, typecode in COLUMNS]
+            timestamps, url_ids, metrics = columns[0], columns[1], columns[2:]
+            for i, row in enumerate(zip(*metrics)):
+                if -1 in row:
+                    row = tuple([None if x == -1 else x for x in row])
+                yield new_reading(Reading, (url_ids[i], row[0],
+                                            timestamps[i]) + row[1:])
+
+    def close(self):
+        if self.count:
+            self.map.close()
+
+
+class _Timestamps(object):
+    """ the timestamps of a ColumnarCapture as a sequence for bisect """
+
+    def __init__(self, capture):
+        self.capture = capture
+
+    def __len__(self):
+        return self.capture.count
+
+    def __getitem__(self, i):
+        return self.capture.timestamp(i)
+
+
+def convert(capture_filename, filename):
+    """ write the readings of the capture file @capture_filename to the
+    columnar file @filename and return how many there are """
+    reader = CaptureReader(capture_filename)
+    readings = iter(reader)
+    return write_columnar(filename, readings, reader.urls, reader.instances)
+
+
+if __name__=='__main__':
+    if len(sys.argv) != 3:
+        print "Usage: %s <capture file> <columnar file>" % sys.argv[0]
+        sys.exit(1)
+    print "%d readings" % convert(sys.argv[1], sys.argv[2])
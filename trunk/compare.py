@@ -0,0 +1,305 @@
+"""
+Compare two recordings, e.g. before and after deploying a new release.
+
+Both captures are read at the same time, a reading from one and then from
+the other, lined up either by the time since their first reading or by
+how many readings in they are, and only as far as the shorter one goes so
+neither gets longer to grow. For every URL each side keeps the count,
+mean and variance of its memory deltas and a histogram of them by powers
+of two, so the memory used doesn't grow with the size of the captures.
+
+The URLs are printed with the distributions of their deltas side by side,
+those whose mean delta changed the most first. A '!' marks the ones that
+changed by more than the threshold (in kB a hit) and were hit at least
+@min_hits times in both.
+
+ $ python compare.py [--by=requests] [--threshold=KB] before.dat after.dat
+
+It exits with 1 if any URL was flagged, so it can fail a build.
+"""
+import math
+
+from record import METRICS, Reading
+
+BY = ('time', 'requests')
+
+
+def _bucket(delta):
+    """ the histogram bucket of @delta: its sign times how many bits its
+    size takes, so 0 for 0, 1 for 1, 2 for 2 and 3, 3 for 4 to 7... """
+    n = int(abs(delta)).bit_length()
+    if delta < 0:
+        return -n
+    return n
+
+
+def _bucket_value(bucket):
+    """ the largest delta in @bucket, what a percentile falling in it is
+    given as """
+    if bucket < 0:
+        return -(2 ** -bucket - 1)
+    return 2 ** bucket - 1
+
+
+class DeltaDistribution(object):
+    """ the count, mean, variance (Welford's) and a histogram by powers of
+    two of some memory deltas """
+
+    __slots__ = ('n', 'mean', 'm2', 'histogram')
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.histogram = {}
+
+    def add(self, delta):
+        self.n += 1
+        d = delta - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (delta - self.mean)
+        b = _bucket(delta)
+        self.histogram[b] = self.histogram.get(b, 0) + 1
+
+    def stddev(self):
+        if self.n < 2:
+            return 0.0
+        return math.sqrt(self.m2 / (self.n - 1))
+
+    def percentile(self, p):
+        """ the @p th percentile, to the power of two above it, or None
+        without any deltas """
+        if not self.n:
+            return None
+        rank = p / 100.0 * self.n
+        seen = 0
+        for b in sorted(self.histogram):
+            seen += self.histogram[b]
+            if seen >= rank:
+                return _bucket_value(b)
+        return _bucket_value(max(self.histogram))
+
+
+class Side(object):
+    """ the DeltaDistribution of each URL id of one capture, the URLs of
+    which are in the list @urls. @metric is one of record.METRICS. """
+
+    def __init__(self, urls, metric='memory'):
+        self.urls = urls
+        self.index = Reading._fields.index(metric)
+        self.deltas = {}
+        self.prev = {}
+        self.count = 0
+        self.first = self.last = None
+        self.net = 0
+
+    def add(self, reading):
+        """ account for the record.Reading @reading """
+        self.count += 1
+        timestamp = reading[2]
+        if self.first is None:
+            self.first = timestamp
+        self.last = timestamp
+        value = reading[self.index]
+        if value is None:
+            return
+        instance = reading.instance
+        prev = self.prev.get(instance)
+        self.prev[instance] = value
+        if prev is None:
+            return
+        delta = value - prev
+        self.net += delta
+        url = reading[0]
+        try:
+            distribution = self.deltas[url]
+        except KeyError:
+            distribution = self.deltas[url] = DeltaDistribution()
+        distribution.add(delta)
+
+    def by_url(self):
+        """ the DeltaDistributions by URL, e.g. ('GET', '/some/url'),
+        rather than by id, so they can be matched with another capture's """
+        distributions = {}
+        for url, distribution in self.deltas.iteritems():
+            distributions[self.urls[url]] = distribution
+        return distributions
+
+
+def _keyed(readings, by):
+    """ generator of (key, reading) where key is the seconds since the
+    first reading or how many readings before this one, by @by """
+    if by == 'requests':
+        for i, reading in enumerate(readings):
+            yield i, reading
+        return
+    first = None
+    for reading in readings:
+        if first is None:
+            first = reading[2]
+        yield reading[2] - first, reading
+
+
+def aligned(a, b, by='time'):
+    """ generator of (0 or 1, reading) of the readings @a and @b in the
+    order of their key (see _keyed()), until either runs out and the
+    other one is past where it ended """
+    a = _keyed(a, by)
+    b = _keyed(b, by)
+    try:
+        next_a = a.next()
+        next_b = b.next()
+    except StopIteration:
+        return
+    while 1:
+        if next_a[0] <= next_b[0]:
+            yield 0, next_a[1]
+            limit = next_a[0]
+            try:
+                next_a = a.next()
+            except StopIteration:
+                side, rest, pending = 1, b, next_b
+                break
+        else:
+            yield 1, next_b[1]
+            limit = next_b[0]
+            try:
+                next_b = b.next()
+            except StopIteration:
+                side, rest, pending = 0, a, next_a
+                break
+    while pending[0] <= limit:
+        yield side, pending[1]
+        try:
+            pending = rest.next()
+        except StopIteration:
+            return
+
+
+def compare(before, after, by='time', metric='memory'):
+    """ return the two Sides of the capture files @before and @after,
+    lined up @by 'time' or 'requests' """
+    from generate_graph import iter_readings
+    if by not in BY:
+        raise ValueError("Unknown alignment %r" % by)
+    readings_a, urls_a = iter_readings(before)[:2]
+    readings_b, urls_b = iter_readings(after)[:2]
+    sides = Side(urls_a, metric), Side(urls_b, metric)
+    for side, reading in aligned(readings_a, readings_b, by):
+        sides[side].add(reading)
+    return sides
+
+
+def changes(sides, threshold=1.0, min_hits=20):
+    """ return a row for every URL of the two @sides: (change in the mean
+    delta, flagged, url, before, after) where url is as in the URL table,
+    e.g. ('GET', '/some/url'), and before and after are the
+    DeltaDistributions (None if it wasn't hit on that side). Biggest
+    changes first. """
+    a, b = sides[0].by_url(), sides[1].by_url()
+    rows = []
+    for url in set(a) | set(b):
+        before, after = a.get(url), b.get(url)
+        mean_a = before.mean if before is not None else 0.0
+        mean_b = after.mean if after is not None else 0.0
+        change = mean_b - mean_a
+        flagged = abs(change) > threshold and \
+                  before is not None and before.n >= min_hits and \
+                  after is not None and after.n >= min_hits
+        rows.append((change, flagged, url, before, after))
+    rows.sort(key=lambda row: (-abs(row[0]), row[2]))
+    return rows
+
+
+def _describe_url(url):
+    """ 'GET /some/url' of the URL ('GET', '/some/url') """
+    if isinstance(url, tuple):
+        return ' '.join([x for x in url if x])
+    return url
+
+
+def _describe(distribution):
+    if distribution is None:
+        return '%7s %8s %8s %6s %6s' % ('-', '-', '-', '-', '-')
+    return '%7d %8.1f %8.1f %6d %6d' % (
+      distribution.n, distribution.mean, distribution.stddev(),
+      distribution.percentile(50), distribution.percentile(95))
+
+
+def print_changes(sides, rows, n=30):
+    for name, side in zip(('before', 'after'), sides):
+        if side.first is None:
+            print "%-6s  no readings" % name
+            continue
+        print "%-6s  %d readings over %.0f seconds, net %+d kB" % (
+          name, side.count, side.last - side.first, side.net)
+    print
+    header = '%7s %8s %8s %6s %6s' % ('hits', 'mean', 'stddev', 'p50',
+                                      'p95')
+    print "  %9s  %s | %s  %s" % ('change', header, header, 'URL')
+    for change, flagged, url, before, after in rows[:n]:
+        print "%s %+9.1f  %s | %s  %s" % ('!' if flagged else ' ', change,
+                                          _describe(before),
+                                          _describe(after),
+                                          _describe_url(url))
+
+
+#### The command line handler ##################################################
+
+import CommandLineApp
+
+class compare_app(CommandLineApp.CommandLineApp):
+    """ compare the memory deltas of every URL in two captures, e.g. of
+    the same site before and after an upgrade
+    """
+
+    by = 'time'
+    def optionHandler_by(self, by):
+        """ line the captures up by 'time' since their start (the
+        default) or by 'requests', how many readings in """
+        if by not in BY:
+            raise ValueError("Unknown alignment %r" % by)
+        self.by = by
+        return
+
+    threshold = 1.0
+    def optionHandler_threshold(self, kb):
+        """ flag the URLs whose mean delta changed by more than this many
+        kB a hit (default 1) """
+        self.threshold = float(kb)
+        return
+
+    min_hits = 20
+    def optionHandler_min_hits(self, n):
+        """ only flag URLs hit at least this many times in both (default
+        20) """
+        self.min_hits = int(n)
+        return
+
+    top = 30
+    def optionHandler_top(self, n):
+        """ how many URLs to show (default 30) """
+        self.top = int(n)
+        return
+
+    metric = 'memory'
+    def optionHandler_metric(self, name):
+        """ which memory metric to use: memory (VmSize, the default), rss,
+        swap, rss_anon, rss_file or pss """
+        if name not in METRICS:
+            raise ValueError("Unknown metric %r" % name)
+        self.metric = name
+        return
+
+    def main(self, before, after):
+        """ Start! """
+        sides = compare(before, after, self.by, self.metric)
+        rows = changes(sides, self.threshold, self.min_hits)
+        print_changes(sides, rows, self.top)
+        if [row for row in rows if row[1]]:
+            return 1
+        return 0
+
+
+if __name__=='__main__':
+    compare_app().run()
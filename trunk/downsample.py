@@ -0,0 +1,74 @@
+"""
+Cut a long series of readings down to something a browser can plot.
+
+Plain decimation would lose exactly the spikes we're looking for, so the
+series is split into buckets and from each bucket we keep the rows with
+the smallest and the largest value of every column we care about, in
+their original order.
+"""
+
+
+def minmax(rows, buckets, columns):
+    """ return at most 2 * len(@columns) * @buckets of @rows, keeping the
+    min and max of each of @columns in each of @buckets equally sized
+    buckets. None values are ignored. """
+    n = len(rows)
+    if n <= 2 * len(columns) * buckets:
+        return list(rows)
+    out = []
+    size = float(n) / buckets
+    for b in xrange(buckets):
+        start = int(b * size)
+        end = int((b + 1) * size)
+        keep = set()
+        bucket = rows[start:end]
+        for column in columns:
+            # a column at a time is a lot quicker than a value at a time
+            values = [row[column] for row in bucket]
+            present = values
+            if None in values:
+                present = [value for value in values if value is not None]
+            if present:
+                keep.add(start + values.index(min(present)))
+                keep.add(start + values.index(max(present)))
+        if not keep:
+            keep.add(start)
+        for i in sorted(keep):
+            out.append(rows[i])
+    return out
+
+
+class StreamingMinMax(object):
+    """ the same as minmax() but fed one row at a time, with buckets of
+    @bucket_rows rows each, so only one bucket is held in memory """
+
+    def __init__(self, bucket_rows, columns):
+        self.bucket_rows = bucket_rows
+        self.columns = columns
+        self._bucket = []
+
+    def add(self, row):
+        """ add @row and return the rows to keep if it completed a bucket,
+        or an empty list """
+        self._bucket.append(row)
+        if len(self._bucket) < self.bucket_rows:
+            return []
+        return self.flush()
+
+    def extend(self, rows):
+        """ add all of @rows and return the rows to keep of the buckets
+        they completed, which is quicker than add() for a lot of rows """
+        bucket = self._bucket
+        bucket.extend(rows)
+        size = self.bucket_rows
+        whole = len(bucket) // size * size
+        if not whole:
+            return []
+        self._bucket = bucket[whole:]
+        return minmax(bucket[:whole], whole // size, self.columns)
+
+    def flush(self):
+        """ return the rows to keep from what's in the current bucket """
+        bucket = self._bucket
+        self._bucket = []
+        return minmax(bucket, 1, self.columns)
@@ -21,11 +21,128 @@ var options = {
         grid: { clickable: false, mouseCatchingArea: 6, triggerOnMouseOver: true }
     };
     
+/* Rows are [timestamp, VmSize, uri, VmRSS, VmSwap, RssAnon, RssFile, Pss,
+ * instance] and series says which of those columns to plot as
+ * [label, column], or [label, column, instance] to only plot the rows of
+ * one of several Zope instances.
+ * d is a downsampled overview of the whole capture without the URIs.
+ * The full resolution rows are in the side files listed in chunks as
+ * [first timestamp, last timestamp, filename]. */
+var INSTANCE_COLUMN = 8;
+function getSeries(rows) {
+   var all = [];
+   $.each(series, function() {
+      var label = this[0], column = this[1], instance = this[2];
+      var data = [];
+      for (var i = 0; i < rows.length; i++) {
+         if (instance == null || rows[i][INSTANCE_COLUMN] == instance) {
+            data.push([rows[i][0], rows[i][column]]);
+         }
+      }
+      all.push({label: label, data: data});
+   });
+   return all;
+}
+
+var d = [];
+var series = [];
+var chunks = [];
+var max_value = 0;
+var min_value = 0;
+var leaders = null;
+
+/* Called by overview.js with the downsampled data to plot to begin with
+ * and the index of chunks. */
+function overviewLoaded(data) {
+   d = data.d;
+   series = data.series;
+   chunks = data.chunks;
+   max_value = data.max_value;
+   min_value = data.min_value;
+   leaders = data.leaders;
+}
+
+var loaded_chunks = {};
+var pending_range = null;
+
+/* Index of the first row in the sorted rows whose column is >= x. */
+function __bisect(rows, x, column) {
+   var lo = 0, hi = rows.length;
+   while (lo < hi) {
+      var mid = (lo + hi) >> 1;
+      if (rows[mid][column] < x) {
+         lo = mid + 1;
+      } else {
+         hi = mid;
+      }
+   }
+   return lo;
+}
+
+/* Call callback with the full resolution rows between x1 and x2 once the
+ * chunks they're in have been loaded. */
+function loadRange(x1, x2, callback) {
+   if (live) {
+      // everything there is is in d already
+      callback(d.slice(__bisect(d, x1, 0), __bisect(d, x2, 0)));
+      return;
+   }
+   // chunks are sorted by time, so the ones we need are a run from the
+   // first one that ends at or after x1
+   var needed = [];
+   var count = 0;
+   for (var i = __bisect(chunks, x1, 1); i < chunks.length && chunks[i][0] < x2; i++) {
+      needed.push(i);
+      count += chunks[i][3];
+   }
+   pending_range = {x1: x1, x2: x2, needed: needed, callback: callback};
+   var missing = 0;
+   $.each(needed, function() {
+      if (loaded_chunks[this] == null) {
+         missing++;
+         var script = document.createElement('script');
+         script.type = 'text/javascript';
+         script.src = chunks[this][2];
+         document.getElementsByTagName('head')[0].appendChild(script);
+      }
+   });
+   if (missing) {
+      $('#urls').html('<caption>Loading up to ' + count + ' readings...</caption>');
+   }
+   __checkPendingRange();
+}
+
+/* Called by each side file when it has loaded. */
+function chunkLoaded(number, chunk) {
+   $.each(chunk.d, function() {
+      this[2] = chunk.urls[this[2]];
+   });
+   loaded_chunks[number] = chunk.d;
+   __checkPendingRange();
+}
+
+function __checkPendingRange() {
+   if (pending_range == null) return;
+   var parts = [];
+   var needed = pending_range.needed;
+   for (var i = 0; i < needed.length; i++) {
+      var chunk = loaded_chunks[needed[i]];
+      if (chunk == null) return;
+      parts.push(chunk.slice(__bisect(chunk, pending_range.x1, 0),
+                             __bisect(chunk, pending_range.x2, 0)));
+   }
+   var rows = [].concat.apply([], parts);
+   var callback = pending_range.callback;
+   pending_range = null;
+   callback(rows);
+}
+
 $(function () {
     
    max_value += parseInt(0.01 * max_value);
     
-   plot = $.plot($("#placeholder"), [d], options);
+   plot = $.plot($("#placeholder"), getSeries(d), options);
+   printLeaders();
    
    /* Commented out until this is solved
     * http://groups.google.com/group/flot-graphs/browse_thread/thread/10a7eee60fd25d32
@@ -44,7 +161,14 @@ $(function () {
     
     $("#placeholder").bind("selected", function (event, area) {
        //console.log("event on #placeholder");
-        printURLs(area.x1, area.x2);
+        zoomed = true;
+        loadRange(area.x1, area.x2, function(rows) {
+           plot = $.plot($("#placeholder"), getSeries(rows),
+                         $.extend(true, {}, options, {
+                             xaxis: { min: area.x1, max: area.x2 }
+                         }));
+           printURLs(rows);
+        });
         /*
         plot = $.plot($("#placeholder"), [d],
                       $.extend(true, {}, options, {
@@ -74,6 +198,51 @@ $(function () {
 });
 
 
+/* Live mode (see live.py): overview.js calls liveConnect() after
+ * overviewLoaded() and the rows the server pushes are appended to d and to
+ * the data of the series being plotted, which is redrawn unless zoomed
+ * in. Only the last LIVE_ROWS rows are kept. */
+var live = false;
+var zoomed = false;
+var LIVE_ROWS = 50000;
+var live_series = null;
+
+function liveConnect(url) {
+   live = true;
+   var source = new EventSource(url);
+   source.onmessage = function(event) {
+      __appendRows(JSON.parse(event.data));
+   };
+}
+
+function __appendRows(rows) {
+   d.push.apply(d, rows);
+   var cut = d.length > LIVE_ROWS ? d.length - LIVE_ROWS : 0;
+   if (cut) d.splice(0, cut);
+   if (plot == null || zoomed) {
+      live_series = null;
+      return;
+   }
+   if (live_series == null) {
+      live_series = getSeries(d);
+   } else {
+      $.each(series, function(s) {
+         var column = this[1], instance = this[2];
+         var data = live_series[s].data;
+         for (var i = 0; i < rows.length; i++) {
+            if (instance == null || rows[i][INSTANCE_COLUMN] == instance) {
+               data.push([rows[i][0], rows[i][column]]);
+            }
+         }
+         if (cut) data.splice(0, __bisect(data, d[0][0], 0));
+      });
+   }
+   plot.setData(live_series);
+   plot.setupGrid();
+   plot.draw();
+}
+
+
 function __get_flux(value, prev) {
    if (prev != null) {
       if (value > prev) {
@@ -85,55 +254,71 @@ function __get_flux(value, prev) {
    return '';
 }
 
-function printURLs(x1, x2) {
-   $('tbody', $('#urls')).remove();
-   $('thead', $('#urls')).remove();
-   
-   $('#urls').append(
-           $('<thead></thead>').append(
-                   $('<tr></tr>').append(
-                         $('<th></th>').text('Memory size')
-                                 ).append(
-                         $('<th></th>').text('Change')
-                                 ).append(
-                         $('<th></th>').text('URI')
-                                 )
-                     ) 
-            );
-   
-   
-   var keep = new Array();
-   var prev = null;
-   var line;
-   $.each(d, function() {
-      if (this[0] >= x1 && this[0] < x2) {
-         line = kbytesFormatter(this[1]);
-         $('#urls').append(
-                           $('<tbody></tbody>').append(
-                                                       $('<tr></tr>').append(
-                                                                             $('<td></td>').text(kbytesFormatter(this[1])).attr('align','right')
-                                                                    ).append(
-                                                                             $('<td></td>').text(__get_flux(this[1], prev)).attr('align','right')
-                                                                    ).append(
-                                                                             $('<td></td>').text(uriFormatter(this[2]))
-                                                                    )
-
-                           )
-                           );
-         
-         if (prev != null) {
-            if (this[1] > prev) {
-               line += ' (+' + (this[1]-prev) + ')';
-            } else if (this[1] < prev) {
-               line += ' (' + (this[1]-prev) + ')';
-            }
-         }
-         line += ' ' + this[2]
-         keep.push(line);
-         prev = this[1];
-      }
+function __escape(s) {
+   return s.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+}
+
+// how many rows of the URL table to show at a time
+var URLS_PER_PAGE = 500;
+
+function printURLs(rows) {
+   $('#urls').html('<thead><tr><th>Memory size</th><th>Change</th>' +
+                   '<th>RSS</th><th>RSS change</th><th>URI</th></tr></thead>' +
+                   '<tbody></tbody>');
+   __printURLsPage(rows, 0, {});
+}
+
+/* Add the rows from start to the table, in one go, and a link to show the
+ * next lot if there are any. The changes are against the row before of
+ * the same instance, prevs has the last row of each instance so far. */
+function __printURLsPage(rows, start, prevs) {
+   var end = Math.min(start + URLS_PER_PAGE, rows.length);
+   var html = [];
+   for (var i = start; i < end; i++) {
+      var row = rows[i];
+      var last = prevs[row[INSTANCE_COLUMN]];
+      var prev = last == null ? null : last[1];
+      var prev_rss = last == null ? null : last[3];
+      html.push('<tr><td align="right">' + kbytesFormatter(row[1]) +
+                '</td><td align="right">' + __get_flux(row[1], prev) +
+                '</td><td align="right">' + (row[3] == null ? '' : kbytesFormatter(row[3])) +
+                '</td><td align="right">' + __get_flux(row[3], prev_rss) +
+                '</td><td>' + (row[2] == null ? '' : __escape(uriFormatter(row[2]))) + '</td></tr>');
+      prevs[row[INSTANCE_COLUMN]] = row;
+   }
+   $('tfoot', $('#urls')).remove();
+   $('tbody', $('#urls')).append(html.join(''));
+   if (end < rows.length) {
+      var more = $('<a href="#"></a>').text('Show more (' + (rows.length - end) + ' left)');
+      more.click(function() {
+         __printURLsPage(rows, end, prevs);
+         return false;
+      });
+      $('#urls').append($('<tfoot><tr><td colspan="5"></td></tr></tfoot>'));
+      $('td', $('tfoot', $('#urls'))).append(more);
+   }
+}
+
+
+/* The table of URLs that grew the memory the most over the whole capture
+ * with leaders.rows as [uri, hits, growths, total, mean, max, net]. */
+function printLeaders() {
+   var html = ['<caption>by ' + leaders.metric + '</caption>' +
+               '<thead><tr><th>Hits</th><th>Growths</th>' +
+               '<th>Total growth</th><th>Mean growth</th>' +
+               '<th>Max change</th><th>Net change</th>' +
+               '<th>URI</th></tr></thead><tbody>'];
+   $.each(leaders.rows, function() {
+      html.push('<tr><td align="right">' + this[1] +
+                '</td><td align="right">' + this[2] +
+                '</td><td align="right">' + kbytesFormatter(this[3]) +
+                '</td><td align="right">' + kbytesFormatter(this[4]) +
+                '</td><td align="right">' + (this[5] == null ? '' : kbytesFormatter(this[5])) +
+                '</td><td align="right">' + kbytesFormatter(this[6]) +
+                '</td><td>' + __escape(uriFormatter(this[0])) + '</td></tr>');
    });
-   return keep;
+   html.push('</tbody>');
+   $('#leaders').html(html.join(''));
 }
 
 
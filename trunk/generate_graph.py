@@ -1,50 +1,373 @@
 import os
 import datetime
 import marshal
+import json
+import shutil
+import tempfile
+import heapq
+from itertools import chain, islice
 
+from record import as_reading, METRICS, METRIC_LABELS
+from capture import is_capture, CaptureReader
+from columnar import is_columnar, ColumnarCapture
+from urltable import URLTable, uri_of
+from downsample import minmax, StreamingMinMax
+from attribution import URLStats
+from retention import read_store, read_rollups, MINUTE, HOUR
 
 
-def generate(marshal_file):
-    readings = marshal.load(open(marshal_file, 'rb'))
+
+def _intern_readings(readings, urls):
+    for reading in readings:
+        reading = as_reading(reading)
+        yield reading._replace(url=urls.intern(reading[0]))
+
+
+def _in_range(readings, first, last):
+    for reading in readings:
+        timestamp = reading[2]
+        if first is not None and timestamp < first:
+            continue
+        if last is not None and timestamp > last:
+            continue
+        yield reading
+
+
+def iter_readings(filename, first=None, last=None):
+    """ return (readings, urls, instances) from @filename, which is either
+    a capture file or a marshal dump from older versions. readings is an
+    iterator of record.Reading with the id of the URL in urls, a list
+    that's filled in as readings are read. instances is the list of names
+    of the Zope instances, complete once the first reading is read.
+    @filename can also be the directory of a long term recording, then
+    the readings are the ones it has at full resolution, or a columnar
+    file (see columnar.py).
+
+    Only the readings from @first to @last are returned, if given. In a
+    columnar file those are found by binary search and nothing else is
+    read. """
+    if os.path.isdir(filename):
+        readings, urls, instances = read_store(filename)
+    elif is_columnar(filename):
+        capture = ColumnarCapture(filename)
+        start, end = capture.time_range(first, last)
+        return capture.readings(start, end), capture.urls, capture.instances
+    elif is_capture(filename):
+        reader = CaptureReader(filename)
+        readings, urls, instances = iter(reader), reader.urls, reader.instances
+    else:
+        urls = URLTable()
+        readings = marshal.load(open(filename, 'rb'))
+        readings, urls, instances = _intern_readings(readings, urls), \
+                                    urls.urls, ['']
+    if first is not None or last is not None:
+        readings = _in_range(readings, first, last)
+    return readings, urls, instances
+
+
+def _js_string(s):
+    return json.dumps(s.decode('utf-8', 'replace'))
+
+
+# readings per side file of full resolution data
+CHUNK_SIZE = 10000
+# the overview plot keeps the min and max of every metric of this many
+# readings at a time
+BUCKET_ROWS = 200
+# and is cut down to this many buckets when it's finished
+OVERVIEW_BUCKETS = 1000
+# how many URLs to list in the table of the ones that grew memory the most
+TOP_URLS = 25
+# the columns of a row that are memory metrics
+METRIC_COLUMNS = [1] + range(3, len(METRICS) + 2)
+
+
+# a row is (timestamp, VmSize, url id, the other metrics..., instance) and
+# only ever has numbers and None in it, which is much quicker to format a
+# block of rows at a time than one row or value at a time
+_ROW_FORMAT = '[%.2f,' + ','.join(['%s'] * (len(METRICS) + 2)) + ']'
+
+def _js_rows(values, n):
+    """ @n rows flattened into the list @values, one per line """
+    format = ',\n'.join([_ROW_FORMAT] * n)
+    return (format % tuple(values)).replace('None', 'null')
+
+
+def _write_chunk(directory, number, rows, urls):
+    """ write @rows to a side file in @directory which, once loaded, calls
+    chunkLoaded() with them and the URLs they refer to, one row per line
+    and with their URL ids renumbered to be local to the chunk. Returns
+    its entry in the index of the chunks. """
+    local_ids = {}
+    local = [local_ids.setdefault(url_id, len(local_ids))
+             for url_id in [row[2] for row in rows]]
+    local_urls = [_js_string(uri_of(urls[url_id]))
+                  for url_id in sorted(local_ids, key=local_ids.get)]
+    values = list(chain(*rows))
+    values[2::len(rows[0])] = local
+    filename = '%04d.js' % number
+    f = open(os.path.join(directory, filename), 'w')
+    f.write('chunkLoaded(%d, {"d": [\n' % number)
+    f.write(_js_rows(values, len(rows)))
+    f.write('],\n"urls": [%s]});\n' % ',\n'.join(local_urls))
+    f.close()
+    return [rows[0][0], rows[-1][0], 'chunks/' + filename, len(rows)]
+
+
+def _history_rows(directory):
+    """ generator of overview rows of the rollups of the long term
+    recording in @directory: the per minute ones and before those the per
+    hour ones. A rollup becomes two rows, its minimum at its start and its
+    maximum half way through. """
+    first_minute = None
+    for bucket in read_rollups(directory, 'minutes'):
+        first_minute = bucket['t']
+        break
+    def rows(buckets, seconds):
+        for bucket in buckets:
+            memory, rss = bucket['memory'], bucket['rss'] or (None, None)
+            yield (bucket['t'], memory[0], None, rss[0], None, None, None,
+                   None, bucket['i'])
+            yield (bucket['t'] + seconds / 2, memory[1], None, rss[1], None,
+                   None, None, None, bucket['i'])
+    hours = read_rollups(directory, 'hours')
+    if first_minute is not None:
+        hours = [bucket for bucket in hours
+                 if bucket['t'] + HOUR <= first_minute]
+    for row in rows(hours, HOUR):
+        yield row
+    for row in rows(read_rollups(directory, 'minutes'), MINUTE):
+        yield row
+
+
+def series_of(unseen, used, instances):
+    """ the series of the report: one per metric we have numbers for, as
+    [label, column in d], and with several instances one of those per
+    instance as [label, column in d, instance]. @unseen are the indexes
+    in METRICS[1:] of the metrics without numbers, @used the instances
+    with readings and @instances the names of all of them. """
+    labels = [(METRIC_LABELS[0], 1)]
+    for i, label in enumerate(METRIC_LABELS[1:]):
+        if i not in unseen:
+            labels.append((label, i + 3))
+    if len(used) > 1:
+        series = []
+        for instance in used:
+            name = instances[instance] or str(instance)
+            for label, column in labels:
+                series.append(['%s %s' % (name, label), column, instance])
+    else:
+        series = [list(x) for x in labels]
+    return series
+
+
+def _write_data(readings, urls, data_dir, instances=('',), history=()):
+    """ write the data of the report for @readings to @data_dir and return
+    the first and last timestamp. @instances is the list of names of the
+    Zope instances the readings are of. @history is overview rows of what
+    came before, only the ones from before the first reading are used.
     
-    html = open(os.path.join(os.path.dirname(__file__), 'template.html')).read()
+    The readings are streamed through once. The full resolution data is
+    written to side files under chunks/ as it's read, and a downsampled
+    overview with the index of the chunks to overview.js at the end.
     
+    The index has the first and last timestamp, filename and number of
+    readings of each chunk, in time order, so the report can binary
+    search it for a selected range.
     
-    d = []
-    first_timestamp = readings[0][2]
-    last_timestamp = readings[-1][2]
+    The URLs that grew the memory the most (RSS if the capture has it,
+    VmSize otherwise) are worked out in the same pass.
+    
+    Each instance is downsampled on its own, so the spikes of one aren't
+    lost among the readings of another, and gets its own series when
+    there's more than one.
+    """
+    chunk_dir = os.path.join(data_dir, 'chunks')
+    os.mkdir(chunk_dir)
+    chunks = []
+    
+    stats = None
+    # per instance, the rows kept for the overview and what's bucketing them
+    overviews = {}
+    bucketers = {}
+    first_timestamp = None
+    last_timestamp = None
+    # the first timestamp of the rollups used
+    history_first = None
     min_memory = None
     max_memory = 0
+    # the metrics after VmSize we haven't seen any values for (yet)
+    unseen = set(range(len(METRICS) - 1))
+    
+    def add_overview(overview, rows):
+        for row in rows:
+            overview.append(row[:2] + (None,) + row[3:])
+        if len(overview) > 8 * OVERVIEW_BUCKETS * len(METRIC_COLUMNS):
+            overview[:] = minmax(overview, 2 * OVERVIEW_BUCKETS, METRIC_COLUMNS)
+    
+    def new_instance(instance):
+        bucketers[instance] = StreamingMinMax(BUCKET_ROWS, METRIC_COLUMNS)
+        overviews[instance] = []
     
-    for (method, uri), memory, timestamp in readings:
-        timestamp = round(timestamp, 2)
-        #timestamp = int(timestamp)
-        d.append("[%s,%s,'%s']" % (timestamp, memory, uri))
+    def add_history(before):
+        # the rollups are coarse enough to go straight into the overview.
+        # Returns the first and last timestamp and the min and max VmSize
+        first = last = None
+        lo, hi = None, 0
+        for row in history:
+            if before is not None and row[0] >= before:
+                continue
+            if first is None:
+                first = row[0]
+            last = row[0]
+            instance = row[-1]
+            if instance not in bucketers:
+                new_instance(instance)
+            add_overview(overviews[instance], [row])
+            memory = row[1]
+            if lo is None or memory < lo:
+                lo = memory
+            if memory > hi:
+                hi = memory
+            if row[3] is not None:
+                unseen.discard(0)
+        return first, last, lo, hi
+    
+    readings = iter(readings)
+    while 1:
+        rows = []
+        for reading in islice(readings, CHUNK_SIZE):
+            if first_timestamp is None:
+                first_timestamp = reading[2]
+                history_first, _, min_memory, max_memory = \
+                  add_history(first_timestamp)
+                if reading.rss is not None:
+                    stats = URLStats('rss')
+                else:
+                    stats = URLStats('memory')
+            stats.add(reading)
+            rows.append((reading[2], reading[1], reading[0]) + reading[3:])
+        if not rows:
+            break
+        
+        # the rest is done a chunk of rows at a time, which is a lot
+        # quicker than a row at a time
+        chunks.append(_write_chunk(chunk_dir, len(chunks), rows, urls))
+        last_timestamp = rows[-1][0]
+        memories = [row[1] for row in rows]
         if min_memory is None:
-            min_memory = memory
-        elif memory < min_memory:
-            min_memory = memory
-            
-        if memory > max_memory:
-            max_memory = memory
+            min_memory = min(memories)
+        else:
+            min_memory = min(min_memory, min(memories))
+        max_memory = max(max_memory, max(memories))
+        for i in list(unseen):
+            if [row[i + 3] for row in rows].count(None) < len(rows):
+                unseen.remove(i)
+        
+        if len(set([row[-1] for row in rows])) == 1:
+            by_instance = {rows[0][-1]: rows}
+        else:
+            by_instance = {}
+            for row in rows:
+                by_instance.setdefault(row[-1], []).append(row)
+        for instance, part in by_instance.iteritems():
+            if instance not in bucketers:
+                new_instance(instance)
+            kept = bucketers[instance].extend(part)
+            if kept:
+                add_overview(overviews[instance], kept)
+    if first_timestamp is None:
+        # nothing at full resolution
+        history_first, last_timestamp, min_memory, max_memory = \
+          add_history(None)
+        stats = URLStats()
+    if history_first is not None:
+        first_timestamp = history_first
+    parts = []
+    for instance in sorted(bucketers):
+        overview = overviews[instance]
+        add_overview(overview, bucketers[instance].flush())
+        parts.append(minmax(overview, OVERVIEW_BUCKETS, METRIC_COLUMNS))
+    if len(parts) == 1:
+        overview = parts[0]
+    else:
+        overview = list(heapq.merge(*parts))
     
-    html = html.replace('{{max_value}}', str(max_memory))
-    html = html.replace('{{min_value}}', str(min_memory))
-    html = html.replace('{{data_array}}', '[%s]' % ', '.join([str(x) for x in d]))
+    series = series_of(unseen, sorted(bucketers), instances)
+    
+    f = open(os.path.join(data_dir, 'overview.js'), 'w')
+    f.write('overviewLoaded({"max_value": %s, "min_value": %s,\n' % (
+      max_memory, min_memory))
+    f.write('"series": %s,\n' % json.dumps(series))
+    f.write('"chunks": %s,\n' % json.dumps(chunks))
+    f.write('"leaders": {"metric": %s, "rows": [%s]},\n' % (
+      json.dumps(METRIC_LABELS[METRICS.index(stats.metric)]),
+      ',\n'.join(['[%s,%s]' % (_js_string(uri_of(urls[row[0]])),
+                                json.dumps(row[1:]))
+                   for row in stats.top(TOP_URLS)])))
+    f.write('"d": [%s]});\n' % _js_rows(list(chain(*overview)),
+                                         len(overview)))
+    f.close()
+    return first_timestamp, last_timestamp
+
+
+def generate(marshal_file, first=None, last=None):
+    """ make a report of the readings in @marshal_file (a capture file, a
+    columnar file, a long term recording directory or an old marshal
+    dump) and return the path to its index.html, which is just the
+    template with the title filled in. With @first and/or @last, only of
+    the readings between those timestamps. """
+    readings, urls, instances = iter_readings(marshal_file, first, last)
+    history = ()
+    if os.path.isdir(marshal_file):
+        history = _history_rows(marshal_file)
+        if first is not None or last is not None:
+            history = [row for row in history
+                       if (first is None or row[0] >= first) and
+                          (last is None or row[0] <= last)]
     
-    title = _generate_title(first_timestamp, last_timestamp)
-    html = html.replace('{{title}}', title)
+    # the report goes in here until we know what its folder will be called
+    data_dir = tempfile.mkdtemp(dir='.')
+    try:
+        os.chmod(data_dir, 0755)
+        first_timestamp, last_timestamp = _write_data(readings, urls, data_dir,
+                                                      instances, history)
+        
+        title = _generate_title(first_timestamp, last_timestamp)
+        html = open(os.path.join(os.path.dirname(__file__), 'template.html')).read()
+        html = html.replace('{{title}}', title)
+        f = open(os.path.join(data_dir, 'index.html'), 'w')
+        f.write(html)
+        f.close()
+    except:
+        shutil.rmtree(data_dir)
+        raise
     
     save_dir = _title2foldername(title)
-    if not os.path.isdir(save_dir):
-        os.mkdir(save_dir)
-    open(os.path.join(save_dir, 'index.html'),'w').write(html)
+    if os.path.lexists(save_dir):
+        if not _is_report(save_dir):
+            shutil.rmtree(data_dir)
+            raise ValueError("%s is in the way and isn't a report" % save_dir)
+        shutil.rmtree(save_dir)
+    os.rename(data_dir, save_dir)
     
     report_file = os.path.join(save_dir, 'index.html')
     print report_file
     return report_file
 
 
+# what's in the directory of a report
+REPORT_FILES = ('index.html', 'overview.js', 'chunks')
+
+def _is_report(directory):
+    """ whether @directory is an earlier report that can be replaced,
+    i.e. has nothing but what generate() writes """
+    if os.path.islink(directory) or not os.path.isdir(directory):
+        return False
+    return not [name for name in os.listdir(directory)
+                if name not in REPORT_FILES]
+
+
 def _generate_title(first_timestamp, last_timestamp):
     date = datetime.datetime.fromtimestamp(first_timestamp)
     title = date.strftime('%Y/%m/%d %H:%M:%S')
@@ -70,4 +393,5 @@ def _title2foldername(title):
 
 if __name__=='__main__':
     import sys
-    sys.exit(generate(sys.argv[1]))
\ No newline at end of file
+    # the file and optionally the first and last timestamp to report on
+    sys.exit(generate(sys.argv[1], *[float(x) for x in sys.argv[2:4]]))
\ No newline at end of file
@@ -1,91 +1,454 @@
-import time, os, re
-import marshal
+import time, os, re, glob, stat, heapq, itertools
 
 
 from generate_graph import generate
+from tailer import open_tailer, multiplex
+from sampler import ProcSampler, RestartingSampler, SamplerThread, read_pid
+from record import make_reading, Event, Snapshot
+from capture import CaptureWriter
+from retention import RetentionStore, MAX_URLS
+from urltable import URLTable, strip_query, collapse_numbers
+from logparser import request_of
+from live import LiveFeed, LiveServer
+from leaks import LeakDetector, CommandHook, LogHook, FileHook
+from probe import ProbeListener
+from selfstats import MonitorStats, StatsReporter, SignalProfiler
 
 vmsize_regex = re.compile('VmSize:\s+(\d+)')
 def get_mem_size(pid):
-    out = open('/proc/%s/status' % pid).read()
+    f = open('/proc/%s/status' % pid)
+    try:
+        out = f.read()
+    finally:
+        f.close()
     return vmsize_regex.findall(out)[0]
 
-url_regex = re.compile(r'"(GET|POST) (.*?) HTTP', re.DOTALL)
 def get_url(logline):
-    try:
-        return url_regex.findall(logline)[0]
-    except IndexError:
+    """ the (method, uri) of the request of @logline, or the repr() of the
+    line if it doesn't look like one """
+    url = request_of(logline)
+    if url is None:
         return repr(logline)
+    return url
+
+def get_readings(filename, pid, long_term=False, tailer=None,
+                 proc_source='status', pss_every=0, urls=None,
+                 sample_rate=0, on_event=None):
+    """
+    return a generator of record.Reading tuples that look like this:
+    (12, 10000, 112356792.23656, 8000, 0, 6000, 2000, None, 0)
+    
+    where 12 is the id of the URL, e.g. ('GET','/some/url'), in the
+    urltable.URLTable @urls.
+    
+    Readings are only yielded when the memory changes. @long_term is
+    not used here, start() records differently when it's set.
+    
+    @tailer is the name of the tailer backend to follow the log with 
+    ('inotify' or 'poll'). By default the best available one is used.
+    
+    @proc_source is the file in /proc/<pid>/ the memory is read from,
+    'status' or the cheaper 'statm'.
+    
+    If @pss_every is set, Pss is read from /proc/<pid>/smaps_rollup every
+    @pss_every memory samples.
+    
+    The memory is sampled when a line is logged unless @sample_rate is
+    set, then it's sampled that many times a second in the background and
+    each change is put down to the next line logged.
+    
+    @pid can also be the name of the pid file, then a restarted Zope is
+    followed to its new pid. @on_event is called with a record.Event when
+    that happens and when the log is rotated or truncated.
+    """
+    return get_instance_readings([(filename, pid)], long_term=long_term,
+                                 tailer=tailer, proc_source=proc_source,
+                                 pss_every=pss_every, urls=urls,
+                                 sample_rate=sample_rate, on_event=on_event)
 
-#Set the filename and open the file
 
-#Find the size of the file and move to the end
-def get_readings(filename, pid, long_term=False):
+def get_instance_readings(instances, long_term=False, tailer=None,
+                          proc_source='status', pss_every=0, urls=None,
+                          sample_rate=0, on_event=None, probe=None,
+                          on_snapshot=None, stats=None, on_tick=None):
     """
-    return a generator of tuples that look like this:
-    (('GET','/some/url'), 10000, 112356792.23656)
+    like get_readings() but for several Zopes at once, all followed from
+    one loop. @instances is a list of (log filename, pid or pid file name)
+    and the instance of each reading is the index in that list of where it
+    came from.
     
-    If @long_term only yield readings of the memory changes
+    If @sample_rate is set the memory is sampled that many times a second
+    by a sampler.SamplerThread per Zope instead of when lines are logged.
+    
+    @probe is a probe.ProbeListener the Zopes send snapshots of their
+    insides to, and @on_snapshot is called with each one as a
+    record.Snapshot, at least every PROBE_SECONDS.
+    
+    @stats is a selfstats.MonitorStats to count the lines, samples and so
+    on in.
+    
+    @on_tick is called every time round the loop, and at least every
+    TICK_SECONDS when nothing's logged, e.g. to flush what's been
+    recorded.
     """
-    file = open(filename,'r')
-    st_results = os.stat(filename)
-    st_size = st_results[6]
-    file.seek(st_size)
-    
-    prev_timestamp = 0
-    prev_memory = 0
-    
-    while 1:
-        where = file.tell()
-        line = file.readline()
-        if not line:
-            time.sleep(1)
-            file.seek(where)
+    if urls is None:
+        urls = URLTable()
+    # the events are queued and handed to @on_event from the loop that
+    # yields the readings, as the sampler threads find restarts too
+    events = []
+    def deliver():
+        while events:
+            on_event(events.pop(0))
+        if probe is not None:
+            _deliver_snapshots(probe, samplers, on_snapshot)
+        if on_tick is not None:
+            on_tick()
+    tails = []
+    samplers = []
+    for instance, (filename, pid) in enumerate(instances):
+        tail = open_tailer(filename, backend=tailer)
+        if isinstance(pid, basestring):
+            sampler = RestartingSampler(pid, source=proc_source,
+                                        pss_every=pss_every)
         else:
-            timestamp = round(time.time(), 2)
+            sampler = ProcSampler(pid, source=proc_source,
+                                  pss_every=pss_every)
+        if on_event is not None:
+            _report_events(instance, tail, sampler, events.append)
+        tails.append(tail)
+        samplers.append(sampler)
+    if stats is not None:
+        stats.add_gauge('events', lambda: len(events))
+    if sample_rate:
+        # start sampling right away rather than on the first next()
+        threads = [SamplerThread(sampler, sample_rate)
+                   for sampler in samplers]
+        for thread in threads:
+            thread.start()
+        return _sampled_readings(tails, threads, urls, deliver, stats)
+    timeout = None
+    if probe is not None:
+        timeout = PROBE_SECONDS
+    if on_tick is not None:
+        timeout = min(timeout or TICK_SECONDS, TICK_SECONDS)
+    return _logged_readings(tails, samplers, urls, deliver, timeout, stats)
+
+
+# how often the snapshots of probe.py are looked for while nothing's
+# logged
+PROBE_SECONDS = 1.0
+
+# and how often on_tick is called
+TICK_SECONDS = 1.0
+
+def _deliver_snapshots(probe, samplers, on_snapshot):
+    """ call @on_snapshot with a record.Snapshot of each snapshot received
+    by the probe.ProbeListener @probe, with the instance whose sampler
+    in @samplers has its pid. Ones from other processes are dropped. """
+    snapshots = probe.receive()
+    if not snapshots:
+        return
+    pids = dict([(sampler.pid, instance)
+                 for instance, sampler in enumerate(samplers)])
+    for data in snapshots:
+        instance = pids.get(data.get('pid'))
+        if instance is not None:
+            on_snapshot(Snapshot(data.get('time', time.time()), instance,
+                                 data))
+
+
+def _report_events(instance, tail, sampler, on_event):
+    """ call @on_event with a record.Event when the log followed by @tail
+    is rotated or truncated and when the Zope sampled by @sampler is
+    restarted """
+    def reopened(kind):
+        on_event(Event(time.time(), instance, kind, tail.filename))
+    tail.on_reopen = reopened
+    if isinstance(sampler, RestartingSampler):
+        def restarted(old, new):
+            on_event(Event(time.time(), instance, 'restart',
+                           'pid %s -> %s' % (old, new)))
+        sampler.on_restart = restarted
+
+
+def _logged_readings(tails, samplers, urls, deliver, timeout=None,
+                     stats=None):
+    """ sample the memory when a line is logged, at most every 10ms. If
+    @timeout is set deliver() is called after that long with nothing
+    logged too. """
+    prev_timestamps = [0] * len(tails)
+    prev_memories = [None] * len(tails)
+    if stats is not None:
+        counts, seconds = stats.counts, stats.seconds
+    
+    for instance, lines in multiplex(tails, timeout=timeout):
+        deliver()
+        if instance is None:
+            continue
+        if stats is not None:
+            counts['lines'] += len(lines)
+        sampler = samplers[instance]
+        prev_timestamp = prev_timestamps[instance]
+        for line in lines:
+            now = time.time()
+            timestamp = round(now, 2)
             if timestamp > prev_timestamp:
                 prev_timestamp = timestamp
-                mem = int(get_mem_size(pid))
-                if mem != prev_memory:
-                    prev_memory = mem
-                    yield get_url(line), mem, timestamp
+                mem = sampler.sample()
+                if stats is not None:
+                    counts['samples'] += 1
+                    seconds['sample'] += time.time() - now
+                deliver()
+                if mem is not None and mem != prev_memories[instance]:
+                    prev_memories[instance] = mem
+                    if stats is None:
+                        url = get_url(line)
+                    else:
+                        started = time.time()
+                        url = get_url(line)
+                        seconds['get_url'] += time.time() - started
+                    yield make_reading(urls.intern(url), mem, timestamp,
+                                       instance)
+        prev_timestamps[instance] = prev_timestamp
+
+
+# the URL of the memory changes that no line was logged after for
+# STALL_SECONDS, e.g. when the Zope is stuck in a long request
+NO_REQUEST = '(nothing logged)'
+STALL_SECONDS = 1.0
+
+def _sampled_readings(tails, threads, urls, deliver, stats=None):
+    """ put each change in the memory sampled by the sampler.SamplerThread
+    @threads down to the first line logged after it. The readings of all
+    the instances come out in the order of their timestamps. """
+    seen = [0] * len(tails)
+    prev_memories = [None] * len(tails)
+    # per instance, the (timestamp, Memory) changes not yet put down to a
+    # line
+    pending = [[] for tail in tails]
+    # (timestamp, n, reading) of the changes put down to a line, held
+    # until no change pending of another instance can come before them
+    ready = []
+    order = itertools.count()
+    if stats is not None:
+        counts, seconds = stats.counts, stats.seconds
+        stats.add_source(lambda: {'samples': sum([t.count for t in threads]),
+                                  'sample': sum([t.busy for t in threads])})
+        # the samples taken but not looked at yet, and the changes not
+        # yielded yet
+        stats.add_gauge('samples', lambda: sum([t.count - n for t, n
+                                                in zip(threads, seen)]))
+        stats.add_gauge('changes',
+                        lambda: sum(map(len, pending)) + len(ready))
+    
+    def collect(instance):
+        count, samples = threads[instance].new_samples(seen[instance])
+        seen[instance] = count
+        for timestamp, mem in samples:
+            if mem != prev_memories[instance]:
+                prev_memories[instance] = mem
+                pending[instance].append((round(timestamp, 2), mem))
+    
+    def put_down(instance, url_id):
+        for timestamp, mem in pending[instance]:
+            heapq.heappush(ready, (timestamp, order.next(),
+                                   make_reading(url_id, mem, timestamp,
+                                                instance)))
+        pending[instance] = []
+    
+    def release():
+        for instance in range(len(tails)):
+            collect(instance)
+        waiting = [changes[0][0] for changes in pending if changes]
+        if waiting:
+            until = min(waiting)
+            while ready and ready[0][0] <= until:
+                yield heapq.heappop(ready)[2]
+        else:
+            while ready:
+                yield heapq.heappop(ready)[2]
+    
+    try:
+        for instance, lines in multiplex(tails, timeout=STALL_SECONDS):
+            deliver()
+            if instance is not None:
+                collect(instance)
+                if stats is not None:
+                    counts['lines'] += len(lines)
+                if pending[instance]:
+                    if stats is None:
+                        url = get_url(lines[0])
+                    else:
+                        started = time.time()
+                        url = get_url(lines[0])
+                        seconds['get_url'] += time.time() - started
+                    put_down(instance, urls.intern(url))
+            else:
+                # nothing's been logged for a while
+                now = time.time()
+                for instance in range(len(tails)):
+                    collect(instance)
+                    changes = pending[instance]
+                    if changes and now - changes[0][0] >= STALL_SECONDS:
+                        put_down(instance, urls.intern(NO_REQUEST))
+            for reading in release():
+                yield reading
+    finally:
+        for thread in threads:
+            thread.stop()
                 
     
 
-def start(zope_home, long_term=False, quiet=False):
+def start(zope_home, long_term=False, quiet=False, tailer=None,
+          proc_source='status', pss_every=0, url_rules=(), raw_hours=24,
+          sample_rate=0, live_port=None, leak_threshold=None,
+          leak_estimator='regression', alert_hooks=(), probe_address=None,
+          stats_interval=None, profile=False, profile_window=None):
+    """ record the readings of the Zope in the directory @zope_home, or of
+    all the Zopes if it's a list of directories, until Ctrl-C is hit and
+    then generate the report.
+    
+    If @long_term the readings go into a retention.RetentionStore which
+    keeps @raw_hours hours at full resolution and rolls up the rest.
+    
+    If @live_port is set the readings can also be watched as they come
+    in on http://localhost:<live_port>/ (see live.py).
+    
+    If @leak_threshold is set, in kB/hour, a leaks.LeakDetector watches
+    the readings and calls @alert_hooks with what it finds.
+    
+    If @probe_address is set the snapshots probe.py sends to that Unix
+    socket from inside the Zopes are recorded too.
+    
+    What the recording costs (see selfstats.py) is written to the end of
+    the capture, and to stderr every @stats_interval seconds if that's
+    set. With @profile, SIGUSR1 starts and stops profiling the recording
+    loop, or it stops after @profile_window seconds if that's set. """
+    if isinstance(zope_home, basestring):
+        zope_homes = [zope_home]
+    else:
+        zope_homes = zope_home
+    if not zope_homes:
+        raise ValueError("No Zope to record")
+    if long_term:
+        dump_file = '/tmp/zope-memory-readings'
+    else:
+        dump_file = '/tmp/zope-memory-readings.dat'
+    
+    instances = []
+    names = []
+    for zope_home in zope_homes:
+        filename = os.path.join(zope_home, 'log/Z2.log')
+        pid_filename = os.path.join(zope_home, 'var/Z2.pid')
+        pid = read_pid(pid_filename)
+        # followed through restarts by the pid file
+        instances.append((filename, pid_filename))
+        names.append(os.path.normpath(zope_home))
+        if not quiet:
+            if len(zope_homes) > 1:
+                print names[-1],
+            print "PID", pid
     
-    filename = os.path.join(zope_home, 'log/Z2.log')
-    pid_filename = os.path.join(zope_home, 'var/Z2.pid')
-    dump_file = '/tmp/zope-memory-readings.dat'
-
-
-    pid = open(pid_filename).read()
-    pid = int(pid)
     if not quiet:
-        print "PID", pid
         if long_term:
-            print "Running long term"
+            print "Running long term, keeping %d hours in full in %s" % (
+              raw_hours, dump_file)
 
         print "Hit Ctrl-C when you want to stop recording"
         print "Recording..."
     
-    readings = []
-    prev = None
+    probe = None
+    if probe_address is not None:
+        probe = ProbeListener(probe_address)
+        if not quiet:
+            print "Listening for probe.py on", probe_address
+    if long_term:
+        # every raw file has the whole table, see retention.py
+        urls = URLTable(url_rules, max_urls=MAX_URLS)
+        writer = RetentionStore(dump_file, urls, names, raw_hours=raw_hours)
+    else:
+        urls = URLTable(url_rules)
+        writer = CaptureWriter(dump_file, urls, names)
+    feed = server = None
+    if live_port is not None:
+        feed = LiveFeed(urls, names)
+        server = LiveServer(feed, live_port).start()
+        if not quiet:
+            print "Watch it live on http://localhost:%d/" % (
+              server.server_address[1])
+    detector = None
+    if leak_threshold is not None:
+        detector = LeakDetector(urls, leak_threshold,
+                                estimator=leak_estimator, hooks=alert_hooks)
+    stats = MonitorStats()
+    reporter = None
+    if stats_interval:
+        reporter = StatsReporter(stats, stats_interval)
+        reporter.start()
+    if profile:
+        SignalProfiler(window=profile_window).install()
+        if not quiet:
+            print "kill -USR1 %d to start and stop profiling" % os.getpid()
+    counts, seconds = stats.counts, stats.seconds
+    prev = [None] * len(instances)
+    def on_snapshot(snapshot):
+        counts['snapshots'] += 1
+        writer.write_snapshot(snapshot)
+    def on_event(event):
+        counts['events'] += 1
+        writer.write_event(event)
+        if not quiet:
+            if len(instances) > 1:
+                print names[event.instance],
+            print event.kind.upper(), event.detail
     try:
-        for reading in get_readings(filename, pid, long_term=long_term):
-            if not quiet:
-                print reading[1],
-                if prev is not None:
-                    if reading[1] > prev:
-                        print "+%d" % (reading[1]-prev)
-                    elif reading[1] < prev:
-                        print "%d" % (reading[1]-prev)
-                    else:
-                        print 
-                    
-            readings.append(reading)
-            prev = reading[1]
+        try:
+            for reading in get_instance_readings(instances,
+                                                 long_term=long_term,
+                                                 tailer=tailer,
+                                                 proc_source=proc_source,
+                                                 pss_every=pss_every,
+                                                 urls=urls,
+                                                 sample_rate=sample_rate,
+                                                 on_event=on_event,
+                                                 probe=probe,
+                                                 on_snapshot=on_snapshot,
+                                                 stats=stats,
+                                                 on_tick=writer.tick):
+                instance = reading.instance
+                if not quiet:
+                    if len(instances) > 1:
+                        print names[instance],
+                    print reading[1],
+                    if prev[instance] is not None:
+                        if reading[1] > prev[instance]:
+                            print "+%d" % (reading[1]-prev[instance])
+                        elif reading[1] < prev[instance]:
+                            print "%d" % (reading[1]-prev[instance])
+                        else:
+                            print 
+                        
+                started = time.time()
+                writer.write(reading)
+                seconds['write'] += time.time() - started
+                counts['readings'] += 1
+                if feed is not None:
+                    feed.add(reading)
+                if detector is not None:
+                    for alert in detector.add(reading):
+                        if not quiet:
+                            print "ALERT", alert.message
+                prev[instance] = reading[1]
+        finally:
+            if reporter is not None:
+                reporter.stop()
+            writer.write_footer(stats.report())
+            writer.close()
+            if server is not None:
+                server.stop()
+            if probe is not None:
+                probe.close()
     except KeyboardInterrupt:
-        marshal.dump(readings, open(dump_file, 'wb'))
         if not quiet:
             print "Generating graphs..."
         generate(dump_file)
@@ -135,30 +498,184 @@ class get_readings_app(CommandLineApp.CommandLineApp):
 
     long_term = False
     def optionHandler_long_term(self):
-        """ only record times when the memory usage changes """
+        """ record for days or weeks: keep the last hours in full and only
+        per minute and per hour rollups of what's older, so memory and disk
+        use stay bounded """
         self.long_term = True
         return
     optionHandler_L = optionHandler_long_term
+    
+    raw_hours = 24
+    def optionHandler_raw_hours(self, hours):
+        """ with --long-term, how many of the last hours to keep every
+        reading of (default 24). Older ones are only kept as per minute
+        and per hour rollups. """
+        self.raw_hours = int(hours)
+        return
+    
+    tailer = None
+    def optionHandler_tailer(self, backend):
+        """ how to follow the log file: 'inotify' or 'poll' (default is 
+        inotify when available) """
+        self.tailer = backend
+        return
+    
+    proc_source = 'status'
+    def optionHandler_statm(self):
+        """ read the memory size from /proc/<pid>/statm which is cheaper
+        than /proc/<pid>/status """
+        self.proc_source = 'statm'
+        return
+    
+    pss_every = 0
+    def optionHandler_pss_every(self, samples):
+        """ also record Pss (from /proc/<pid>/smaps_rollup) every this many
+        memory samples. It's expensive so don't make it too often. """
+        self.pss_every = int(samples)
+        return
+    
+    sample_rate = 0
+    def optionHandler_sample_rate(self, hz):
+        """ sample the memory this many times a second (e.g. 10 to 100) in
+        the background instead of when a line is logged, so memory moving
+        while nothing is logged is still recorded """
+        self.sample_rate = float(hz)
+        return
+    
+    live_port = None
+    def optionHandler_live(self, port):
+        """ watch the memory in a browser on http://localhost:<port>/
+        while recording """
+        self.live_port = int(port)
+        return
+    
+    leak_threshold = None
+    def optionHandler_leak_threshold(self, kb_per_hour):
+        """ watch for leaks while recording and raise an alert when the
+        memory grows faster than this many kB an hour, or a URL grows it
+        much more than the others do (see leaks.py) """
+        self.leak_threshold = float(kb_per_hour)
+        return
+    
+    leak_estimator = 'regression'
+    def optionHandler_theil_sen(self):
+        """ with --leak-threshold, fit the trend with Theil-Sen instead
+        of least squares so the odd spike doesn't raise an alert """
+        self.leak_estimator = 'theil-sen'
+        return
+    
+    def optionHandler_alert_command(self, command):
+        """ run this shell command for every alert, with the alert in
+        $ZMR_KIND, $ZMR_VALUE and $ZMR_MESSAGE """
+        self.alert_hooks.append(CommandHook(command))
+        return
+    
+    def optionHandler_alert_log(self, filename):
+        """ append a line to this file for every alert """
+        self.alert_hooks.append(LogHook(filename))
+        return
+    
+    def optionHandler_alert_dir(self, directory):
+        """ drop a JSON file into this directory for every alert """
+        self.alert_hooks.append(FileHook(directory))
+        return
+    
+    probe_address = None
+    def optionHandler_probe(self, address):
+        """ record the snapshots of ZODB caches, gc counts and types that
+        probe.py sends from inside the Zopes to this Unix socket (it sends
+        to /tmp/zope-memory-probe.sock by default) """
+        self.probe_address = address
+        return
+    
+    stats_interval = None
+    def optionHandler_stats(self, seconds):
+        """ print what the recording costs (lines and samples a second,
+        time spent sampling, parsing and writing, queues, RSS and CPU) to
+        stderr every this many seconds """
+        self.stats_interval = float(seconds)
+        return
+    
+    profile = False
+    def optionHandler_profile(self):
+        """ profile the recording with cProfile from one SIGUSR1 to the
+        next, into /tmp/zope-memory-profile-<time>.prof """
+        self.profile = True
+        return
+    
+    profile_window = None
+    def optionHandler_profile_window(self, seconds):
+        """ with --profile, stop profiling this many seconds after the
+        SIGUSR1 """
+        self.profile_window = float(seconds)
+        return
+    
+    def beforeOptionsHook(self):
+        self.url_rules = []
+        self.alert_hooks = []
+    
+    def optionHandler_strip_query(self):
+        """ record '/page?id=1' and '/page?id=2' as '/page' """
+        self.url_rules.append(strip_query)
+        return
+    
+    def optionHandler_collapse_numbers(self):
+        """ record '/issue/123/view' and '/issue/4/view' as '/issue/N/view' """
+        self.url_rules.append(collapse_numbers)
+        return
 
-    def main(self, zope_home):
-        """ Start! """
-        if not os.path.isdir(zope_home):
-            print "%s not a directory" % zope_home
+    def main(self, *zope_homes):
+        """ Start! Give it the directory of the Zope, or of several Zopes
+        (shell style wildcards are expanded) to monitor them all at once. """
+        if not zope_homes:
+            print "Usage: python %s /directory/of/zope [/another/zope ...]" % __file__
+            return 1
+        
+        expanded = []
+        for zope_home in zope_homes:
+            if glob.has_magic(zope_home):
+                expanded.extend(sorted(glob.glob(zope_home)))
+            else:
+                expanded.append(zope_home)
+        
+        if not expanded:
+            print "%s matched no directories" % ' '.join(zope_homes)
             print "Usage: python %s /directory/of/zope" % __file__
             return 2
-    
-        if not os.path.isfile(os.path.join(zope_home, 'log/Z2.log')):
-            print "%s does not have a 'log/Z2.log' file" % zope_home
-            print "Usage: python %s /directory/of/zope" % __file__
-            return 3
         
-        if not os.path.isfile(os.path.join(zope_home, 'var/Z2.pid')):
-            print "%s does not have a 'var/Z2.pid' file" % zope_home
-            print "Is the Zope running?"
-            print "Usage: python %s /directory/of/zope" % __file__
-            return 4
+        for zope_home in expanded:
+            if not os.path.isdir(zope_home):
+                print "%s not a directory" % zope_home
+                print "Usage: python %s /directory/of/zope" % __file__
+                return 2
+        
+            if not os.path.isfile(os.path.join(zope_home, 'log/Z2.log')):
+                print "%s does not have a 'log/Z2.log' file" % zope_home
+                print "Usage: python %s /directory/of/zope" % __file__
+                return 3
+            
+            if not os.path.isfile(os.path.join(zope_home, 'var/Z2.pid')):
+                print "%s does not have a 'var/Z2.pid' file" % zope_home
+                print "Is the Zope running?"
+                print "Usage: python %s /directory/of/zope" % __file__
+                return 4
+        
+        if self.probe_address is not None and \
+           os.path.lexists(self.probe_address) and \
+           not stat.S_ISSOCK(os.lstat(self.probe_address).st_mode):
+            print "%s exists and isn't a socket" % self.probe_address
+            return 5
         
-        start(zope_home, long_term=self.long_term, quiet=self.verbose_level==0)
+        start(expanded, long_term=self.long_term, quiet=self.verbose_level==0,
+              tailer=self.tailer, proc_source=self.proc_source,
+              pss_every=self.pss_every, url_rules=self.url_rules,
+              raw_hours=self.raw_hours, sample_rate=self.sample_rate,
+              live_port=self.live_port, leak_threshold=self.leak_threshold,
+              leak_estimator=self.leak_estimator,
+              alert_hooks=self.alert_hooks,
+              probe_address=self.probe_address,
+              stats_interval=self.stats_interval, profile=self.profile,
+              profile_window=self.profile_window)
         
         
 if __name__=='__main__':
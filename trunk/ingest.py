@@ -0,0 +1,285 @@
+"""
+Read a month of rotated Z2.logs on all the cores.
+
+The logs are cut into work units: every gzipped file is one (gzip can't
+be read from the middle) and plain files are cut into byte ranges of
+@chunk_bytes, moved on to the next line boundary. Each unit is parsed in
+a worker process, which interns the URLs into a table of its own and adds
+up per URL:
+
+  hits      the number of requests
+  bytes     the bytes sent
+  errors    the responses with a 5xx status
+  seconds   the total duration, if the log has it (--duration)
+  slowest   the longest duration
+
+The tables and totals of the units are then merged in the order of the
+units, so the URL ids and the totals come out the same however many
+workers there are, including one.
+
+ $ python ingest.py [--workers=N] [--duration=D|T] Z2.log*
+"""
+import os
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    # Python 2 without the futures backport
+    ProcessPoolExecutor = None
+
+from urltable import URLTable, uri_of, strip_query, collapse_numbers
+from logparser import parse_line
+from replay import BLOCK_SIZE, open_log, log_files_in_order
+
+# the columns of the per URL totals
+COLUMNS = ('hits', 'bytes', 'errors', 'seconds', 'slowest')
+
+_HITS, _BYTES, _ERRORS, _SECONDS, _SLOWEST = range(5)
+
+# plain files are cut into ranges of this many bytes
+CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def work_units(filenames, chunk_bytes=CHUNK_BYTES):
+    """ return the (filename, start, end) work units of the log files
+    @filenames in time order. end is None for a whole file. """
+    units = []
+    for filename in log_files_in_order(filenames):
+        if filename.endswith('.gz'):
+            units.append((filename, 0, None))
+            continue
+        size = os.path.getsize(filename)
+        for start in xrange(0, size, chunk_bytes):
+            units.append((filename, start, min(start + chunk_bytes, size)))
+    return units
+
+
+def _read_unit(filename, start, end):
+    """ generator of the blocks of the lines that start in the byte range
+    @start to @end of @filename (all of it if @end is None) """
+    f = open_log(filename)
+    try:
+        if end is None:
+            while 1:
+                block = f.read(BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+            return
+        if start:
+            # the line that's cut in two belongs to the unit before, unless
+            # the cut is right after a newline
+            f.seek(start - 1)
+            f.readline()
+        pos = f.tell()
+        block = ''
+        while pos < end:
+            block = f.read(min(BLOCK_SIZE, end - pos))
+            if not block:
+                return
+            pos += len(block)
+            yield block
+        if block and not block.endswith('\n'):
+            yield f.readline()
+    finally:
+        f.close()
+
+
+def ingest_unit(unit, duration=None, url_rules=()):
+    """ parse the work unit @unit, a (filename, start, end), and return
+    (urls, totals): the list of URLs seen and the list of totals (see
+    COLUMNS) of each of them """
+    urls = URLTable(url_rules)
+    totals = []
+    intern = urls.intern
+    def add(lines):
+        for line in lines:
+            record = parse_line(line, duration)
+            if record is None:
+                continue
+            if record.method is None:
+                id = intern(record.uri)
+            else:
+                id = intern((record.method, record.uri))
+            if id == len(totals):
+                totals.append([0, 0, 0, 0.0, None])
+            t = totals[id]
+            t[_HITS] += 1
+            t[_BYTES] += record.size
+            if record.status >= 500:
+                t[_ERRORS] += 1
+            took = record.duration
+            if took is not None:
+                t[_SECONDS] += took
+                if t[_SLOWEST] is None or took > t[_SLOWEST]:
+                    t[_SLOWEST] = took
+    rest = ''
+    for block in _read_unit(*unit):
+        lines = (rest + block).split('\n')
+        rest = lines.pop()
+        add(lines)
+    if rest:
+        add([rest])
+    return urls.urls, totals
+
+
+def _ingest_unit(args):
+    # what the workers run, it has to be picklable
+    return ingest_unit(*args)
+
+
+def _map_units(args, workers):
+    """ generator of the _ingest_unit() of each of @args, in order, run in
+    @workers processes """
+    if workers <= 1 or len(args) <= 1:
+        for a in args:
+            yield _ingest_unit(a)
+        return
+    if ProcessPoolExecutor is not None:
+        executor = ProcessPoolExecutor(workers)
+        try:
+            for result in executor.map(_ingest_unit, args):
+                yield result
+        finally:
+            executor.shutdown()
+        return
+    import multiprocessing
+    pool = multiprocessing.Pool(workers)
+    try:
+        for result in pool.imap(_ingest_unit, args):
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def merge_totals(total, other):
+    """ add the totals @other of a URL to @total """
+    total[_HITS] += other[_HITS]
+    total[_BYTES] += other[_BYTES]
+    total[_ERRORS] += other[_ERRORS]
+    total[_SECONDS] += other[_SECONDS]
+    slowest = other[_SLOWEST]
+    if slowest is not None and (total[_SLOWEST] is None or
+                                slowest > total[_SLOWEST]):
+        total[_SLOWEST] = slowest
+
+
+def ingest(filenames, duration=None, url_rules=(), workers=None,
+           chunk_bytes=CHUNK_BYTES):
+    """ return (urls, totals) of the log files @filenames: a
+    urltable.URLTable and a list of the totals (see COLUMNS) of each URL
+    id in it.
+
+    @duration is the format of the duration field of the log, see
+    logparser.parse_line(), and @url_rules the normalisations of the URLs.
+    The work is spread over @workers processes, as many as there are CPUs
+    if it's None.
+    """
+    if workers is None:
+        import multiprocessing
+        workers = multiprocessing.cpu_count()
+    urls = URLTable(url_rules)
+    totals = []
+    args = [(unit, duration, tuple(url_rules))
+            for unit in work_units(filenames, chunk_bytes)]
+    for unit_urls, unit_totals in _map_units(args, workers):
+        for url, t in zip(unit_urls, unit_totals):
+            id = urls.intern(url)
+            if id == len(totals):
+                totals.append(list(t))
+            else:
+                merge_totals(totals[id], t)
+    return urls, totals
+
+
+def print_totals(urls, totals, n=20, key='hits'):
+    """ print the @n URLs of @urls with the biggest @key (one of COLUMNS)
+    of @totals """
+    i = COLUMNS.index(key)
+    ids = sorted(xrange(len(totals)), key=lambda id: (totals[id][i], -id),
+                 reverse=True)
+    print "%8s %12s %8s %10s %8s  %s" % (
+      'hits', 'bytes', 'errors', 'seconds', 'slowest', 'URI')
+    for id in ids[:n]:
+        hits, size, errors, seconds, slowest = totals[id]
+        if slowest is None:
+            slowest = '-'
+        else:
+            slowest = '%.2f' % slowest
+        print "%8d %12d %8d %10.1f %8s  %s" % (
+          hits, size, errors, seconds, slowest, uri_of(urls[id]))
+
+
+#### The command line handler ##################################################
+
+import CommandLineApp
+
+class ingest_app(CommandLineApp.CommandLineApp):
+    """ print the busiest URLs of a lot of Z2.log files, read in parallel
+    """
+
+    workers = None
+    def optionHandler_workers(self, n):
+        """ how many processes to read the logs with (default one per
+        CPU) """
+        self.workers = int(n)
+        return
+
+    duration = None
+    def optionHandler_duration(self, format):
+        """ the last field of every log line is the duration of the
+        request: D in microseconds (Apache's %D) or T in seconds (%T) """
+        if format not in ('D', 'T'):
+            raise ValueError("The duration is either D or T, not %r" % format)
+        self.duration = format
+        return
+
+    top = 20
+    def optionHandler_top(self, n):
+        """ how many URLs to show (default 20) """
+        self.top = int(n)
+        return
+
+    sort = 'hits'
+    def optionHandler_sort(self, column):
+        """ what to sort by: hits (the default), bytes, errors, seconds or
+        slowest """
+        if column not in COLUMNS:
+            raise ValueError("Can't sort by %r" % column)
+        self.sort = column
+        return
+
+    def beforeOptionsHook(self):
+        self.url_rules = []
+
+    def optionHandler_strip_query(self):
+        """ count '/page?id=1' and '/page?id=2' as '/page' """
+        self.url_rules.append(strip_query)
+        return
+
+    def optionHandler_collapse_numbers(self):
+        """ count '/issue/123/view' and '/issue/4/view' as '/issue/N/view' """
+        self.url_rules.append(collapse_numbers)
+        return
+
+    def main(self, *log_filenames):
+        """ Start! """
+        if not log_filenames:
+            print "No log files given"
+            return 3
+        for filename in log_filenames:
+            if not os.path.isfile(filename):
+                print "%s is not a file" % filename
+                return 2
+        urls, totals = ingest(log_filenames, self.duration, self.url_rules,
+                              self.workers)
+        print_totals(urls, totals, self.top, self.sort)
+        return 0
+
+
+if __name__=='__main__':
+    ingest_app().run()
@@ -0,0 +1,486 @@
+"""
+Spot a leak while it's happening instead of in the graph afterwards.
+
+LeakDetector is fed the readings as they're recorded and raises an
+Alert when:
+
+  growth  the trend of the memory over the last @window seconds, a least
+          squares fit (or Theil-Sen, which shrugs off the odd spike),
+          grows faster than @threshold kB an hour
+
+  cusum   the memory has grown @cusum_kb more than half the threshold
+          growth rate explains since it last stopped growing (a CUSUM,
+          which catches a leak starting long before the trend of the
+          whole window does)
+
+  url     after @min_hits hits of a URL, either the memory deltas of
+          its readings are on average well above those of the other
+          URLs, or a regression of the change of the memory from bucket
+          to bucket on its hits in between has a slope well above
+          nothing and grows the memory faster than @threshold by
+          itself. The first one is the sharper when the memory moves in
+          steps, the second when every reading is noisy: a single delta
+          is then mostly noise, while a bucket's mean is not. The
+          changes are only compared within blocks of a few buckets, so
+          the whole memory starting to grow isn't put down to a URL.
+          "Well above" is @z_limit standard errors, raised with the
+          number of URLs so that hundreds of them don't make false
+          alarms by chance.
+
+The readings are added up into @buckets buckets per window, so the work
+per reading and the memory used are the same however long it runs.
+Alerts go to hooks: any callable that takes an Alert, e.g. CommandHook,
+LogHook or FileHook. Each kind of alert is only raised once every
+@cooldown seconds per instance (and per URL).
+"""
+import os
+import json
+import math
+import time
+import subprocess
+from collections import deque, namedtuple
+
+from record import Reading
+from urltable import uri_of
+
+HOUR = 3600.0
+
+# @value is the growth in kB/hour, the CUSUM in kB or the z-score and @url
+# the URI of a 'url' alert
+Alert = namedtuple('Alert', 'kind instance timestamp value url message')
+
+
+class _Bucket(object):
+    """ the sums of the readings in a bucket starting at @start, with the
+    timestamps relative to that """
+
+    __slots__ = ('start', 'n', 'st', 'sv', 'stt', 'stv')
+
+    def __init__(self, start):
+        self.start = start
+        self.n = 0
+        self.st = self.sv = self.stt = self.stv = 0.0
+
+    def add(self, t, v):
+        t -= self.start
+        self.n += 1
+        self.st += t
+        self.sv += v
+        self.stt += t * t
+        self.stv += t * v
+
+    def mean(self):
+        """ (mean timestamp, mean value) """
+        return self.start + self.st / self.n, self.sv / self.n
+
+
+def regression_slope(buckets):
+    """ the least squares slope through all the readings in @buckets, per
+    second, or None """
+    if not buckets:
+        return None
+    origin = buckets[0].start
+    n = st = sv = stt = stv = 0.0
+    for b in buckets:
+        # move the sums of the bucket to the common origin
+        d = b.start - origin
+        n += b.n
+        st += b.st + b.n * d
+        sv += b.sv
+        stt += b.stt + 2 * d * b.st + b.n * d * d
+        stv += b.stv + d * b.sv
+    denominator = n * stt - st * st
+    if n < 2 or denominator <= 0:
+        return None
+    return (n * stv - st * sv) / denominator
+
+
+def theil_sen_slope(buckets):
+    """ the median of the slopes between every two bucket means in
+    @buckets, per second, or None """
+    points = [b.mean() for b in buckets]
+    slopes = []
+    for i in xrange(len(points)):
+        t1, v1 = points[i]
+        for j in xrange(i + 1, len(points)):
+            t2, v2 = points[j]
+            if t2 != t1:
+                slopes.append((v2 - v1) / (t2 - t1))
+    if not slopes:
+        return None
+    slopes.sort()
+    middle = len(slopes) // 2
+    if len(slopes) % 2:
+        return slopes[middle]
+    return (slopes[middle - 1] + slopes[middle]) / 2.0
+
+
+ESTIMATORS = {'regression': regression_slope, 'theil-sen': theil_sen_slope}
+
+# the changes of the memory from bucket to bucket are only compared with
+# the others in their block of this many, so the memory as a whole growing
+# faster or slower for a while isn't put down to the URLs hit more then
+BLOCK = 5
+
+
+class _Trend(object):
+    """ the buckets, CUSUM and so on of one instance """
+
+    def __init__(self):
+        self.buckets = deque()
+        self.current = None
+        self.cusum = 0.0
+        self.prev_mean = None
+        # the hits of the URLs in the current bucket and the one before,
+        # {url id: [hits, sum of how far into the bucket they came]}
+        self.hits = {}
+        self.prev_hits = {}
+        # the (change, {url id: x}) of the current block
+        self.block = []
+
+
+class _Deltas(object):
+    """ the count, mean and sum of squared differences from the mean
+    (Welford's) of some deltas """
+
+    __slots__ = ('n', 'mean', 'm2')
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+
+    def variance(self):
+        if self.n < 2:
+            return 0.0
+        return self.m2 / (self.n - 1)
+
+    def without(self, part):
+        """ (n, mean, variance) of these deltas less the ones of @part """
+        n = self.n - part.n
+        if n < 2:
+            return n, 0.0, 0.0
+        mean = (self.n * self.mean - part.n * part.mean) / n
+        d = part.mean - mean
+        m2 = self.m2 - part.m2 - d * d * part.n * n / self.n
+        return n, mean, max(0.0, m2 / (n - 1))
+
+
+class _Fit(object):
+    """ the sums for the least squares fit of the changes of the memory
+    from one bucket to the next on the hits of one URL in between them, x,
+    each less the mean of its block: the sum of x, and the sums of the
+    squares of x and of x times the change less their block means. The
+    changes themselves are summed up by the LeakDetector. """
+
+    __slots__ = ('sx', 'sxx', 'sxy')
+
+    def __init__(self):
+        self.sx = self.sxx = self.sxy = 0.0
+
+    def t(self, syy, dof):
+        """ (slope, t statistic) given @syy, the sum of the squares of the
+        changes less their block means, and the degrees of freedom @dof
+        they leave """
+        if self.sxx <= 1e-9 or dof < 2:
+            return 0.0, 0.0
+        slope = self.sxy / self.sxx
+        residual = (syy - slope * self.sxy) / (dof - 1)
+        if residual <= 0:
+            return slope, 0.0
+        return slope, slope / math.sqrt(residual / self.sxx)
+
+
+class LeakDetector(object):
+    """ raise Alerts about the readings added with add(), see the top of
+    the module. @urls is the urltable.URLTable of the URL ids, @metric the
+    name of the memory metric to use (one of record.METRICS) and @hooks
+    what to call with each Alert. """
+
+    def __init__(self, urls, threshold=1024.0, window=HOUR, buckets=60,
+                 estimator='regression', cusum_kb=4096.0, z_limit=4.0,
+                 min_hits=20, metric='memory', cooldown=600.0, hooks=()):
+        self.urls = urls
+        self.threshold = threshold
+        self.window = window
+        self.bucket_seconds = float(window) / buckets
+        self.slope = ESTIMATORS[estimator]
+        self.cusum_kb = cusum_kb
+        self.z_limit = z_limit
+        self.min_hits = min_hits
+        self.index = Reading._fields.index(metric)
+        self.cooldown = cooldown
+        self.hooks = list(hooks)
+        # per instance
+        self.trends = {}
+        self.prev = {}
+        # the deltas of all URLs and of each one
+        self.deltas = _Deltas()
+        self.url_deltas = {}
+        # what a URL's z-score has to be over, see _url_limit()
+        self.url_limit = z_limit
+        # the blocks of changes from bucket to bucket over the last window
+        # as (start, changes, syy, {url id: (sx, sxx, sxy)}), see _Fit,
+        # and the sums of them all
+        self.blocks = deque()
+        self.changes = 0
+        self.syy = 0.0
+        self.url_fits = {}
+        # when each (kind, instance, url) was last raised
+        self.raised = {}
+
+    def add(self, reading):
+        """ account for the record.Reading @reading and return the
+        Alerts it raised, after calling the hooks with them """
+        value = reading[self.index]
+        if value is None:
+            return []
+        timestamp = reading[2]
+        instance = reading.instance
+        alerts = []
+        try:
+            trend = self.trends[instance]
+        except KeyError:
+            trend = self.trends[instance] = _Trend()
+        current = trend.current
+        if current is None or \
+           timestamp >= current.start + self.bucket_seconds:
+            if current is not None:
+                self._close_bucket(trend, instance, timestamp, alerts)
+            start = timestamp - timestamp % self.bucket_seconds
+            current = trend.current = _Bucket(start)
+        current.add(timestamp, value)
+        url = reading[0]
+        try:
+            hits = trend.hits[url]
+        except KeyError:
+            hits = trend.hits[url] = [0, 0.0]
+        hits[0] += 1
+        hits[1] += (timestamp - current.start) / self.bucket_seconds
+
+        prev = self.prev.get(instance)
+        self.prev[instance] = value
+        if prev is not None:
+            self._add_delta(url, value - prev, instance, timestamp, alerts)
+        for alert in alerts:
+            for hook in self.hooks:
+                hook(alert)
+        return alerts
+
+    def _close_bucket(self, trend, instance, timestamp, alerts):
+        bucket = trend.current
+        buckets = trend.buckets
+        buckets.append(bucket)
+        while buckets[0].start <= bucket.start - self.window:
+            buckets.popleft()
+        # not much of a trend until half the window's in
+        span = buckets[-1].start - buckets[0].start + self.bucket_seconds
+        if span >= self.window / 2.0:
+            slope = self.slope(buckets)
+            if slope is not None and slope * HOUR > self.threshold:
+                self._raise(alerts, 'growth', instance, timestamp,
+                            slope * HOUR, None,
+                            "memory growing %.0f kB/hour over the last "
+                            "%.0f minutes" % (slope * HOUR, span / 60.0))
+
+        mean = bucket.mean()[1]
+        if trend.prev_mean is not None:
+            self._add_change(trend, mean - trend.prev_mean, instance,
+                             timestamp, alerts)
+            # what's allowed per bucket is half the threshold
+            allowed = self.threshold * self.bucket_seconds / HOUR / 2.0
+            trend.cusum = max(0.0, trend.cusum + mean - trend.prev_mean -
+                                   allowed)
+            if trend.cusum > self.cusum_kb:
+                self._raise(alerts, 'cusum', instance, timestamp,
+                            trend.cusum, None,
+                            "memory grew %.0f kB more than expected" %
+                            trend.cusum)
+                trend.cusum = 0.0
+        trend.prev_mean = mean
+        trend.prev_hits, trend.hits = trend.hits, {}
+
+    def _add_delta(self, url, delta, instance, timestamp, alerts):
+        self.deltas.add(delta)
+        try:
+            deltas = self.url_deltas[url]
+        except KeyError:
+            deltas = self.url_deltas[url] = _Deltas()
+            self.url_limit = self._url_limit()
+        deltas.add(delta)
+        if deltas.n < self.min_hits:
+            return
+        # against the other URLs, as a leaking one moves the mean and the
+        # spread of all of them
+        n, mean, variance = self.deltas.without(deltas)
+        excess = deltas.mean - mean
+        if n < 2 or excess <= 0:
+            return
+        error = math.sqrt(variance / deltas.n + variance / n)
+        if error and excess / error > self.url_limit:
+            self._raise_url(alerts, url, instance, timestamp, excess / error,
+                            excess, deltas.n)
+
+    def _add_change(self, trend, change, instance, timestamp, alerts):
+        """ fit @change, the change of the mean from the bucket before to
+        the one just finished, on the hits of each URL in between """
+        # a hit moves the mean of its own bucket by how much of the bucket
+        # is after it, and the next one by the rest
+        xs = {}
+        for url, (count, into) in trend.hits.iteritems():
+            xs[url] = count - into
+        for url, (count, into) in trend.prev_hits.iteritems():
+            xs[url] = xs.get(url, 0.0) + into
+        trend.block.append((change, xs))
+        if len(trend.block) < BLOCK:
+            return
+        changes, trend.block = trend.block, []
+
+        m = float(len(changes))
+        sy = syy = 0.0
+        sums = {}
+        for y, xs in changes:
+            sy += y
+            syy += y * y
+            for url, x in xs.iteritems():
+                try:
+                    s = sums[url]
+                except KeyError:
+                    s = sums[url] = [0.0, 0.0, 0.0]
+                s[0] += x
+                s[1] += x * x
+                s[2] += x * y
+        for url, (sx, sxx, sxy) in sums.items():
+            sums[url] = sx, sxx - sx * sx / m, sxy - sx * sy / m
+        start = trend.current.start
+        block = start, len(changes), syy - sy * sy / m, sums
+        blocks = self.blocks
+        blocks.append(block)
+        self._fit(block, 1)
+        while blocks[0][0] <= start - self.window:
+            self._fit(blocks.popleft(), -1)
+
+        # not much of a fit until half the window's in, and with hundreds
+        # of URLs the odd one is bound to look significant, so it has to
+        # matter as well: grow the memory faster than the threshold by
+        # itself
+        if self.changes < self.window / self.bucket_seconds / 2.0:
+            return
+        dof = self.changes - len(blocks)
+        per_hour = HOUR / self.bucket_seconds / self.changes
+        for url in sums:
+            deltas = self.url_deltas.get(url)
+            if deltas is None or deltas.n < self.min_hits:
+                continue
+            fit = self.url_fits[url]
+            slope, t = fit.t(self.syy, dof)
+            if t > self.url_limit and \
+               slope * fit.sx * per_hour > self.threshold:
+                self._raise_url(alerts, url, instance, timestamp, t, slope,
+                                deltas.n)
+
+    def _fit(self, block, sign):
+        """ add the sums of @block to the fits, or take them out with a
+        @sign of -1 """
+        start, changes, syy, sums = block
+        self.changes += sign * changes
+        self.syy += sign * syy
+        fits = self.url_fits
+        for url, (sx, sxx, sxy) in sums.iteritems():
+            try:
+                fit = fits[url]
+            except KeyError:
+                fit = fits[url] = _Fit()
+            fit.sx += sign * sx
+            fit.sxx += sign * sxx
+            fit.sxy += sign * sxy
+
+    def _url_limit(self):
+        """ @z_limit raised for the number of URLs, so that one of them
+        crossing it by chance is about as likely as a single z-score
+        crossing @z_limit: the chance of that falls about as fast as
+        exp(-z**2 / 2) """
+        urls = max(1, len(self.url_deltas))
+        return math.sqrt(self.z_limit ** 2 + 2 * math.log(urls))
+
+    def _raise_url(self, alerts, url, instance, timestamp, z, kb, hits):
+        uri = uri_of(self.urls[url])
+        self._raise(alerts, 'url', instance, timestamp, z, url,
+                    "%s grows the memory %.1f kB a hit more than the other "
+                    "URLs (z=%.1f, %d hits)" % (uri, kb, z, hits), uri)
+
+    def _raise(self, alerts, kind, instance, timestamp, value, url, message,
+               uri=None):
+        key = kind, instance, url
+        last = self.raised.get(key)
+        if last is not None and timestamp - last < self.cooldown:
+            return
+        self.raised[key] = timestamp
+        alerts.append(Alert(kind, instance, timestamp, value, uri, message))
+
+
+class CommandHook(object):
+    """ run the shell command @command for every alert, with the alert in
+    the environment as ZMR_KIND, ZMR_INSTANCE, ZMR_TIMESTAMP, ZMR_VALUE
+    and ZMR_MESSAGE. The command isn't waited for. """
+
+    def __init__(self, command):
+        self.command = command
+        self.running = []
+
+    def __call__(self, alert):
+        # reap the ones that have finished
+        self.running = [p for p in self.running if p.poll() is None]
+        env = dict(os.environ)
+        env.update({'ZMR_KIND': alert.kind,
+                    'ZMR_INSTANCE': str(alert.instance),
+                    'ZMR_TIMESTAMP': '%.2f' % alert.timestamp,
+                    'ZMR_VALUE': '%.1f' % alert.value,
+                    'ZMR_MESSAGE': alert.message})
+        self.running.append(subprocess.Popen(self.command, shell=True,
+                                             env=env))
+
+
+class LogHook(object):
+    """ append a line for every alert to the file @filename """
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __call__(self, alert):
+        f = open(self.filename, 'a')
+        try:
+            f.write('%s %s [%s] %s\n' % (
+              time.strftime('%Y-%m-%d %H:%M:%S',
+                            time.localtime(alert.timestamp)),
+              alert.kind, alert.instance, alert.message))
+        finally:
+            f.close()
+
+
+class FileHook(object):
+    """ drop a JSON file of every alert into @directory, for whatever
+    watches it to pick up """
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def __call__(self, alert):
+        name = 'alert-%.2f-%s-%s.json' % (alert.timestamp, alert.kind,
+                                          alert.instance)
+        filename = os.path.join(self.directory, name)
+        # written to the side first so nothing ever sees half a file
+        f = open(filename + '.tmp', 'w')
+        try:
+            json.dump(alert._asdict(), f)
+        finally:
+            f.close()
+        os.rename(filename + '.tmp', filename)
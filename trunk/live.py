@@ -0,0 +1,259 @@
+"""
+Watch the memory in a browser while get_readings.py is still recording.
+
+With --live=PORT get_readings.py serves the report page on
+http://localhost:PORT/ from a thread of its own. The page starts with
+what has been recorded so far: the last RECENT_ROWS readings at full
+resolution and a min/max downsampled overview of everything before them.
+After that the new readings are pushed to it with Server-Sent Events,
+every BATCH_INTERVAL seconds, and flotter.js appends them to the plot.
+
+Everything the server keeps is bounded, so it can run for as long as
+the recording does.
+"""
+import os
+import json
+import time
+import heapq
+import threading
+import BaseHTTPServer
+import SocketServer
+
+from record import METRICS
+from ringbuffer import RingBuffer
+from downsample import minmax, StreamingMinMax
+from urltable import uri_of
+from generate_graph import series_of, BUCKET_ROWS, OVERVIEW_BUCKETS, \
+  METRIC_COLUMNS
+
+# how many of the last readings are kept at full resolution
+RECENT_ROWS = 20000
+# new readings are sent to the browsers this often, in seconds
+BATCH_INTERVAL = 0.5
+# and something is sent at least this often to keep the connection open
+KEEPALIVE_INTERVAL = 15.0
+
+# the files of the report page that are served as they are
+STATIC_FILES = ('jquery.js', 'flotter.js', 'layout.css',
+                'flot/jquery.flot.js', 'flot/excanvas.pack.js')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _json_row(row):
+    # URLs are whatever bytes were logged
+    uri = row[2]
+    if uri is not None:
+        row = row[:2] + (uri.decode('utf-8', 'replace'),) + row[3:]
+    return json.dumps(row)
+
+
+class LiveFeed(object):
+    """ the readings to show live. add() is called by the recording loop
+    and the server threads read what's been added with new_rows() and
+    backfill().
+
+    @urls is the urltable.URLTable the URL ids of the readings come from
+    and @instances the names of the Zope instances. The last @recent
+    readings are kept as rows like the ones of the report, (timestamp,
+    VmSize, uri, the other metrics..., instance).
+    """
+
+    def __init__(self, urls, instances=('',), recent=RECENT_ROWS):
+        self.urls = urls
+        self.instances = list(instances)
+        self.recent = RingBuffer(recent)
+        # how many rows have been added, ever
+        self.count = 0
+        self.lock = threading.Lock()
+        # per instance, the overview rows and what's bucketing them
+        self.overviews = {}
+        self.bucketers = {}
+        self.unseen = set(range(len(METRICS) - 1))
+        self.min_memory = None
+        self.max_memory = 0
+
+    def add(self, reading):
+        """ add the record.Reading @reading """
+        timestamp, memory, instance = reading[2], reading[1], reading[-1]
+        uri = uri_of(self.urls[reading[0]])
+        row = (round(timestamp, 2), memory, uri) + tuple(reading[3:])
+        lock = self.lock
+        lock.acquire()
+        try:
+            self.recent.append(row)
+            self.count += 1
+            try:
+                bucketer = self.bucketers[instance]
+            except KeyError:
+                bucketer = self.bucketers[instance] = StreamingMinMax(
+                  BUCKET_ROWS, METRIC_COLUMNS)
+                self.overviews[instance] = []
+            kept = bucketer.add(row[:2] + (None,) + row[3:])
+            if kept:
+                overview = self.overviews[instance]
+                overview.extend(kept)
+                if len(overview) > 8 * OVERVIEW_BUCKETS * len(METRIC_COLUMNS):
+                    overview[:] = minmax(overview, 2 * OVERVIEW_BUCKETS,
+                                         METRIC_COLUMNS)
+            if self.unseen:
+                for i in list(self.unseen):
+                    if reading[3 + i] is not None:
+                        self.unseen.remove(i)
+            if self.min_memory is None or memory < self.min_memory:
+                self.min_memory = memory
+            if memory > self.max_memory:
+                self.max_memory = memory
+        finally:
+            lock.release()
+
+    def new_rows(self, seen):
+        """ return (count, rows): how many rows there have been and the
+        ones after the first @seen of them that are still kept """
+        self.lock.acquire()
+        try:
+            count = self.count
+            return count, self.recent.last(count - seen)
+        finally:
+            self.lock.release()
+
+    def backfill(self):
+        """ return (count, data) where data is what overviewLoaded() in
+        flotter.js takes, with the overview of the readings that are no
+        longer kept followed by the ones that are, and count how many
+        rows there have been """
+        self.lock.acquire()
+        try:
+            count = self.count
+            recent = list(self.recent)
+            parts = []
+            for instance in sorted(self.overviews):
+                parts.append(minmax(self.overviews[instance], OVERVIEW_BUCKETS,
+                                    METRIC_COLUMNS))
+            series = series_of(self.unseen, sorted(self.bucketers),
+                               self.instances)
+            min_memory, max_memory = self.min_memory, self.max_memory
+        finally:
+            self.lock.release()
+        rows = list(heapq.merge(*parts))
+        if recent:
+            first = recent[0][0]
+            rows = [row for row in rows if row[0] < first]
+        rows.extend(recent)
+        data = '{"max_value": %s, "min_value": %s, "series": %s, ' \
+               '"chunks": [], "leaders": {"metric": "VmSize", "rows": []},\n' \
+               '"d": [%s]}' % (json.dumps(max_memory), json.dumps(min_memory),
+                               json.dumps(series),
+                               ',\n'.join([_json_row(row) for row in rows]))
+        return count, data
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        # get_readings.py prints the readings to stdout
+        pass
+
+    def do_GET(self):
+        path, sep, query = self.path.partition('?')
+        if path == '/':
+            self.send_response(302)
+            self.send_header('Location', '/live/')
+            self.end_headers()
+        elif path == '/live/':
+            names = [x for x in self.server.feed.instances if x]
+            title = 'Live'
+            if names:
+                title += ': ' + ', '.join(names)
+            html = open(os.path.join(HERE, 'template.html')).read()
+            self._send('text/html; charset=utf-8',
+                       html.replace('{{title}}', title))
+        elif path == '/live/overview.js':
+            count, data = self.server.feed.backfill()
+            self._send('text/javascript',
+                       'overviewLoaded(%s);\nliveConnect("events?since=%d");\n'
+                       % (data, count))
+        elif path == '/live/events':
+            self._events(query)
+        elif path.lstrip('/') in STATIC_FILES:
+            if path.endswith('.css'):
+                content_type = 'text/css'
+            else:
+                content_type = 'text/javascript'
+            self._send(content_type,
+                       open(os.path.join(HERE, path.lstrip('/')), 'rb').read())
+        else:
+            self.send_error(404)
+
+    def _send(self, content_type, body):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _events(self, query):
+        """ send the new rows every BATCH_INTERVAL seconds, as an event
+        with the count of rows so far as its id so a browser that
+        reconnects picks up where it left off """
+        seen = self.headers.get('Last-Event-ID')
+        if seen is None and query.startswith('since='):
+            seen = query[6:]
+        try:
+            seen = int(seen)
+        except (TypeError, ValueError):
+            seen = self.server.feed.count
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        feed = self.server.feed
+        last_sent = time.time()
+        try:
+            while not self.server.stopping:
+                time.sleep(self.server.batch_interval)
+                seen, rows = feed.new_rows(seen)
+                now = time.time()
+                if rows:
+                    self.wfile.write('id: %d\ndata: [%s]\n\n' % (
+                      seen, ','.join([_json_row(row) for row in rows])))
+                elif now - last_sent >= KEEPALIVE_INTERVAL:
+                    self.wfile.write(': keepalive\n\n')
+                else:
+                    continue
+                self.wfile.flush()
+                last_sent = now
+        except IOError:
+            # the browser went away
+            pass
+
+
+class LiveServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ serve the live page of the LiveFeed @feed on @host:@port, sending
+    new readings every @batch_interval seconds. Only listens on localhost
+    by default. """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, feed, port, host='127.0.0.1',
+                 batch_interval=BATCH_INTERVAL):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), _Handler)
+        self.feed = feed
+        self.batch_interval = batch_interval
+        self.stopping = False
+        self.thread = None
+
+    def start(self):
+        """ start serving in a daemon thread """
+        self.thread = threading.Thread(target=self.serve_forever,
+                                       name='live-server')
+        self.thread.setDaemon(True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping = True
+        self.shutdown()
+        self.server_close()
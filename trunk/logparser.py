@@ -0,0 +1,155 @@
+"""
+Parse the lines of Z2.log, or any access log in the common or combined
+format:
+
+  127.0.0.1 - Anonymous [30/May/2008:11:31:36 +0100] "GET /url HTTP/1.1" 200 1234 "referer" "agent"
+
+If the log is configured to, a request duration can follow as the last
+field: in microseconds like Apache's %D or in seconds like %T.
+
+The timestamp in the log is when the request came in and the line is
+written when it's done, so with the duration we know when each request
+was in flight.
+"""
+import re
+import calendar
+from collections import namedtuple
+
+LogRecord = namedtuple('LogRecord', 'host user timestamp method uri protocol '
+                                    'status size referer agent duration')
+
+MONTHS = dict([(name, i + 1) for i, name in enumerate(
+  'Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec'.split())])
+
+# the start of every minute parsed so far, by its '30/May/2008:11:31' and
+# time zone. A month of logs is only ~45000 of them.
+_minutes = {}
+
+def _parse_minute(stamp):
+    """ the timestamp of the start of the minute of @stamp, which looks
+    like '30/May/2008:11:31:36 +0100' """
+    t = calendar.timegm((int(stamp[7:11]), MONTHS[stamp[3:6]],
+                         int(stamp[:2]), int(stamp[12:14]),
+                         int(stamp[15:17]), 0))
+    offset = int(stamp[22:24]) * 3600 + int(stamp[24:26]) * 60
+    if stamp[21] == '-':
+        offset = -offset
+    return t - offset
+
+
+def log_timestamp(line):
+    """ the unix timestamp of the Z2.log @line or None if it doesn't have
+    one """
+    i = line.find('[')
+    if i == -1:
+        return None
+    return parse_timestamp(line[i + 1:i + 27])
+
+
+def parse_timestamp(stamp):
+    """ the unix timestamp of @stamp, e.g. '30/May/2008:11:31:36 +0100',
+    or None if it isn't one """
+    key = stamp[:17] + stamp[20:]
+    try:
+        minute = _minutes[key]
+    except KeyError:
+        try:
+            minute = _parse_minute(stamp)
+        except (ValueError, KeyError, IndexError):
+            return None
+        if len(_minutes) > 100000:
+            _minutes.clear()
+        _minutes[key] = minute
+    try:
+        return minute + int(stamp[18:20])
+    except ValueError:
+        return None
+
+
+# how to turn the duration field into seconds, by its Apache format
+DURATION_UNITS = {'D': 1e-6, 'T': 1.0}
+
+
+# most lines match this one quickly
+line_regex = re.compile(r'(?P<host>\S+) \S+ (?P<user>[^[]*) '
+                        r'\[(?P<time>[^\]]*)\] "(?P<request>[^"]*)" '
+                        r'(?P<status>\S+) (?P<size>\S+)'
+                        r'(?: "(?P<referer>[^"]*)" "(?P<agent>[^"]*)")?'
+                        r'(?: (?P<duration>\S+))?')
+# and the ones with escaped quotes in them this slower one
+quoted_line_regex = re.compile(r'(?P<host>\S+) \S+ (?P<user>[^[]*) '
+                               r'\[(?P<time>[^\]]*)\] '
+                               r'"(?P<request>(?:[^"\\]|\\.)*)" '
+                               r'(?P<status>\S+) (?P<size>\S+)'
+                               r'(?: "(?P<referer>(?:[^"\\]|\\.)*)" '
+                               r'"(?P<agent>(?:[^"\\]|\\.)*)")?'
+                               r'(?: (?P<duration>\S+))?')
+
+# the timestamps of the last few thousand stamps seen. Most lines have the
+# same one as the line before.
+_stamps = {}
+
+_new_record = tuple.__new__
+
+
+def parse_line(line, duration=None, _match=line_regex.match,
+               _quoted_match=quoted_line_regex.match):
+    """ return a LogRecord of @line or None if it can't be parsed.
+
+    @duration says what the optional last field is: 'D' for microseconds,
+    'T' for seconds or None if the log doesn't have one. The duration of
+    the record is in seconds, or None.
+    """
+    match = _match(line)
+    if match is None or match.group('request')[-1:] == '\\':
+        match = _quoted_match(line)
+        if match is None:
+            return None
+    host, user, stamp, request, status, size, referer, agent, took = \
+      match.groups()
+    timestamp = _stamps.get(stamp)
+    if timestamp is None:
+        timestamp = parse_timestamp(stamp)
+        if timestamp is None:
+            return None
+        if len(_stamps) > 10000:
+            _stamps.clear()
+        _stamps[stamp] = timestamp
+    
+    method, sep, uri = request.partition(' ')
+    if sep:
+        uri, sep, protocol = uri.rpartition(' ')
+        if not sep:
+            uri, protocol = protocol, None
+    else:
+        method, uri, protocol = None, request, None
+    
+    try:
+        status = None if status == '-' else int(status)
+        size = 0 if size == '-' else int(size)
+        if took is not None:
+            if duration is None:
+                took = None
+            else:
+                took = float(took) * DURATION_UNITS[duration]
+    except ValueError:
+        return None
+    return _new_record(LogRecord, (host, user, timestamp, method, uri,
+                                   protocol, status, size, referer, agent,
+                                   took))
+
+
+def request_of(line):
+    """ just the (method, uri) of @line, or None, without parsing the
+    rest """
+    # nothing before the request is quoted
+    start = line.find('"') + 1
+    if not start:
+        return None
+    end = line.find(' HTTP/', start)
+    if end == -1:
+        return None
+    method, sep, uri = line[start:end].partition(' ')
+    if not sep:
+        return None
+    return method, uri
@@ -0,0 +1,203 @@
+"""
+See what grew inside the Zope, not just that its memory did.
+
+The numbers from /proc say how big the process is. This module goes into
+the Zope process itself and every so often sends a snapshot of:
+
+  caches  the objects in the ZODB cache of each connection, as
+          [non-ghosts, all]
+  gc      gc.get_count(), what's waiting for each generation
+  types   the most common types among the objects gc tracks, estimated
+          from a sample of every @stride-th one, and only every
+          @census_every snapshots as it has to look at all of them
+
+to a Unix datagram socket get_readings.py --probe listens on, which puts
+them in the capture with the readings. Sending never blocks: if nothing
+is listening the snapshot is dropped.
+
+Start it from the Zope, e.g. in a Product's __init__.py:
+
+  import probe
+  probe.install()
+
+It keeps its own work under @budget of a CPU (0.1% by default) by taking
+the type census less often when it's found to cost more, see
+benchmarks/bench_probe.py for what that comes to per request.
+
+This file doesn't import anything else from here, so it can be copied
+into the Zope on its own.
+"""
+import os
+import gc
+import sys
+import json
+import time
+import stat
+import errno
+import socket
+import threading
+
+ADDRESS = '/tmp/zope-memory-probe.sock'
+
+# the share of a CPU the probe may use
+BUDGET = 0.001
+
+# big enough for any snapshot
+MAX_DATAGRAM = 65000
+
+
+def type_census(stride=100, top=20):
+    """ the @top most common types of the objects gc tracks, as [name,
+    estimated count], from a sample of every @stride-th one """
+    counts = {}
+    objects = gc.get_objects()
+    try:
+        for o in objects[::stride]:
+            t = type(o)
+            counts[t] = counts.get(t, 0) + 1
+    finally:
+        # don't keep everything alive until the next census
+        del objects
+    ranked = sorted(counts.items(), key=lambda x: x[1], reverse=True)[:top]
+    return [['%s.%s' % (t.__module__, t.__name__), n * stride]
+            for t, n in ranked]
+
+
+def cache_sizes(db):
+    """ [non-ghosts, all] of the ZODB cache of each connection of the
+    ZODB.DB @db """
+    return [[d.get('ngsize', 0), d.get('size', 0)]
+            for d in db.cacheDetailSize()]
+
+
+class Probe(threading.Thread):
+    """ send a snapshot to the Unix datagram socket @address every
+    @interval seconds, see the top of the module. @db is the ZODB.DB to
+    report the caches of, or None. """
+
+    def __init__(self, address=ADDRESS, interval=1.0, db=None, top=20,
+                 stride=100, census_every=60, budget=BUDGET):
+        threading.Thread.__init__(self, name='zope-memory-probe')
+        self.setDaemon(True)
+        self.address = address
+        self.interval = interval
+        self.db = db
+        self.top = top
+        self.stride = stride
+        self.census_every = census_every
+        self.budget = budget
+        self.count = 0
+        # how many were sent and how long they took altogether
+        self.sent = 0
+        self.busy = 0.0
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.setblocking(0)
+        self._stopping = threading.Event()
+
+    def snapshot(self):
+        """ the snapshot as a dict """
+        data = {'pid': os.getpid(), 'time': time.time(),
+                'gc': list(gc.get_count())}
+        if self.db is not None:
+            data['caches'] = cache_sizes(self.db)
+        if not self.count % self.census_every:
+            data['types'] = type_census(self.stride, self.top)
+            data['stride'] = self.stride
+        self.count += 1
+        return data
+
+    def send(self, data):
+        """ send the snapshot @data, or drop it if nobody's listening or
+        they're not keeping up. Returns True if it was sent. """
+        try:
+            self.socket.sendto(json.dumps(data, separators=(',', ':')),
+                               self.address)
+        except socket.error, e:
+            if e.args[0] in (errno.ENOENT, errno.ECONNREFUSED, errno.EAGAIN,
+                             errno.ENOBUFS, errno.EMSGSIZE):
+                return False
+            raise
+        self.sent += 1
+        return True
+
+    def run(self):
+        while not self._stopping.isSet():
+            t0 = time.time()
+            self.send(self.snapshot())
+            elapsed = time.time() - t0
+            self.busy += elapsed
+            if elapsed > self.budget * self.interval * self.census_every:
+                # the census is what costs, make it rarer
+                self.census_every *= 2
+            self._stopping.wait(self.interval)
+
+    def stop(self):
+        self._stopping.set()
+
+
+_probe = None
+
+def install(address=ADDRESS, **kw):
+    """ start a Probe in this process, of the Zope2 database if there is
+    one, unless one is already running. The keyword arguments are those
+    of Probe. """
+    global _probe
+    if _probe is None:
+        if 'db' not in kw:
+            zope2 = sys.modules.get('Zope2')
+            kw['db'] = getattr(zope2, 'DB', None)
+        _probe = Probe(address, **kw)
+        _probe.start()
+    return _probe
+
+
+class ProbeListener(object):
+    """ the socket at @address the probes send their snapshots to. It's
+    non-blocking, receive() returns what has come in. The kernel only
+    queues a few datagrams (net.unix.max_dgram_qlen, 10 by default) and
+    the probes drop the rest, so call it every second or so. A socket
+    left at @address from the last time is replaced, anything else there
+    is a ValueError. """
+
+    def __init__(self, address=ADDRESS):
+        self.address = address
+        try:
+            mode = os.lstat(address).st_mode
+        except OSError:
+            pass
+        else:
+            if not stat.S_ISSOCK(mode):
+                raise ValueError("%s exists and isn't a socket" % address)
+            # left over from the last time
+            os.remove(address)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.bind(address)
+        self.socket.setblocking(0)
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def receive(self):
+        """ the list of snapshots (dicts) sent since last time """
+        snapshots = []
+        while 1:
+            try:
+                data = self.socket.recv(MAX_DATAGRAM)
+            except socket.error, e:
+                if e.args[0] in (errno.EAGAIN, errno.EINTR):
+                    break
+                raise
+            try:
+                snapshots.append(json.loads(data))
+            except ValueError:
+                pass
+        return snapshots
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+            try:
+                os.remove(self.address)
+            except OSError:
+                pass
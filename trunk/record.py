@@ -0,0 +1,43 @@
+"""
+What one reading looks like.
+
+A reading used to be the tuple ((method, url), vmsize, timestamp). It's
+now a Reading which starts with those same three fields, so old code that
+does reading[1] still gets the VmSize, followed by the other memory
+metrics and the number of the Zope instance it was taken from (always 0
+unless several are monitored at once). All memory numbers are in kB and
+are None when unknown.
+"""
+from collections import namedtuple
+
+# the memory metrics in the order they're stored, and how to label them
+METRICS = ('memory', 'rss', 'swap', 'rss_anon', 'rss_file', 'pss')
+METRIC_LABELS = ('VmSize', 'VmRSS', 'VmSwap', 'RssAnon', 'RssFile', 'Pss')
+
+Reading = namedtuple('Reading', ('url', 'memory', 'timestamp') + METRICS[1:] +
+                                ('instance',))
+
+
+# something that happened to an instance while it was being recorded: kind
+# is 'restart' (the Zope got a new pid), 'rotate' (its log was rotated) or
+# 'truncate' (its log was truncated) and detail says more
+Event = namedtuple('Event', 'timestamp instance kind detail')
+
+# what probe.py found inside an instance at @timestamp: a dict with the
+# ZODB cache sizes, the gc counts and the most common types
+Snapshot = namedtuple('Snapshot', 'timestamp instance data')
+
+
+def as_reading(t):
+    """ turn a reading tuple, old or new style, into a Reading """
+    if len(t) == 3:
+        return Reading(t[0], t[1], t[2], None, None, None, None, None, 0)
+    if len(t) == len(METRICS) + 2:
+        return Reading(*(tuple(t) + (0,)))
+    return Reading(*t)
+
+
+def make_reading(url, memory, timestamp, instance=0):
+    """ return a Reading of the sampler.Memory @memory """
+    return Reading(url, memory.vmsize, timestamp, memory.rss, memory.swap,
+                   memory.rss_anon, memory.rss_file, memory.pss, instance)
@@ -0,0 +1,293 @@
+"""
+Correlate a Z2.log with memory readings after the fact.
+
+get_readings.py can only pair a request with the memory of the Zope as it
+happens. For a leak that has already happened, give this the memory
+timeline and the log files, gzipped and rotated ones included, and it
+merges the two by time. The result is the same report.
+
+The timeline is either a capture file (any recording of the Zope) or a
+text file with one sample per line:
+
+  <unix timestamp> <VmSize in kB> [<VmRSS in kB>]
+
+e.g. written by a cron job. Both have to be in time order, and so should
+the log lines, near enough.
+
+ $ python replay.py /tmp/memory.txt Z2.log.2.gz Z2.log.1 Z2.log
+
+With --in-flight it prints the URLs that grew the memory the most
+instead, with every growth shared between the requests that were running
+at the time. That needs the log to have the duration of each request
+(--duration=D or T) to be any good.
+"""
+import os
+import gzip
+
+from capture import is_capture, CaptureReader, CaptureWriter
+from record import Reading, METRICS
+from urltable import URLTable, strip_query, collapse_numbers
+from logparser import log_timestamp, parse_line
+from attribution import InFlight, print_top
+
+# log files are read this much at a time
+BLOCK_SIZE = 1024 * 1024
+
+
+def open_log(filename):
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rb')
+    return open(filename, 'rb')
+
+
+def _lines(f):
+    """ generator of the lines of the file @f, read in big blocks """
+    rest = ''
+    while 1:
+        block = f.read(BLOCK_SIZE)
+        if not block:
+            break
+        lines = (rest + block).split('\n')
+        rest = lines.pop()
+        for line in lines:
+            yield line
+    if rest:
+        yield rest
+
+
+def _first_timestamp(filename):
+    f = open_log(filename)
+    try:
+        for line in _lines(f):
+            timestamp = log_timestamp(line)
+            if timestamp is not None:
+                return timestamp
+    finally:
+        f.close()
+
+
+def log_files_in_order(filenames):
+    """ @filenames sorted by the time of their first line, so rotated logs
+    can be given in any order. Empty files are left out. """
+    files = []
+    for filename in filenames:
+        timestamp = _first_timestamp(filename)
+        if timestamp is not None:
+            files.append((timestamp, filename))
+    files.sort()
+    return [filename for timestamp, filename in files]
+
+
+def iter_log(filenames):
+    """ generator of (timestamp, line) of the lines of the log files
+    @filenames, in time order """
+    for filename in log_files_in_order(filenames):
+        f = open_log(filename)
+        try:
+            prev_stamp = None
+            timestamp = None
+            for line in _lines(f):
+                # most lines have the same time as the one before
+                i = line.find('[')
+                stamp = line[i:i + 28]
+                if stamp != prev_stamp:
+                    timestamp = log_timestamp(line)
+                    prev_stamp = stamp
+                if timestamp is not None:
+                    yield timestamp, line
+        finally:
+            f.close()
+
+
+def iter_records(filenames, duration=None):
+    """ generator of the logparser.LogRecord of every line of the log
+    files @filenames that can be parsed, in time order. @duration is the
+    format of the duration field, see logparser.parse_line(). """
+    for filename in log_files_in_order(filenames):
+        f = open_log(filename)
+        try:
+            for line in _lines(f):
+                record = parse_line(line, duration)
+                if record is not None:
+                    yield record
+        finally:
+            f.close()
+
+
+def read_timeline(filename):
+    """ generator of (timestamp, metrics) where metrics has a value (or
+    None) for each of record.METRICS, from a capture file or a text file
+    of memory samples """
+    if is_capture(filename):
+        for reading in CaptureReader(filename):
+            yield reading[2], (reading[1],) + reading[3:-1]
+        return
+    padding = (None,) * len(METRICS)
+    for line in open(filename):
+        parts = line.split()
+        if len(parts) < 2 or line.startswith('#'):
+            continue
+        metrics = tuple([int(x) for x in parts[1:len(METRICS) + 1]])
+        yield float(parts[0]), metrics + padding[len(metrics):]
+
+
+def replay(log_filenames, timeline, urls=None):
+    """ generator of the record.Reading tuples of the log files
+    @log_filenames joined with the (timestamp, metrics) of @timeline.
+
+    Every log line gets the last sample taken at or before it and, like
+    get_readings() does live, a reading is made of the line when that's
+    different from the last one. The URL ids are in @urls, a
+    urltable.URLTable.
+    """
+    from get_readings import get_url
+    if urls is None:
+        urls = URLTable()
+    samples = iter(timeline)
+    next_sample = next(samples, None)
+    current = None
+    prev = None
+    for timestamp, line in iter_log(log_filenames):
+        if next_sample is not None and next_sample[0] <= timestamp:
+            while next_sample is not None and next_sample[0] <= timestamp:
+                current = next_sample[1]
+                next_sample = next(samples, None)
+            if current != prev:
+                prev = current
+                yield Reading(urls.intern(get_url(line)), current[0],
+                              timestamp, *current[1:] + (0,))
+
+
+def in_flight(log_filenames, timeline, urls=None, duration=None,
+              max_duration=60.0, metric='memory'):
+    """ return an attribution.InFlight of the requests in the log files
+    @log_filenames and the memory @metric (one of record.METRICS) of the
+    (timestamp, metrics) of @timeline. @duration is the format of the
+    duration field of the log, see logparser.parse_line(). """
+    if urls is None:
+        urls = URLTable()
+    index = METRICS.index(metric)
+    attribution = InFlight(max_duration)
+    samples = iter(timeline)
+    next_sample = next(samples, None)
+    for record in iter_records(log_filenames, duration):
+        start = record.timestamp
+        end = start
+        if record.duration is not None:
+            end += record.duration
+        while next_sample is not None and next_sample[0] <= end:
+            attribution.add_sample(next_sample[0], next_sample[1][index])
+            next_sample = next(samples, None)
+        if record.method is None:
+            url = record.uri
+        else:
+            url = record.method, record.uri
+        attribution.add_request(urls.intern(url), start, end)
+    while next_sample is not None:
+        attribution.add_sample(next_sample[0], next_sample[1][index])
+        next_sample = next(samples, None)
+    return attribution.flush()
+
+
+#### The command line handler ##################################################
+
+import CommandLineApp
+
+class replay_app(CommandLineApp.CommandLineApp):
+    """ make a report of old Z2.log files and a memory timeline recorded
+    at the same time
+    """
+
+    output = '/tmp/zope-memory-replay.dat'
+    def optionHandler_output(self, filename):
+        """ the capture file to write the readings to (default
+        /tmp/zope-memory-replay.dat) """
+        self.output = filename
+        return
+
+    in_flight = False
+    def optionHandler_in_flight(self):
+        """ print the URLs that grew the memory the most, sharing every
+        growth between the requests in flight at the time, instead of
+        making a report """
+        self.in_flight = True
+        return
+
+    duration = None
+    def optionHandler_duration(self, format):
+        """ the last field of every log line is the duration of the
+        request: D in microseconds (Apache's %D) or T in seconds (%T) """
+        if format not in ('D', 'T'):
+            raise ValueError("The duration is either D or T, not %r" % format)
+        self.duration = format
+        return
+
+    max_duration = 60.0
+    def optionHandler_max_duration(self, seconds):
+        """ how long the longest request can take (default 60 seconds) """
+        self.max_duration = float(seconds)
+        return
+
+    metric = 'memory'
+    def optionHandler_metric(self, name):
+        """ with --in-flight, which memory metric to use: memory (VmSize,
+        the default) or rss """
+        if name not in METRICS:
+            raise ValueError("Unknown metric %r" % name)
+        self.metric = name
+        return
+
+    top = 20
+    def optionHandler_top(self, n):
+        """ with --in-flight, how many URLs to show (default 20) """
+        self.top = int(n)
+        return
+
+    def beforeOptionsHook(self):
+        self.url_rules = []
+
+    def optionHandler_strip_query(self):
+        """ record '/page?id=1' and '/page?id=2' as '/page' """
+        self.url_rules.append(strip_query)
+        return
+
+    def optionHandler_collapse_numbers(self):
+        """ record '/issue/123/view' and '/issue/4/view' as '/issue/N/view' """
+        self.url_rules.append(collapse_numbers)
+        return
+
+    def main(self, timeline, *log_filenames):
+        """ Start! """
+        from generate_graph import generate
+        for filename in (timeline,) + log_filenames:
+            if not os.path.isfile(filename):
+                print "%s is not a file" % filename
+                return 2
+        if not log_filenames:
+            print "No log files given"
+            return 3
+        urls = URLTable(self.url_rules)
+        if self.in_flight:
+            attribution = in_flight(log_filenames, read_timeline(timeline),
+                                    urls, self.duration, self.max_duration,
+                                    self.metric)
+            print_top(attribution.stats, urls, self.top)
+            print "%d kB of changes while nothing was in flight" % (
+              attribution.unattributed)
+            return 0
+        writer = CaptureWriter(self.output, urls)
+        try:
+            for reading in replay(log_filenames, read_timeline(timeline),
+                                  urls):
+                writer.write(reading)
+        finally:
+            writer.close()
+        if not writer.count:
+            print "None of the log lines are from when the memory was sampled"
+            return 4
+        generate(self.output)
+        return 0
+
+
+if __name__=='__main__':
+    replay_app().run()
@@ -0,0 +1,269 @@
+"""
+Keep weeks of readings in a bounded amount of memory and disk.
+
+In --long-term mode readings go into a directory instead of one capture
+file, at three resolutions:
+
+  raw-<t>.capture      every reading, in the capture format, a new file
+                       every hour and only the last few hours kept
+  minutes-<t>.jsonl    one line per minute and instance with the min, max
+                       and mean VmSize and RSS and the hits per URI, a new
+                       file every day and a week of them kept
+  hours-<t>.jsonl      the same per hour, a new file every week and a year
+                       of them kept
+
+where <t> is the timestamp of the first reading in the file.
+
+Each raw file starts with the URL table as it was then, so that and the
+memory it takes only stay bounded if the number of distinct URLs does:
+get_readings.py caps the table at MAX_URLS and the URLs after that are
+all recorded as OTHER_URLS. Use --strip-query and --collapse-numbers to
+keep a site with lots of distinct URLs under the cap.
+"""
+import os
+import glob
+import json
+
+from capture import CaptureWriter, CaptureReader
+from urltable import uri_of
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+# how many distinct URLs are recorded in --long-term mode
+MAX_URLS = 20000
+
+
+class Rollup(object):
+    """ aggregate readings into buckets of @seconds per instance.
+
+    add() returns the buckets a reading finished, each a dict like
+    {"t": start, "i": instance, "n": readings, "memory": [min, max, mean],
+     "rss": [min, max, mean] or None, "urls": {uri: hits}}
+    """
+
+    def __init__(self, seconds, urls):
+        self.seconds = seconds
+        self.urls = urls
+        # per instance [start, count, min, max, total, rss count, rss min,
+        # rss max, rss total, {url id: hits}]
+        self.buckets = {}
+
+    def add(self, reading):
+        url, memory, timestamp = reading[:3]
+        rss = reading[3]
+        instance = reading.instance
+        start = int(timestamp // self.seconds) * self.seconds
+        done = []
+        b = self.buckets.get(instance)
+        if b is not None and start > b[0]:
+            done.append(self._finish(instance, b))
+            b = None
+        if b is None:
+            b = self.buckets[instance] = [start, 0, memory, memory, 0,
+                                          0, None, None, 0, {}]
+        b[1] += 1
+        if memory < b[2]:
+            b[2] = memory
+        if memory > b[3]:
+            b[3] = memory
+        b[4] += memory
+        if rss is not None:
+            b[5] += 1
+            if b[6] is None or rss < b[6]:
+                b[6] = rss
+            if b[7] is None or rss > b[7]:
+                b[7] = rss
+            b[8] += rss
+        hits = b[9]
+        hits[url] = hits.get(url, 0) + 1
+        return done
+
+    def _finish(self, instance, b):
+        start, count, lo, hi, total, rss_count, rss_lo, rss_hi, rss_total, \
+          hits = b
+        uris = {}
+        for url, n in hits.iteritems():
+            uri = uri_of(self.urls[url])
+            uris[uri] = uris.get(uri, 0) + n
+        rss = None
+        if rss_count:
+            rss = [rss_lo, rss_hi, float(rss_total) / rss_count]
+        return {"t": start, "i": instance, "n": count,
+                "memory": [lo, hi, float(total) / count], "rss": rss,
+                "urls": uris}
+
+    def flush(self):
+        """ return all the buckets not finished yet """
+        done = [self._finish(instance, b)
+                for instance, b in sorted(self.buckets.items())]
+        self.buckets = {}
+        return done
+
+
+def _segment_files(directory, prefix):
+    """ the (start, filename) of the files of @prefix in @directory in
+    time order """
+    files = []
+    for filename in glob.glob(os.path.join(directory, prefix + '-*')):
+        name = os.path.basename(filename)
+        try:
+            start = int(name[len(prefix) + 1:].split('.', 1)[0])
+        except ValueError:
+            continue
+        files.append((start, filename))
+    files.sort()
+    return files
+
+
+class _Segments(object):
+    """ the files of one resolution: <prefix>-<t>.<suffix> in @directory, a
+    new one every @file_seconds, and those older than @keep_seconds are
+    removed as new ones are started. @opener opens a new file. """
+
+    def __init__(self, directory, prefix, suffix, file_seconds, keep_seconds,
+                 opener):
+        self.directory = directory
+        self.prefix = prefix
+        self.suffix = suffix
+        self.file_seconds = file_seconds
+        self.keep_seconds = keep_seconds
+        self.opener = opener
+        self.current = None
+        self.end = None
+
+    def get(self, timestamp):
+        """ the open file for things at @timestamp """
+        if self.current is None or timestamp >= self.end:
+            self.close()
+            t = int(timestamp)
+            while 1:
+                filename = os.path.join(self.directory, '%s-%d.%s' % (
+                  self.prefix, t, self.suffix))
+                if not os.path.exists(filename):
+                    break
+                t += 1
+            self.end = (int(timestamp // self.file_seconds) + 1) * \
+                       self.file_seconds
+            self.prune(timestamp)
+            self.current = self.opener(filename)
+        return self.current
+
+    def prune(self, now):
+        for start, filename in _segment_files(self.directory, self.prefix):
+            end = (start // self.file_seconds + 1) * self.file_seconds
+            if end <= now - self.keep_seconds:
+                os.remove(filename)
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+
+
+class RetentionStore(object):
+    """ record readings into @directory for as long as you like.
+
+    @urls is the urltable.URLTable the URL ids of the readings come from,
+    which should have a @max_urls (see the top of the module), and
+    @instances the names of the Zope instances. The last @raw_hours hours
+    are kept at full resolution on disk, per minute rollups for
+    @minute_days days and per hour rollups for @hour_days days.
+    """
+
+    def __init__(self, directory, urls, instances=('',), raw_hours=24,
+                 minute_days=7, hour_days=366):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.urls = urls
+        self.instances = list(instances)
+        self.raw = _Segments(directory, 'raw', 'capture', HOUR,
+                             raw_hours * HOUR, self._open_capture)
+        self.levels = []
+        for prefix, seconds, file_seconds, keep in (
+          ('minutes', MINUTE, DAY, minute_days * DAY),
+          ('hours', HOUR, 7 * DAY, hour_days * DAY)):
+            self.levels.append((Rollup(seconds, urls),
+                                _Segments(directory, prefix, 'jsonl',
+                                          file_seconds, keep, _open_append)))
+
+    def _open_capture(self, filename):
+        return CaptureWriter(filename, self.urls, self.instances)
+
+    def write(self, reading):
+        """ add the record.Reading @reading """
+        if not isinstance(reading[0], int):
+            reading = reading._replace(url=self.urls.intern(reading[0]))
+        timestamp = reading[2]
+        self.raw.get(timestamp).write(reading)
+        for rollup, segments in self.levels:
+            for bucket in rollup.add(reading):
+                self._write_bucket(segments, bucket)
+
+    def write_event(self, event):
+        """ add the record.Event @event, it goes with the raw readings """
+        self.raw.get(event.timestamp).write_event(event)
+
+    def write_snapshot(self, snapshot):
+        """ add the record.Snapshot @snapshot, with the raw readings """
+        self.raw.get(snapshot.timestamp).write_snapshot(snapshot)
+
+    def write_footer(self, data):
+        """ add the footer @data to the current raw file """
+        if self.raw.current is not None:
+            self.raw.current.write_footer(data)
+
+    def tick(self, now=None):
+        """ write out the raw readings that have been waiting long enough,
+        see CaptureWriter.tick() """
+        if self.raw.current is not None:
+            self.raw.current.tick(now)
+
+    def _write_bucket(self, segments, bucket):
+        f = segments.get(bucket['t'])
+        f.write(json.dumps(bucket) + '\n')
+        f.flush()
+
+    def close(self):
+        """ write out the unfinished rollups and close all the files """
+        for rollup, segments in self.levels:
+            for bucket in rollup.flush():
+                self._write_bucket(segments, bucket)
+            segments.close()
+        self.raw.close()
+
+
+def _open_append(filename):
+    return open(filename, 'a')
+
+
+def read_store(directory):
+    """ return (readings, urls, instances) like
+    generate_graph.iter_readings() for the raw readings kept in
+    @directory """
+    urls = []
+    instances = []
+    def readings():
+        for start, filename in _segment_files(directory, 'raw'):
+            reader = CaptureReader(filename)
+            # every file starts with the whole URL table as it was then so
+            # the ids are the same in all of them
+            reader.urls = urls
+            reader.instances = instances
+            for reading in reader:
+                yield reading
+    return readings(), urls, instances
+
+
+def read_rollups(directory, prefix):
+    """ generator of the buckets in the 'minutes' or 'hours' files of
+    @directory, in time order per instance """
+    for start, filename in _segment_files(directory, prefix):
+        for line in open(filename):
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # cut short when we were killed
+                continue
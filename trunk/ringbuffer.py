@@ -0,0 +1,45 @@
+"""
+A fixed size buffer of the last things added, e.g. the samples of a
+sampler.SamplerThread or the recent rows of the live view.
+"""
+
+
+class RingBuffer(object):
+    """ the last @size things appended, oldest first when iterated """
+
+    def __init__(self, size):
+        self.size = size
+        self.items = []
+        # where the next item goes once the buffer is full
+        self.pos = 0
+
+    def append(self, item):
+        if len(self.items) < self.size:
+            self.items.append(item)
+        else:
+            self.items[self.pos] = item
+            self.pos = (self.pos + 1) % self.size
+
+    def last(self, n):
+        """ the last @n things appended (or all of them if there are
+        fewer), oldest first """
+        items = self.items
+        n = min(n, len(items))
+        if n <= 0:
+            return []
+        if len(items) < self.size:
+            return items[-n:]
+        pos = self.pos
+        if n <= pos:
+            return items[pos - n:pos]
+        return items[len(items) - (n - pos):] + items[:pos]
+
+    def __iter__(self):
+        items = self.items
+        for i in xrange(self.pos, len(items)):
+            yield items[i]
+        for i in xrange(self.pos):
+            yield items[i]
+
+    def __len__(self):
+        return len(self.items)
@@ -0,0 +1,254 @@
+"""
+Read the memory usage of a process from /proc without reopening the file
+every time.
+
+/proc files are regenerated by the kernel on every read from offset 0, so
+one file descriptor can be kept open for the life of the process and just
+read again. The fields we need are found with str.find() rather than a
+regular expression.
+
+SamplerThread takes samples at a fixed rate in the background, however
+much or little the Zope is logging.
+
+Proportional set size (Pss) comes from /proc/<pid>/smaps_rollup which the
+kernel has to walk every mapping to produce, so it is only read every so
+many samples.
+
+RestartingSampler follows a Zope through restarts: the pid file is only
+read again once the process it named has gone.
+"""
+import os
+import time
+import threading
+from collections import namedtuple
+
+from ringbuffer import RingBuffer
+
+# all in kB, None when the kernel doesn't tell us
+Memory = namedtuple('Memory', 'vmsize rss swap rss_anon rss_file pss')
+
+# /proc/<pid>/statm counts in pages, we report in kB like /proc/<pid>/status
+PAGE_KB = os.sysconf('SC_PAGE_SIZE') // 1024
+
+# more than enough for /proc/<pid>/status (usually ~1.3kB)
+READ_SIZE = 8192
+
+if hasattr(os, 'pread'):
+    def _pread(fd, size):
+        return os.pread(fd, size, 0)
+else:
+    def _pread(fd, size):
+        os.lseek(fd, 0, 0)
+        return os.read(fd, size)
+
+
+_required = object()
+
+def parse_status_field(data, field, default=_required):
+    """ return the number (in kB) after @field (e.g. 'VmSize:') in the
+    contents of a /proc/<pid>/status file. If it's not there @default is
+    returned, or ValueError raised if no @default is given. """
+    i = data.find(field)
+    if i == -1:
+        if default is _required:
+            raise ValueError("%s not in status" % field)
+        return default
+    i += len(field)
+    return int(data[i:data.find('\n', i)].split()[0])
+
+
+class ProcSampler(object):
+    """ sample the memory usage of process @pid.
+
+    @source is either 'status' (the default, what get_mem_size() reads)
+    or 'statm' which is much cheaper for the kernel to produce but can't
+    tell us about swap.
+
+    If @pss_every is set Pss is read from smaps_rollup on every
+    @pss_every-th sample and the last value is repeated in between.
+    """
+
+    def __init__(self, pid, source='status', pss_every=0):
+        if source not in ('status', 'statm'):
+            raise ValueError("Unknown source %r" % source)
+        self.pid = pid
+        self.source = source
+        self.fd = os.open('/proc/%s/%s' % (pid, source), os.O_RDONLY)
+        self.pss_every = pss_every
+        self.pss_fd = None
+        if pss_every:
+            self.pss_fd = os.open('/proc/%s/smaps_rollup' % pid, os.O_RDONLY)
+        self._count = 0
+        self._pss = None
+
+    def vmsize(self):
+        """ return the VmSize of the process in kB """
+        data = _pread(self.fd, READ_SIZE)
+        if self.source == 'statm':
+            return int(data[:data.find(' ')]) * PAGE_KB
+        return parse_status_field(data, 'VmSize:')
+
+    def sample(self):
+        """ return a Memory of the process """
+        data = _pread(self.fd, READ_SIZE)
+        if self.source == 'statm':
+            fields = data.split(None, 3)
+            size, resident, shared = [int(x) * PAGE_KB for x in fields[:3]]
+            memory = Memory(size, resident, None, resident - shared, shared,
+                            None)
+        else:
+            memory = Memory(parse_status_field(data, 'VmSize:'),
+                            parse_status_field(data, 'VmRSS:'),
+                            parse_status_field(data, 'VmSwap:', None),
+                            # older kernels don't break RSS down
+                            parse_status_field(data, 'RssAnon:', None),
+                            parse_status_field(data, 'RssFile:', None),
+                            None)
+
+        if self.pss_fd is not None:
+            if not self._count % self.pss_every:
+                self._pss = parse_status_field(_pread(self.pss_fd, READ_SIZE),
+                                               'Pss:')
+            self._count += 1
+            memory = memory._replace(pss=self._pss)
+        return memory
+
+    def close(self):
+        for attr in ('fd', 'pss_fd'):
+            fd = getattr(self, attr)
+            if fd is not None:
+                os.close(fd)
+                setattr(self, attr, None)
+
+
+def read_pid(pid_filename):
+    """ the pid in the file @pid_filename """
+    f = open(pid_filename)
+    try:
+        return int(f.read())
+    finally:
+        f.close()
+
+
+class RestartingSampler(object):
+    """ a ProcSampler of the process whose pid is in @pid_filename that
+    moves on to the new process when it's restarted. sample() returns None
+    while there's no process to sample, and @on_restart (if given) is
+    called with the old and new pid when it moves on. The pid file is
+    read again at most every @retry seconds, and only then. The rest of
+    the arguments are those of ProcSampler. """
+
+    def __init__(self, pid_filename, source='status', pss_every=0,
+                 on_restart=None, retry=1.0):
+        self.pid_filename = pid_filename
+        self.source = source
+        self.pss_every = pss_every
+        self.on_restart = on_restart
+        self.retry = retry
+        self.pid = read_pid(pid_filename)
+        self.sampler = ProcSampler(self.pid, source, pss_every)
+        self.restarts = 0
+        self._retry_at = 0
+
+    def sample(self):
+        """ return a Memory of the process, or None if it's gone and
+        hasn't been restarted (yet) """
+        if self.sampler is not None:
+            try:
+                memory = self.sampler.sample()
+            except (OSError, IOError, ValueError):
+                # ESRCH once it's been reaped, a status without the
+                # fields while it's a zombie
+                memory = None
+            if memory is not None and memory.vmsize:
+                return memory
+            self.sampler.close()
+            self.sampler = None
+        now = time.time()
+        if now < self._retry_at:
+            return None
+        self._retry_at = now + self.retry
+        try:
+            pid = read_pid(self.pid_filename)
+        except (IOError, ValueError):
+            # not there or half written
+            return None
+        if pid == self.pid:
+            # not restarted yet, or written again by the same process
+            if not os.path.exists('/proc/%s' % pid):
+                return None
+        try:
+            sampler = ProcSampler(pid, self.source, self.pss_every)
+        except OSError:
+            return None
+        self.sampler = sampler
+        old, self.pid = self.pid, pid
+        if pid != old:
+            self.restarts += 1
+            if self.on_restart is not None:
+                self.on_restart(old, pid)
+        return self.sample()
+
+    def close(self):
+        if self.sampler is not None:
+            self.sampler.close()
+            self.sampler = None
+
+
+class SamplerThread(threading.Thread):
+    """ take a sample with the ProcSampler @sampler @rate times a second
+    and keep the last @size of them (a minute's worth by default) as
+    (timestamp, Memory). Use new_samples() to get them. Samples of None
+    (a RestartingSampler with nothing to sample) aren't kept. """
+
+    def __init__(self, sampler, rate=20.0, size=None):
+        threading.Thread.__init__(self, name='sampler-%s' % sampler.pid)
+        self.setDaemon(True)
+        self.sampler = sampler
+        self.rate = float(rate)
+        if size is None:
+            size = int(self.rate * 60)
+        self.samples = RingBuffer(size)
+        # how many samples have been taken altogether, and how long that
+        # took
+        self.count = 0
+        self.busy = 0.0
+        self.lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def run(self):
+        interval = 1.0 / self.rate
+        due = time.time()
+        while not self._stopping.isSet():
+            started = time.time()
+            memory = self.sampler.sample()
+            now = time.time()
+            self.busy += now - started
+            if memory is not None:
+                self.lock.acquire()
+                try:
+                    self.samples.append((now, memory))
+                    self.count += 1
+                finally:
+                    self.lock.release()
+            due += interval
+            delay = due - time.time()
+            if delay > 0:
+                self._stopping.wait(delay)
+            else:
+                # we've fallen behind, don't try to catch up
+                due = time.time()
+
+    def new_samples(self, seen):
+        """ return (count, samples) where samples are the ones taken since
+        there were @seen and count is what to pass as @seen next time. If
+        more than @size were taken since, the oldest are lost. """
+        self.lock.acquire()
+        try:
+            return self.count, self.samples.last(self.count - seen)
+        finally:
+            self.lock.release()
+
+    def stop(self):
+        self._stopping.set()
+
@@ -0,0 +1,220 @@
+"""
+What get_readings.py costs the box it's measuring.
+
+MonitorStats counts the lines tailed, memory samples taken, readings
+recorded, events and probe snapshots, and adds up the time spent sampling
+(what get_mem_size() used to do), parsing URLs (get_url()) and writing the
+capture. Counting is an addition and timing reuses the time.time() the
+loop calls anyway plus one more, so it's always on. report() puts that
+together with the depths of the queues between the threads and the
+monitor's own RSS and CPU time; get_readings.py writes it to the end of
+the capture when it stops and --stats=SECONDS prints it every so often.
+
+SignalProfiler runs cProfile over the recording loop between two SIGUSR1s
+(or for a set window after one), without stopping the recording, and
+writes the profile to a file for pstats.
+
+ $ python selfstats.py /tmp/zope-memory-readings.dat
+
+prints the footer of a capture.
+"""
+import os
+import sys
+import time
+import signal
+import threading
+
+from sampler import parse_status_field
+
+COUNTERS = ('lines', 'samples', 'readings', 'events', 'snapshots')
+TIMERS = ('sample', 'get_url', 'write')
+
+
+def own_rss():
+    """ the RSS of this process in kB, or None if there's no /proc """
+    try:
+        f = open('/proc/self/status')
+    except IOError:
+        return None
+    try:
+        return parse_status_field(f.read(), 'VmRSS:', None)
+    finally:
+        f.close()
+
+
+class MonitorStats(object):
+    """ the counters and timers of the recording loop, see the top of the
+    module. The loop adds to self.counts and self.seconds directly. Counts
+    kept elsewhere (e.g. by sampler threads) are added with add_source()
+    and queue depths with add_gauge(). """
+
+    def __init__(self):
+        self.started = time.time()
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.seconds = dict.fromkeys(TIMERS, 0.0)
+        self.sources = []
+        self.gauges = {}
+
+    def add_source(self, source):
+        """ @source returns a dict of counts or seconds (by the names in
+        COUNTERS and TIMERS) to add to ours """
+        self.sources.append(source)
+
+    def add_gauge(self, name, gauge):
+        """ @gauge returns the depth of the queue @name """
+        self.gauges[name] = gauge
+
+    def report(self):
+        """ a dict of everything so far: the uptime, counts, seconds,
+        queue depths, RSS in kB and CPU seconds of the monitor """
+        counts = dict(self.counts)
+        seconds = dict(self.seconds)
+        for source in self.sources:
+            for name, value in source().items():
+                if name in seconds:
+                    seconds[name] += value
+                else:
+                    counts[name] = counts.get(name, 0) + value
+        user, system = os.times()[:2]
+        return {'time': time.time(),
+                'uptime': time.time() - self.started,
+                'counts': counts,
+                'seconds': seconds,
+                'depths': dict([(name, gauge())
+                                for name, gauge in self.gauges.items()]),
+                'rss': own_rss(),
+                'cpu': user + system}
+
+
+def format_report(report, previous=None):
+    """ one line of @report, with the rates since @previous (another
+    report) or since the start """
+    if previous is None:
+        elapsed = report['uptime']
+        before = {'counts': {}, 'seconds': {}, 'cpu': 0.0}
+    else:
+        elapsed = report['time'] - previous['time']
+        before = previous
+    elapsed = max(elapsed, 1e-9)
+    counts = report['counts']
+    parts = []
+    for name in COUNTERS:
+        done = counts[name] - before['counts'].get(name, 0)
+        parts.append('%.1f %s/s' % (done / elapsed, name))
+    # the share of the time spent in each
+    times = []
+    for name in TIMERS:
+        spent = report['seconds'][name] - before['seconds'].get(name, 0.0)
+        times.append('%s %.2f%%' % (name, spent / elapsed * 100))
+    depths = ['%s %d' % x for x in sorted(report['depths'].items())]
+    cpu = (report['cpu'] - before['cpu']) / elapsed * 100
+    rss = report['rss']
+    if rss is None:
+        rss = '?'
+    else:
+        rss = '%.1f MB' % (rss / 1024.0)
+    return '%s | %s | %s | rss %s cpu %.1f%%' % (
+      ', '.join(parts), ', '.join(times), ', '.join(depths) or 'no queues',
+      rss, cpu)
+
+
+class StatsReporter(threading.Thread):
+    """ write a format_report() line of the MonitorStats @stats to @out
+    every @interval seconds """
+
+    def __init__(self, stats, interval=60.0, out=None):
+        threading.Thread.__init__(self, name='stats-reporter')
+        self.setDaemon(True)
+        self.stats = stats
+        self.interval = interval
+        if out is None:
+            # stdout has the readings
+            out = sys.stderr
+        self.out = out
+        self._stopping = threading.Event()
+
+    def run(self):
+        previous = None
+        while 1:
+            self._stopping.wait(self.interval)
+            if self._stopping.isSet():
+                break
+            report = self.stats.report()
+            self.out.write('stats: %s\n' % format_report(report, previous))
+            self.out.flush()
+            previous = report
+
+    def stop(self):
+        self._stopping.set()
+
+
+class SignalProfiler(object):
+    """ profile the main thread with cProfile from one SIGUSR1 to the next,
+    or for @window seconds after one if it's set, and write the profile
+    to @prefix-<timestamp>.prof. install() sets up the signal handlers. """
+
+    def __init__(self, prefix='/tmp/zope-memory-profile', window=None,
+                 out=None):
+        self.prefix = prefix
+        self.window = window
+        if out is None:
+            out = sys.stderr
+        self.out = out
+        self.profile = None
+        self.filenames = []
+
+    def install(self):
+        signal.signal(signal.SIGUSR1, self._toggle)
+        if self.window:
+            signal.signal(signal.SIGALRM, self._stop)
+        return self
+
+    def _toggle(self, signum, frame):
+        if self.profile is None:
+            self.start()
+        else:
+            self.stop()
+
+    def _stop(self, signum, frame):
+        self.stop()
+
+    def start(self):
+        """ start profiling this thread """
+        import cProfile
+        if self.profile is not None:
+            return
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        if self.window:
+            signal.setitimer(signal.ITIMER_REAL, self.window)
+        self.out.write('profiling...\n')
+        self.out.flush()
+
+    def stop(self):
+        """ stop profiling and write the profile, return its filename """
+        if self.profile is None:
+            return None
+        self.profile.disable()
+        if self.window:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        filename = '%s-%.3f.prof' % (self.prefix, time.time())
+        self.profile.dump_stats(filename)
+        self.profile = None
+        self.filenames.append(filename)
+        self.out.write('profile written to %s\n' % filename)
+        self.out.flush()
+        return filename
+
+
+if __name__=='__main__':
+    from capture import CaptureReader
+    if len(sys.argv) != 2:
+        print "Usage: %s <capture file>" % sys.argv[0]
+        sys.exit(1)
+    reader = CaptureReader(sys.argv[1])
+    for reading in reader:
+        pass
+    if reader.footer is None:
+        print "No footer, the recording didn't finish"
+        sys.exit(4)
+    print format_report(reader.footer)
@@ -0,0 +1,317 @@
+"""
+Follow a growing log file and hand back the lines appended to it.
+
+There are two backends:
+
+ * InotifyTailer sleeps in the kernel until the file is written to
+   (Linux only).
+
+ * PollTailer is the old "sleep a second and try again" loop and works
+   anywhere.
+
+Both read everything that has been appended in one go and split it into
+lines themselves, so a burst of thousands of requests costs a handful of
+read() calls rather than one readline() per request. Use open_tailer() to
+get the best backend available, and multiplex() to follow several files
+from one loop.
+
+Both also survive logrotate. Only when a read comes back empty is the
+file name stat()'ed: if it's a different file now (rotated, by inode)
+what's left of the old one has just been read and the new one is read
+from its start, and if it's shorter than where we are (truncated, as
+with copytruncate) it's read again from the start. A busy log is never
+stat()'ed and an idle one once per wakeup.
+"""
+import os
+import time
+import select
+import errno
+
+# how much to ask the kernel for on each read()
+READ_SIZE = 256 * 1024
+
+
+class PollTailer(object):
+    """ tail @filename by sleeping @interval seconds whenever there's
+    nothing new to read """
+
+    name = 'poll'
+
+    # called with 'rotate' or 'truncate' when the file is reopened
+    on_reopen = None
+
+    def __init__(self, filename, interval=1.0, from_end=True):
+        self.filename = filename
+        self.interval = interval
+        self.fd = os.open(filename, os.O_RDONLY)
+        if from_end:
+            os.lseek(self.fd, 0, 2)
+        self._partial = ''
+        # how many times the file was rotated and truncated
+        self.rotations = 0
+        self.truncations = 0
+
+    def read_lines(self):
+        """ return a list of all complete lines (without the trailing
+        newline) appended since the last call. An incomplete last line is
+        kept until the rest of it has been written.
+        """
+        chunks = self._read_chunks()
+        if not chunks:
+            kind = self._reopen()
+            if kind is None:
+                return []
+            # whatever the old file ended with is a line of its own
+            rest = self._partial
+            self._partial = ''
+            lines = self.read_lines()
+            if rest:
+                rest = rest.split('\n')
+                if not rest[-1]:
+                    rest.pop()
+                lines[:0] = rest
+            if self.on_reopen is not None:
+                self.on_reopen(kind)
+            return lines
+        data = self._partial + ''.join(chunks)
+        lines = data.split('\n')
+        self._partial = lines.pop()
+        return lines
+
+    def _read_chunks(self):
+        chunks = []
+        while 1:
+            chunk = os.read(self.fd, READ_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            if len(chunk) < READ_SIZE:
+                break
+        return chunks
+
+    def _reopen(self):
+        """ when everything has been read, start again on the new file if
+        the log has been rotated or at its start if it's been truncated,
+        and return 'rotate' or 'truncate'. Returns None if neither. """
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            # moved away and the new one isn't there yet
+            return None
+        current = os.fstat(self.fd)
+        if (st.st_ino, st.st_dev) != (current.st_ino, current.st_dev):
+            fd = os.open(self.filename, os.O_RDONLY)
+            # the Zope may have written a last few lines to the old file
+            # before reopening its log
+            self._partial += ''.join(self._read_chunks())
+            os.close(self.fd)
+            self.fd = fd
+            self._opened()
+            self.rotations += 1
+            return 'rotate'
+        if st.st_size < os.lseek(self.fd, 0, 1):
+            os.lseek(self.fd, 0, 0)
+            self.truncations += 1
+            return 'truncate'
+        return None
+
+    def _opened(self):
+        """ called when a new file has been opened in place of the old """
+        pass
+
+    def wait(self, timeout=None):
+        """ block until there might be something new to read """
+        if timeout is None or timeout > self.interval:
+            timeout = self.interval
+        time.sleep(timeout)
+
+    def fileno(self):
+        """ a file descriptor that becomes readable when there's something
+        new, or None if there isn't one and we have to poll """
+        return None
+
+    def batches(self):
+        """ generator of non-empty lists of lines, forever """
+        while 1:
+            lines = self.read_lines()
+            if lines:
+                yield lines
+            else:
+                self.wait()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+#### inotify through ctypes ###################################################
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+_libc = None
+def _get_libc():
+    global _libc
+    if _libc is None:
+        import ctypes, ctypes.util
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                            use_errno=True)
+    return _libc
+
+
+class InotifyTailer(PollTailer):
+    """ tail @filename by waiting on an inotify watch, so we wake up as soon
+    as the file is written to and not at all while it's idle. The
+    directory is watched too, for a new file being put in its place. """
+
+    name = 'inotify'
+
+    # the events we want to be woken up by, of the file and the directory
+    mask = IN_MODIFY | IN_ATTRIB | IN_MOVE_SELF | IN_DELETE_SELF
+    directory_mask = IN_CREATE | IN_MOVED_TO
+
+    def __init__(self, filename, from_end=True):
+        import ctypes
+        libc = _get_libc()
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "inotify not available")
+        self.inotify_fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.inotify_fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        try:
+            self.wd = self._add_watch(filename, self.mask)
+            self._add_watch(os.path.dirname(os.path.abspath(filename)),
+                            self.directory_mask)
+        except OSError:
+            os.close(self.inotify_fd)
+            raise
+        # the watch is set up before we open the file so no write can
+        # sneak in between the two without us being told about it
+        PollTailer.__init__(self, filename, from_end=from_end)
+
+    def _add_watch(self, path, mask):
+        import ctypes
+        wd = _get_libc().inotify_add_watch(self.inotify_fd, path, mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def _opened(self):
+        # the watch is on the old file, which is going nowhere now. As
+        # the new one was opened after the directory told us about it,
+        # nothing written to it can have been missed.
+        _get_libc().inotify_rm_watch(self.inotify_fd, self.wd)
+        try:
+            self.wd = self._add_watch(self.filename, self.mask)
+        except OSError:
+            # already rotated again, the directory watch will tell
+            pass
+
+    def _drain_events(self):
+        """ throw away the queued events and return them as one string """
+        events = []
+        while 1:
+            try:
+                data = os.read(self.inotify_fd, 4096)
+            except OSError, e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    break
+                raise
+            if not data:
+                break
+            events.append(data)
+        return ''.join(events)
+
+    def fileno(self):
+        return self.inotify_fd
+
+    def wait(self, timeout=None):
+        """ block until the file has been written to or @timeout seconds
+        have passed (forever if @timeout is None) """
+        try:
+            readable, _, _ = select.select([self.inotify_fd], [], [], timeout)
+        except select.error, e:
+            if e.args[0] != errno.EINTR:
+                raise
+            return
+        if readable:
+            self._drain_events()
+
+    def close(self):
+        PollTailer.close(self)
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+
+
+BACKENDS = {
+  'inotify': InotifyTailer,
+  'poll': PollTailer,
+}
+
+def open_tailer(filename, backend=None, from_end=True):
+    """ return a tailer for @filename. If @backend is None the inotify one is
+    tried first and the polling one is used if that's not possible. """
+    if backend is not None:
+        try:
+            klass = BACKENDS[backend]
+        except KeyError:
+            raise ValueError("Unknown tailer backend %r" % backend)
+        return klass(filename, from_end=from_end)
+
+    try:
+        return InotifyTailer(filename, from_end=from_end)
+    except (OSError, AttributeError):
+        return PollTailer(filename, from_end=from_end)
+
+
+def wait_any(tailers, timeout=None):
+    """ block until any of @tailers might have something new to read """
+    fds = [t.fileno() for t in tailers]
+    if None in fds:
+        # at least one of them can only be polled
+        interval = min([t.interval for t in tailers])
+        if timeout is None or timeout > interval:
+            timeout = interval
+        time.sleep(timeout)
+        return
+    try:
+        readable, _, _ = select.select(fds, [], [], timeout)
+    except select.error, e:
+        if e.args[0] != errno.EINTR:
+            raise
+        return
+    for t in tailers:
+        if t.fileno() in readable:
+            t._drain_events()
+
+
+def multiplex(tailers, timeout=None):
+    """ generator of (index, lines) for the @tailers, where lines is a
+    non-empty list of lines read from tailers[index], forever. If @timeout
+    is given, (None, []) is generated when there was nothing to read after
+    waiting up to that long. """
+    waited = False
+    while 1:
+        got = False
+        for index, tail in enumerate(tailers):
+            lines = tail.read_lines()
+            if lines:
+                got = True
+                yield index, lines
+        if not got:
+            if waited and timeout is not None:
+                yield None, []
+            wait_any(tailers, timeout)
+            waited = True
+        else:
+            waited = False
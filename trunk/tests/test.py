@@ -1,11 +1,18 @@
 import marshal
+import glob
 import os
+import shutil
 from random import randint
 from nose.tools import raises, with_setup
 
 import sys
 sys.path.insert(0, '..')
 from generate_graph import _generate_title, _title2foldername, generate
+from capture import CaptureWriter
+from columnar import convert
+from retention import RetentionStore
+from record import Reading
+from urltable import URLTable
 
 
 def test_generate_title():
@@ -60,12 +67,19 @@ def _before_generate():
         
     
 def _after_generate():
-    if os.path.isfile('fake.marshal'):
-        os.remove('fake.marshal')
+    for filename in ('fake.marshal', 'fake.capture', 'fake.zmcc'):
+        if os.path.isfile(filename):
+            os.remove(filename)
         
-    if os.path.isdir('2008-05-30_11.31.36__10_seconds'):
-        os.remove(os.path.join('2008-05-30_11.31.36__10_seconds','index.html'))
-        os.rmdir('2008-05-30_11.31.36__10_seconds')
+    t0 = 1212143496
+    for first, last in ((t0, t0 + 10), (t0, t0 + 9), (t0 + 2, t0 + 7)):
+        dirname = _title2foldername(_generate_title(first, last))
+        if os.path.isdir(dirname):
+            shutil.rmtree(dirname)
+    # what generate() was writing into if it failed
+    for dirname in glob.glob('tmp*'):
+        if os.path.isdir(dirname):
+            shutil.rmtree(dirname)
         
     
 @with_setup(_before_generate, _after_generate)
@@ -85,6 +99,168 @@ def test_generate():
     report = open(os.path.join(expect_foldername, 'index.html')).read()
     
     assert expect_title in report, "couldn't find expected title"
+    overview = open(os.path.join(expect_foldername, 'overview.js')).read()
+    assert '"series": [["VmSize", 1]],' in overview
+    
+    
+@with_setup(_before_generate, _after_generate)
+def test_generate_again():
+    report_file = generate('fake.marshal')
+    # the old report is replaced
+    assert generate('fake.marshal') == report_file
+    save_dir = os.path.dirname(report_file)
+    # but not if there's something else in there
+    open(os.path.join(save_dir, 'notes.txt'), 'w').write('mine')
+    try:
+        generate('fake.marshal')
+    except ValueError:
+        pass
+    else:
+        assert False, "replaced a directory that isn't a report"
+    assert open(os.path.join(save_dir, 'notes.txt')).read() == 'mine'
+    assert not glob.glob('tmp*')
+    
+    
+def _overview_file(report_file):
+    return os.path.join(os.path.dirname(report_file), 'overview.js')
+    
+    
+def _before_generate_metrics():
+    data = []
+    t0 = 1212143496
+    for i in range(11):
+        memory = 10000 + i
+        data.append((('GET', '/some/url/%s' % i), memory, t0 + i,
+                     memory - 2000, 0, memory - 3000, 1000, None))
+    marshal.dump(data, open('fake.marshal','w'))
+    
+    
+@with_setup(_before_generate_metrics, _after_generate)
+def test_generate_metrics():
+    report_file = generate('fake.marshal')
+    overview = open(_overview_file(report_file)).read()
+    assert '["VmRSS", 3]' in overview
+    assert '["RssAnon", 5]' in overview
+    assert '"Pss"' not in overview
+    assert "[1212143496.00,10000,null,8000,0,7000,1000,null,0]" in overview
+    
+    chunk = open(os.path.join(os.path.dirname(report_file), 'chunks',
+                              '0000.js')).read()
+    assert chunk.startswith('chunkLoaded(0, {"d": [\n')
+    assert '"urls": ["/some/url/0",' in chunk
+    assert "[1212143496.00,10000,0,8000,0,7000,1000,null,0]" in chunk
+    
+    
+        
+    
+def _before_generate_capture():
+    writer = CaptureWriter('fake.capture')
+    t0 = 1212143496
+    for i in range(11):
+        memory = 10000 + i
+        writer.write(Reading(('GET', '/some/url/%s' % i), memory, t0 + i,
+                             memory - 2000, None, None, None, None, 0))
+    writer.close()
+    
+    
+@with_setup(_before_generate_capture, _after_generate)
+def test_generate_capture():
+    report_file = generate('fake.capture')
+    report = open(report_file).read()
+    assert _generate_title(1212143496, 1212143496 + 10) in report
+    overview = open(_overview_file(report_file)).read()
+    assert "[1212143506.00,10010,null,8010,null" in overview
+    # every reading but the first grew RSS by 1
+    assert '"leaders": {"metric": "VmRSS", "rows": [' \
+      '["/some/url/1",[1, 1, 1, 1.0, 1, 1]],\n' \
+      '["/some/url/2",' in overview
+    assert '"chunks": [[1212143496.0, 1212143506.0, "chunks/0000.js", 11]]' \
+      in overview
+    
+    
+@with_setup(_before_generate_capture, _after_generate)
+def test_generate_chunks():
+    import generate_graph
+    chunk_size = generate_graph.CHUNK_SIZE
+    generate_graph.CHUNK_SIZE = 4
+    try:
+        report_file = generate('fake.capture')
+    finally:
+        generate_graph.CHUNK_SIZE = chunk_size
+    overview = open(_overview_file(report_file)).read()
+    assert '[1212143504.0, 1212143506.0, "chunks/0002.js", 3]]' in overview
+    chunk_dir = os.path.join(os.path.dirname(report_file), 'chunks')
+    assert sorted(os.listdir(chunk_dir)) == ['0000.js', '0001.js', '0002.js']
+    chunk = open(os.path.join(chunk_dir, '0001.js')).read()
+    # the URL ids are local to the chunk
+    assert '"urls": ["/some/url/4",' in chunk
+    assert '[1212143500.00,10004,0,' in chunk
+    
+    
+@with_setup(_before_generate_capture, _after_generate)
+def test_generate_range():
+    convert('fake.capture', 'fake.zmcc')
+    for filename in ('fake.capture', 'fake.zmcc'):
+        report_file = generate(filename, 1212143498, 1212143503)
+        report = open(report_file).read()
+        assert _generate_title(1212143498, 1212143503) in report
+        overview = open(_overview_file(report_file)).read()
+        assert '"chunks": [[1212143498.0, 1212143503.0, "chunks/0000.js", ' \
+          '6]]' in overview
+        assert '"max_value": 10007, "min_value": 10002' in overview
+    
+    
+def _before_generate_instances():
+    writer = CaptureWriter('fake.capture', instances=['/zope/a', '/zope/b'])
+    t0 = 1212143496
+    for i in range(10):
+        instance = i % 2
+        memory = 10000 + 5000 * instance + i
+        writer.write(Reading(('GET', '/some/url/%s' % i), memory, t0 + i,
+                             None, None, None, None, None, instance))
+    writer.close()
+    
+    
+@with_setup(_before_generate_instances, _after_generate)
+def test_generate_instances():
+    report_file = generate('fake.capture')
+    overview = open(_overview_file(report_file)).read()
+    assert '"series": [["/zope/a VmSize", 1, 0], ["/zope/b VmSize", 1, 1]]' \
+      in overview
+    assert "[1212143497.00,15001,null,null,null,null,null,null,1]" in overview
+    # each URL grew its own instance by 2
+    assert '["/some/url/2",[1, 1, 2, 2.0, 2, 2]]' in overview
+    
+    
+def _before_generate_long_term():
+    store = RetentionStore('fake.long-term', URLTable(), raw_hours=1)
+    t0 = 1212143496
+    # a reading a minute for three hours
+    for i in range(180):
+        store.write(Reading(('GET', '/some/url/%s' % (i % 5)), 10000 + i,
+                            t0 + i * 60, None, None, None, None, None, 0))
+    store.close()
+    
+# the folder of its report, from the first rollup to the last reading, in
+# whatever the local time zone is
+LONG_TERM_FOLDER = _title2foldername(_generate_title(1212143460,
+                                                     1212143496 + 179 * 60))
+
+def _after_generate_long_term():
+    shutil.rmtree('fake.long-term')
+    if os.path.isdir(LONG_TERM_FOLDER):
+        shutil.rmtree(LONG_TERM_FOLDER)
     
     
-    
\ No newline at end of file
+@with_setup(_before_generate_long_term, _after_generate_long_term)
+def test_generate_long_term():
+    report_file = generate('fake.long-term')
+    # the report goes back to the first rollup 
+    assert os.path.dirname(report_file) == LONG_TERM_FOLDER
+    overview = open(_overview_file(report_file)).read()
+    # the minutes before the readings kept in full are a min and a max row
+    assert "[1212143460.00,10000,null,null,null,null,null,null,0],\n" \
+           "[1212143490.00,10000,null,null,null,null,null,null,0]" in overview
+    # but only those are in the chunks
+    assert '"chunks": [[1212148836.0, 1212154236.0, "chunks/0000.js", 91]]' \
+      in overview
@@ -0,0 +1,99 @@
+import os
+
+import sys
+sys.path.insert(0, '..')
+from nose.tools import with_setup
+import analytics
+from analytics import deltas, rolling_baseline, growth_rate, \
+  percentile_bands, spikes, load
+from capture import CaptureWriter
+from columnar import convert
+from record import Reading
+
+FILENAME = 'fake.capture'
+COLUMNAR = 'fake.zmcc'
+
+def _remove_capture():
+    for filename in (FILENAME, COLUMNAR):
+        if os.path.isfile(filename):
+            os.remove(filename)
+        
+
+def _with_and_without_numpy(check):
+    # the pure Python versions always, and NumPy's too if it's installed
+    numpy = analytics.numpy
+    analytics.numpy = None
+    try:
+        check(list)
+    finally:
+        analytics.numpy = numpy
+    if numpy is not None:
+        check(numpy.array)
+        
+
+def _close(a, b):
+    return len(a) == len(b) and \
+      not [1 for x, y in zip(a, b) if abs(x - y) > 1e-6]
+    
+    
+def test_deltas():
+    def check(array):
+        assert list(deltas(array([1.0, 4.0, 2.0]))) == [3.0, -2.0]
+    _with_and_without_numpy(check)
+    
+    
+def test_rolling_baseline():
+    def check(array):
+        values = array([10.0, 20.0, 30.0, 40.0, 50.0])
+        assert _close(rolling_baseline(values, 2),
+                      [10.0, 10.0, 15.0, 25.0, 35.0])
+        assert len(rolling_baseline(array([]), 2)) == 0
+    _with_and_without_numpy(check)
+    
+    
+def test_growth_rate():
+    def check(array):
+        # 1 kB a minute, with some noise
+        timestamps = array([60.0 * i for i in range(10)])
+        values = array([1000.0 + i + (i % 2) * 0.5 for i in range(10)])
+        assert abs(growth_rate(timestamps, values) - 60.0) < 1.0
+        assert growth_rate(array([1.0]), array([5.0])) is None
+        assert growth_rate(array([1.0, 1.0]), array([5.0, 6.0])) is None
+    _with_and_without_numpy(check)
+    
+    
+def test_percentile_bands():
+    def check(array):
+        timestamps = array([float(i) for i in range(20)])
+        values = array([float(i % 10) for i in range(20)])
+        rows = percentile_bands(timestamps, values, 2, (0, 50, 95))
+        assert len(rows) == 2
+        assert _close(rows[0], (0.0, 0.0, 4.5, 8.55))
+        assert _close(rows[1], (10.0, 0.0, 4.5, 8.55))
+    _with_and_without_numpy(check)
+    
+    
+def test_spikes():
+    def check(array):
+        values = [1000.0 + i % 3 for i in range(200)]
+        values[150] = 5000.0
+        assert list(spikes(array(values), 10)) == [150]
+        assert list(spikes(array([1.0] * 10), 3)) == []
+    _with_and_without_numpy(check)
+    
+    
+@with_setup(None, _remove_capture)
+def test_load():
+    writer = CaptureWriter(FILENAME)
+    for i in range(5):
+        rss = None if i == 2 else 800 + i
+        writer.write(Reading('/a', 1000 + i, 100.0 + i, rss, None, None,
+                             None, None, 0))
+    writer.close()
+    convert(FILENAME, COLUMNAR)
+    for filename in (FILENAME, COLUMNAR):
+        timestamps, values = load(filename, 'rss')
+        assert list(timestamps) == [100.0, 101.0, 103.0, 104.0]
+        assert list(values) == [800.0, 801.0, 803.0, 804.0]
+        timestamps, values = load(filename, 'memory', 101, 103)
+        assert list(values) == [1001.0, 1002.0, 1003.0]
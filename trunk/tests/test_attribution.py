@@ -0,0 +1,59 @@
+import sys
+sys.path.insert(0, '..')
+from attribution import URLStats, InFlight
+from record import Reading
+
+
+def _reading(url, memory, rss=None, instance=0):
+    return Reading(url, memory, 0, rss, None, None, None, None, instance)
+
+
+def test_url_stats():
+    stats = URLStats()
+    for url, memory in ((0, 100), (1, 150), (2, 140), (1, 200), (0, 200),
+                        (2, 210)):
+        stats.add(_reading(url, memory))
+    rows = dict([(row[0], row[1:]) for row in stats.rows()])
+    # hits, growths, total, mean, max, net
+    assert rows[0] == (2, 0, 0, 0.0, 0, 0)
+    assert rows[1] == (2, 2, 110, 55.0, 60, 110)
+    assert rows[2] == (2, 1, 10, 10.0, 10, 0)
+    
+    assert [row[0] for row in stats.top(2)] == [1, 2]
+    assert [row[0] for row in stats.top(key='hits')] == [0, 1, 2]
+    
+    
+def test_url_stats_metric():
+    stats = URLStats('rss')
+    stats.add(_reading(0, 100, 10))
+    stats.add(_reading(1, 100, 30))
+    stats.add(_reading(1, 500, None))
+    assert sorted(stats.rows()) == [(0, 1, 0, 0, 0.0, None, 0),
+                                    (1, 1, 1, 20, 20.0, 20, 20)]
+
+
+def test_url_stats_instances():
+    # the deltas are against the same instance, not the reading before
+    stats = URLStats()
+    stats.add(_reading(0, 100, instance=0))
+    stats.add(_reading(1, 5000, instance=1))
+    stats.add(_reading(0, 110, instance=0))
+    stats.add(_reading(1, 5050, instance=1))
+    assert sorted(stats.rows()) == [(0, 2, 1, 10, 10.0, 10, 10),
+                                    (1, 2, 1, 50, 50.0, 50, 50)]
+
+
+def test_in_flight_forgets_old_requests():
+    attribution = InFlight(max_duration=10)
+    attribution.add_sample(0, 100)
+    # the memory stays flat for a long time
+    for t in range(1, 1000):
+        attribution.add_sample(t, 100)
+        attribution.add_request(t % 3, t - 0.5, t)
+    assert len(attribution.requests) <= 12
+    attribution.add_sample(1000, 150)
+    attribution.add_request(0, 998.5, 1001)
+    attribution.flush()
+    rows = dict([(row[0], row[1:]) for row in attribution.stats.rows()])
+    # only the requests for URL 0 were running from 999 to 1000
+    assert rows[0][2] == 50
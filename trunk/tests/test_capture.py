@@ -0,0 +1,158 @@
+import os
+
+import sys
+sys.path.insert(0, '..')
+from nose.tools import with_setup
+from capture import CaptureWriter, CaptureReader, read_capture, is_capture, \
+  read_snapshots
+from record import Reading, Event, Snapshot
+
+FILENAME = 'fake.capture'
+
+def _remove_capture():
+    if os.path.isfile(FILENAME):
+        os.remove(FILENAME)
+        
+
+def _readings(n):
+    readings = []
+    for i in range(n):
+        url = ('GET', '/some/url/%s' % (i % 3))
+        readings.append(Reading(url, 10000 + i, 1212143496.25 + i,
+                                8000 + i, 0, 7000, 1000 + i, None, 0))
+    return readings
+    
+    
+@with_setup(None, _remove_capture)
+def test_roundtrip():
+    readings = _readings(10)
+    readings.append(Reading("'not a request'", 1, 1212143600.0,
+                            None, None, None, None, 5, 0))
+    writer = CaptureWriter(FILENAME)
+    for reading in readings:
+        writer.write(reading)
+    writer.close()
+    assert is_capture(FILENAME)
+    # each URL is only stored once
+    assert len(writer.urls) == 4
+    assert list(read_capture(FILENAME)) == readings
+    assert list(read_capture(FILENAME, block_size=7)) == readings
+    
+    
+@with_setup(None, _remove_capture)
+def test_batching():
+    writer = CaptureWriter(FILENAME, batch_size=4, flush_interval=3600)
+    readings = _readings(6)
+    for reading in readings:
+        writer.write(reading)
+    # the first batch has been written, the rest is waiting 
+    assert list(read_capture(FILENAME)) == readings[:4]
+    writer.close()
+    assert list(read_capture(FILENAME)) == readings
+    
+
+@with_setup(None, _remove_capture)
+def test_tick():
+    writer = CaptureWriter(FILENAME, flush_interval=1.0)
+    readings = _readings(3)
+    for reading in readings:
+        writer.write(reading)
+    writer.tick(writer._last_flush + 0.5)
+    assert writer._pending == 3
+    # nothing more has come in but it's waited long enough
+    writer.tick(writer._last_flush + 1.0)
+    assert list(read_capture(FILENAME)) == readings
+    writer.close()
+
+
+@with_setup(None, _remove_capture)
+def test_snapshots_flushed():
+    writer = CaptureWriter(FILENAME, batch_size=2, flush_interval=3600)
+    for i in range(3):
+        writer.write_snapshot(Snapshot(1212143496.0 + i, 0, {'gc': [i]}))
+    # no readings came in but the first two have been written
+    assert writer._pending == 1
+    assert len(list(read_snapshots(FILENAME))) == 2
+    writer.close()
+    assert len(list(read_snapshots(FILENAME))) == 3
+
+
+@with_setup(None, _remove_capture)
+def test_truncated():
+    writer = CaptureWriter(FILENAME)
+    readings = _readings(5)
+    for reading in readings:
+        writer.write(reading)
+    writer.close()
+    # as if we were killed half way through writing the last one
+    size = os.path.getsize(FILENAME)
+    f = open(FILENAME, 'r+b')
+    f.truncate(size - 10)
+    f.close()
+    assert list(read_capture(FILENAME)) == readings[:4]
+    
+
+@with_setup(None, _remove_capture)
+def test_instances():
+    readings = [reading._replace(instance=i % 2)
+                for i, reading in enumerate(_readings(4))]
+    writer = CaptureWriter(FILENAME, instances=['/zope/a', '/zope/b'])
+    for reading in readings:
+        writer.write(reading)
+    writer.close()
+    reader = CaptureReader(FILENAME)
+    assert [r.instance for r in reader] == [0, 1, 0, 1]
+    assert reader.instances == ['/zope/a', '/zope/b']
+    
+    
+@with_setup(None, _remove_capture)
+def test_events():
+    readings = _readings(3)
+    writer = CaptureWriter(FILENAME, instances=['/zope/a', '/zope/b'])
+    writer.write(readings[0])
+    restart = Event(1212143497.5, 1, 'restart', 'pid 10 -> 20')
+    writer.write_event(restart)
+    for reading in readings[1:]:
+        writer.write(reading)
+    writer.write_event(Event(1212143499.0, 0, 'rotate', '/zope/a/log/Z2.log'))
+    writer.close()
+    # they don't get in the way of the readings
+    assert list(read_capture(FILENAME)) == readings
+    reader = CaptureReader(FILENAME)
+    assert len(list(reader)) == 3
+    assert reader.events == [restart, Event(1212143499.0, 0, 'rotate',
+                                            '/zope/a/log/Z2.log')]
+    
+    
+@with_setup(None, _remove_capture)
+def test_snapshots():
+    readings = _readings(2)
+    snapshot = Snapshot(1212143496.5, 0, {u'gc': [1, 2, 3],
+                                          u'caches': [[10, 25]]})
+    writer = CaptureWriter(FILENAME)
+    writer.write(readings[0])
+    writer.write_snapshot(snapshot)
+    writer.write(readings[1])
+    writer.close()
+    assert list(read_capture(FILENAME)) == readings
+    assert list(read_snapshots(FILENAME)) == [snapshot]
+    items = list(CaptureReader(FILENAME, snapshots=True))
+    assert [type(item) for item in items] == [Reading, Snapshot, Reading]
+    
+    
+@with_setup(None, _remove_capture)
+def test_footer():
+    writer = CaptureWriter(FILENAME)
+    writer.write(_readings(1)[0])
+    writer.close()
+    reader = CaptureReader(FILENAME)
+    list(reader)
+    # the recording was killed
+    assert reader.footer is None
+    writer = CaptureWriter(FILENAME)
+    writer.write(_readings(1)[0])
+    writer.write_footer({'counts': {'lines': 12}})
+    writer.close()
+    reader = CaptureReader(FILENAME)
+    assert len(list(reader)) == 1
+    assert reader.footer == {'counts': {'lines': 12}}
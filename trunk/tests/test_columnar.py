@@ -0,0 +1,89 @@
+import os
+
+import sys
+sys.path.insert(0, '..')
+from nose.tools import with_setup
+from columnar import write_columnar, ColumnarCapture, is_columnar, convert
+from capture import CaptureWriter
+from record import Reading
+
+FILENAME = 'fake.zmcc'
+CAPTURE = 'fake.capture'
+
+def _remove_files():
+    for filename in (FILENAME, CAPTURE):
+        if os.path.isfile(filename):
+            os.remove(filename)
+        
+
+def _readings(n):
+    readings = []
+    for i in range(n):
+        readings.append(Reading(i % 3, 10000 + i, 1212143496.25 + i,
+                                8000 + i, None, 7000, 1000 + i, None, i % 2))
+    return readings
+    
+    
+@with_setup(None, _remove_files)
+def test_roundtrip():
+    import columnar
+    block_rows = columnar.BLOCK_ROWS
+    columnar.BLOCK_ROWS = 4
+    try:
+        readings = _readings(10)
+        urls = [('GET', '/a'), ('POST', '/b'), "'not a request'"]
+        assert write_columnar(FILENAME, readings, urls, ['x', 'y']) == 10
+        assert is_columnar(FILENAME)
+        capture = ColumnarCapture(FILENAME)
+        assert len(capture) == 10
+        assert capture.urls == urls
+        assert capture.instances == ['x', 'y']
+        assert list(capture.readings()) == readings
+        assert list(capture.readings(3, 5)) == readings[3:5]
+        assert list(capture.column('memory', 8)) == [10008, 10009]
+        # a buffer onto the file, nothing is copied
+        assert isinstance(capture.view('url'), buffer)
+        assert len(capture.view('url', 2, 4)) == 8
+        capture.close()
+    finally:
+        columnar.BLOCK_ROWS = block_rows
+    # and no files left behind
+    assert not [x for x in os.listdir('.') if x.startswith(FILENAME + '.')]
+    
+
+@with_setup(None, _remove_files)
+def test_time_range():
+    write_columnar(FILENAME, _readings(10), ['/a', '/b', '/c'])
+    capture = ColumnarCapture(FILENAME)
+    assert capture.time_range() == (0, 10)
+    assert capture.time_range(1212143498.25, 1212143500.25) == (2, 5)
+    assert capture.time_range(1212143498, 1212143500) == (2, 4)
+    assert capture.time_range(1212143400, 1212143400) == (0, 0)
+    assert capture.time_range(1212143600) == (10, 10)
+    assert capture.min_max('memory') == (10000, 10009)
+    assert capture.min_max('rss', 2, 5) == (8002, 8004)
+    assert capture.min_max('swap') == (None, None)
+    
+    
+@with_setup(None, _remove_files)
+def test_empty():
+    write_columnar(FILENAME, [], [])
+    capture = ColumnarCapture(FILENAME)
+    assert len(capture) == 0
+    assert list(capture.readings()) == []
+    assert capture.time_range(1, 2) == (0, 0)
+    
+    
+@with_setup(None, _remove_files)
+def test_convert():
+    writer = CaptureWriter(CAPTURE, instances=['/zope/a', '/zope/b'])
+    readings = [r._replace(url=('GET', '/url/%d' % r.url))
+                for r in _readings(5)]
+    for reading in readings:
+        writer.write(reading)
+    writer.close()
+    assert convert(CAPTURE, FILENAME) == 5
+    capture = ColumnarCapture(FILENAME)
+    assert capture.instances == ['/zope/a', '/zope/b']
+    assert [r._replace(url=capture.urls[r.url])
+            for r in capture.readings()] == readings
@@ -0,0 +1,119 @@
+import os
+
+import sys
+sys.path.insert(0, '..')
+from nose.tools import with_setup
+from compare import DeltaDistribution, Side, aligned, compare, changes, \
+  _bucket, _bucket_value
+from capture import CaptureWriter
+from record import Reading
+
+BEFORE = 'before.capture'
+AFTER = 'after.capture'
+
+
+def _remove_captures():
+    for filename in (BEFORE, AFTER):
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+
+def _reading(url, memory, timestamp, instance=0):
+    return Reading(url, memory, timestamp, None, None, None, None, None,
+                   instance)
+
+
+def _write(filename, leak, n=200, step=1.0, start=1212143496.0):
+    """ /page grows the memory by @leak kB a hit, /other by 1 every other
+    hit """
+    writer = CaptureWriter(filename)
+    memory = 10000
+    for i in range(n):
+        if i % 2:
+            url = ('GET', '/page')
+            memory += leak
+        else:
+            url = ('GET', '/other')
+            memory += (i // 2) % 2
+        writer.write(_reading(url, memory, start + i * step))
+    writer.close()
+
+
+def test_buckets():
+    assert [_bucket(x) for x in (0, 1, 2, 3, 4, 7, 8, -1, -5)] == \
+           [0, 1, 2, 2, 3, 3, 4, -1, -3]
+    for x in (0, 1, 3, 7, -7, 1023):
+        assert _bucket_value(_bucket(x)) == x
+
+
+def test_distribution():
+    d = DeltaDistribution()
+    for x in [0] * 50 + [10] * 45 + [1000] * 5:
+        d.add(x)
+    assert d.n == 100
+    assert abs(d.mean - 54.5) < 1e-9
+    assert d.percentile(50) == 0
+    assert d.percentile(90) == 15
+    assert d.percentile(100) == 1023
+    assert DeltaDistribution().percentile(50) is None
+
+
+def test_side():
+    side = Side(['/a', '/b'])
+    side.add(_reading(0, 100, 1.0, 0))
+    side.add(_reading(1, 500, 1.5, 1))
+    side.add(_reading(1, 110, 2.0, 0))
+    side.add(_reading(0, 505, 3.0, 1))
+    # deltas are per instance, and the first of each has none
+    assert side.deltas[1].n == 1 and side.deltas[1].mean == 10
+    assert side.deltas[0].mean == 5
+    assert side.net == 15 and side.count == 4
+    assert sorted(side.by_url()) == ['/a', '/b']
+
+
+def test_aligned():
+    a = [_reading(0, 1, t) for t in (100.0, 101.0, 103.0, 104.0)]
+    b = [_reading(0, 2, t) for t in (500.0, 502.0)]
+    merged = list(aligned(iter(a), iter(b)))
+    # only as far as the shorter one goes
+    assert [(side, r.timestamp) for side, r in merged] == \
+           [(0, 100.0), (1, 500.0), (0, 101.0), (1, 502.0)]
+    merged = list(aligned(iter(a), iter(b), by='requests'))
+    assert [side for side, r in merged] == [0, 1, 0, 1]
+    assert list(aligned(iter([]), iter(b))) == []
+
+
+@with_setup(None, _remove_captures)
+def test_compare():
+    _write(BEFORE, 2)
+    # twice as long and twice as fast, but only what lines up is compared
+    _write(AFTER, 10, n=400, step=0.5)
+    sides = compare(BEFORE, AFTER)
+    assert sides[0].count == 200 and sides[1].count == 399
+    rows = changes(sides, threshold=5, min_hits=20)
+    change, flagged, url, before, after = rows[0]
+    assert url == ('GET', '/page') and flagged
+    assert abs(change - 8) < 1e-9
+    assert before.mean == 2 and after.mean == 10
+    assert not rows[1][1]
+
+    sides = compare(BEFORE, AFTER, by='requests')
+    assert sides[0].count == 200 and sides[1].count == 200
+    assert not [row for row in changes(sides, threshold=10) if row[1]]
+
+
+def test_methods_kept_apart():
+    side = Side([('GET', '/x'), ('POST', '/x')])
+    memory = 1000
+    for i in range(10):
+        memory += 1
+        side.add(_reading(0, memory, i * 2.0))
+        memory += 50
+        side.add(_reading(1, memory, i * 2.0 + 1))
+    distributions = side.by_url()
+    assert sorted(distributions) == [('GET', '/x'), ('POST', '/x')]
+    assert distributions[('GET', '/x')].mean == 1
+    assert distributions[('POST', '/x')].mean == 50
+    rows = changes((Side([]), side), threshold=5, min_hits=1)
+    assert sorted([(row[2], row[0]) for row in rows]) == \
+           [(('GET', '/x'), 1.0), (('POST', '/x'), 50.0)]
@@ -0,0 +1,42 @@
+import random
+
+import sys
+sys.path.insert(0, '..')
+from downsample import minmax, StreamingMinMax
+
+
+def test_minmax_short():
+    rows = [[i, i] for i in range(10)]
+    assert minmax(rows, 5, [1]) == rows
+    
+    
+def test_minmax_keeps_spikes():
+    rows = [[i, 100, None] for i in range(1000)]
+    rows[123][1] = 5000
+    rows[456][1] = 1
+    rows[789][2] = 7
+    result = minmax(rows, 10, [1, 2])
+    assert len(result) <= 40
+    assert rows[123] in result
+    assert rows[456] in result
+    assert rows[789] in result
+    # still in order
+    assert result == sorted(result)
+
+
+def test_streaming_extend():
+    # a block at a time keeps the same rows as a row at a time
+    r = random.Random(0)
+    rows = [(i, r.randint(0, 100), r.choice([None, r.random()]))
+            for i in range(1234)]
+    one = StreamingMinMax(50, [1, 2])
+    kept = []
+    for row in rows:
+        kept.extend(one.add(row))
+    kept.extend(one.flush())
+    block = StreamingMinMax(50, [1, 2])
+    blocks = []
+    for i in range(0, len(rows), 300):
+        blocks.extend(block.extend(rows[i:i + 300]))
+    blocks.extend(block.flush())
+    assert blocks == kept
@@ -0,0 +1,91 @@
+import os
+import gzip
+import shutil
+import tempfile
+
+import sys
+sys.path.insert(0, '..')
+from nose.tools import with_setup
+from ingest import work_units, ingest_unit, ingest, COLUMNS
+from urltable import strip_query
+
+LINE = '127.0.0.1 - Anonymous [30/May/2008:11:31:36 +0100] ' \
+       '"GET /some/url HTTP/1.1" 200 1234 "-" "Mozilla/5.0" 1500000'
+
+
+DIRECTORY = os.path.join(tempfile.gettempdir(), 'test-ingest')
+
+def _make_directory():
+    os.mkdir(DIRECTORY)
+    
+def _remove_directory():
+    shutil.rmtree(DIRECTORY)
+    
+
+def _line(minute, i):
+    line = LINE.replace('31:36', '%02d:%02d' % (minute, i % 60)) \
+               .replace('/some/url', '/page%d?id=%d' % (i % 7, i))
+    if not i % 11:
+        line = line.replace('" 200 ', '" 503 ')
+    return line + '\n'
+
+
+def _write_logs():
+    # Z2.log.1.gz is the oldest
+    filenames = []
+    for name, minute in (('Z2.log', 33), ('Z2.log.1.gz', 32)):
+        filename = os.path.join(DIRECTORY, name)
+        if name.endswith('.gz'):
+            f = gzip.open(filename, 'wb')
+        else:
+            f = open(filename, 'wb')
+        for i in xrange(100):
+            f.write(_line(minute, i))
+        f.write('garbage\n')
+        f.close()
+        filenames.append(filename)
+    return filenames
+
+
+@with_setup(_make_directory, _remove_directory)
+def test_work_units():
+    filenames = _write_logs()
+    units = work_units(filenames, 1000)
+    assert units[0] == (filenames[1], 0, None)
+    size = os.path.getsize(filenames[0])
+    assert units[1] == (filenames[0], 0, 1000)
+    assert units[-1] == (filenames[0], size - size % 1000, size)
+    # every line is in exactly one of the ranges, wherever they're cut
+    hits = sum([sum([t[0] for t in ingest_unit(unit)[1]])
+                for unit in units[1:]])
+    assert hits == 100
+    
+    
+@with_setup(_make_directory, _remove_directory)
+def test_ingest():
+    filenames = _write_logs()
+    urls, totals = ingest(filenames, 'D', [strip_query], workers=1)
+    assert urls.urls == [('GET', '/page%d' % i) for i in xrange(7)]
+    hits, size, errors, seconds, slowest = totals[0]
+    assert hits == 30
+    assert size == 30 * 1234
+    # i = 0, 77 in each file
+    assert errors == 4
+    assert abs(seconds - 45.0) < 1e-9
+    assert slowest == 1.5
+    assert sum([t[COLUMNS.index('hits')] for t in totals]) == 200
+    
+    
+@with_setup(_make_directory, _remove_directory)
+def test_ingest_parallel():
+    # the same result however it's cut up and however many workers
+    filenames = _write_logs()
+    single = ingest(filenames, 'D', workers=1, chunk_bytes=997)
+    for workers in (2, 3):
+        urls, totals = ingest(filenames, 'D', workers=workers,
+                              chunk_bytes=997)
+        assert urls.urls == single[0].urls
+        assert totals == single[1]
+    urls, totals = ingest(filenames, 'D', workers=1)
+    assert urls.urls == single[0].urls
+    assert [t[:3] for t in totals] == [t[:3] for t in single[1]]
@@ -0,0 +1,153 @@
+import os
+import random
+import shutil
+import tempfile
+
+import sys
+sys.path.insert(0, '..')
+from nose.tools import with_setup
+from leaks import LeakDetector, Alert, CommandHook, LogHook, FileHook, \
+  regression_slope, theil_sen_slope, _Bucket
+from record import Reading
+from urltable import URLTable
+
+DIRECTORY = os.path.join(tempfile.gettempdir(), 'test-leaks')
+
+def _make_directory():
+    os.mkdir(DIRECTORY)
+    
+def _remove_directory():
+    shutil.rmtree(DIRECTORY)
+    
+
+def _run(detector, urls, seconds, kb_per_hour=0.0, t0=0.0, seed=0):
+    """ a reading a second from @t0 of noisy memory growing @kb_per_hour
+    from then, return the alerts """
+    r = random.Random(seed)
+    alerts = []
+    for i in xrange(int(seconds)):
+        t = t0 + i
+        url = '/page%d' % r.randint(0, 9)
+        memory = 100000 + int(i * kb_per_hour / 3600) + r.randint(-50, 50)
+        reading = Reading(urls.intern(url), memory, t, None, None, None, None,
+                          None, 0)
+        alerts.extend(detector.add(reading))
+    return alerts
+
+
+def test_slopes():
+    buckets = []
+    for start in range(0, 600, 60):
+        b = _Bucket(start)
+        for t in range(start, start + 60, 10):
+            b.add(t, 1000 + 2 * t)
+        buckets.append(b)
+    assert abs(regression_slope(buckets) - 2.0) < 1e-9
+    assert abs(theil_sen_slope(buckets) - 2.0) < 1e-9
+    # one wild bucket doesn't move Theil-Sen
+    buckets[5].sv += 1e6 * buckets[5].n
+    assert abs(theil_sen_slope(buckets) - 2.0) < 1e-9
+    assert regression_slope(buckets) > 10
+    assert regression_slope([]) is None
+
+
+def test_no_leak():
+    urls = URLTable()
+    detector = LeakDetector(urls, threshold=1024, window=1800)
+    assert _run(detector, urls, 3 * 3600) == []
+    
+    
+def test_growth():
+    urls = URLTable()
+    detector = LeakDetector(urls, threshold=1024, window=1800, cusum_kb=1e9)
+    alerts = _run(detector, urls, 3600, kb_per_hour=4096)
+    assert alerts
+    assert alerts[0].kind == 'growth'
+    assert 3500 < alerts[0].value < 4700, alerts[0].value
+    # not until there's half a window of readings
+    assert alerts[0].timestamp >= 900
+    # and not more often than the cooldown
+    timestamps = [a.timestamp for a in alerts]
+    assert min([b - a for a, b in zip(timestamps, timestamps[1:])]) >= 600
+    
+    
+def test_cusum():
+    urls = URLTable()
+    detector = LeakDetector(urls, threshold=1024, window=4 * 3600,
+                            cusum_kb=512)
+    alerts = _run(detector, urls, 3600)
+    # it starts leaking after an hour
+    alerts = _run(detector, urls, 3600, kb_per_hour=2048, t0=3600)
+    assert alerts[0].kind == 'cusum'
+    # 512 kB more than half the threshold allows takes 20 minutes
+    assert 3600 + 1000 < alerts[0].timestamp < 3600 + 1600, alerts[0]
+    
+    
+def test_url():
+    urls = URLTable()
+    detector = LeakDetector(urls, threshold=1e9, cusum_kb=1e9, min_hits=20)
+    r = random.Random(0)
+    memory = 100000
+    alerts = []
+    for i in xrange(2000):
+        url = '/page%d' % (i % 10)
+        if url == '/page3':
+            memory += 20
+        memory += r.randint(-5, 5)
+        alerts.extend(detector.add(Reading(urls.intern(url), memory, i,
+                                           None, None, None, None, None, 0)))
+    # again every cooldown, as long as it keeps doing it
+    assert set([(a.kind, a.url) for a in alerts]) == set([('url', '/page3')])
+    assert len(alerts) == 4
+    assert alerts[0].value > 4
+    assert alerts[0].timestamp < 300
+    
+    
+def _noisy(leaky_kb, kb_per_hour):
+    """ the 'url' alerts of an hour of a reading a second of 20 URLs,
+    each one 200 kB or so off """
+    urls = URLTable()
+    detector = LeakDetector(urls, threshold=1024, cusum_kb=1e9)
+    r = random.Random(0)
+    memory = 100000.0
+    alerts = []
+    for i in xrange(3600):
+        url = '/page%d' % r.randint(0, 19)
+        if url == '/page3':
+            memory += leaky_kb
+        memory += kb_per_hour / 3600.0
+        reading = Reading(urls.intern(url), int(memory + r.gauss(0, 200)),
+                          i, None, None, None, None, None, 0)
+        alerts.extend([a for a in detector.add(reading) if a.kind == 'url'])
+    return alerts
+
+
+def test_url_noisy():
+    # a single delta is no use, but the changes from minute to minute are
+    alerts = _noisy(30, 0)
+    assert alerts
+    assert set([a.url for a in alerts]) == set(['/page3'])
+    # and the whole memory growing isn't down to any URL
+    assert _noisy(0, 8192) == []
+
+
+@with_setup(_make_directory, _remove_directory)
+def test_hooks():
+    alert = Alert('growth', 0, 1212143496.0, 2048.0, None,
+                  'memory growing 2048 kB/hour')
+    log = os.path.join(DIRECTORY, 'alerts.log')
+    LogHook(log)(alert)
+    LogHook(log)(alert)
+    lines = open(log).readlines()
+    assert len(lines) == 2
+    assert lines[0].endswith(' growth [0] memory growing 2048 kB/hour\n')
+    
+    drop = os.path.join(DIRECTORY, 'drop')
+    FileHook(drop)(alert)
+    assert os.listdir(drop) == ['alert-1212143496.00-growth-0.json']
+    
+    out = os.path.join(DIRECTORY, 'command.out')
+    hook = CommandHook('echo "$ZMR_KIND $ZMR_VALUE" > %s' % out)
+    hook(alert)
+    hook.running[0].wait()
+    assert open(out).read() == 'growth 2048.0\n'
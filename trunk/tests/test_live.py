@@ -0,0 +1,91 @@
+import json
+import socket
+import urllib2
+
+import sys
+sys.path.insert(0, '..')
+from live import LiveFeed, LiveServer
+from record import Reading
+from urltable import URLTable
+
+
+def _feed(n, recent=10):
+    urls = URLTable()
+    feed = LiveFeed(urls, ['/zope/a'], recent=recent)
+    for i in range(n):
+        url = urls.intern(('GET', '/url/%d' % i))
+        feed.add(Reading(url, 10000 + i, 1212143496.0 + i, 8000, None, None,
+                         None, None, 0))
+    return feed
+
+
+def test_new_rows():
+    feed = _feed(5)
+    count, rows = feed.new_rows(3)
+    assert count == 5
+    assert rows == [(1212143499.0, 10003, '/url/3', 8000, None, None, None,
+                     None, 0),
+                    (1212143500.0, 10004, '/url/4', 8000, None, None, None,
+                     None, 0)]
+    assert feed.new_rows(5) == (5, [])
+    # only the last 10 are kept
+    feed = _feed(25)
+    count, rows = feed.new_rows(0)
+    assert count == 25
+    assert [row[1] for row in rows] == range(10015, 10025)
+
+
+def test_backfill():
+    import live
+    bucket_rows = live.BUCKET_ROWS
+    live.BUCKET_ROWS = 4
+    try:
+        feed = _feed(25)
+    finally:
+        live.BUCKET_ROWS = bucket_rows
+    count, data = feed.backfill()
+    assert count == 25
+    data = json.loads(data)
+    assert data['series'] == [['VmSize', 1], ['VmRSS', 3]]
+    assert data['min_value'] == 10000
+    assert data['max_value'] == 10024
+    timestamps = [row[0] for row in data['d']]
+    assert timestamps == sorted(timestamps)
+    # the overview of what's no longer kept, then the last 10 in full
+    assert data['d'][0][:3] == [1212143496.0, 10000, None]
+    assert [row[2] for row in data['d'][-10:]] == \
+      ['/url/%d' % i for i in range(15, 25)]
+
+
+def test_server():
+    feed = _feed(3)
+    server = LiveServer(feed, 0, batch_interval=0.01).start()
+    try:
+        base = 'http://127.0.0.1:%d' % server.server_address[1]
+        page = urllib2.urlopen(base + '/').read()
+        assert '<title>Live: /zope/a</title>' in page
+        script = urllib2.urlopen(base + '/live/overview.js').read()
+        assert script.startswith('overviewLoaded({')
+        assert script.endswith('liveConnect("events?since=3");\n')
+        assert 'jQuery' in urllib2.urlopen(base + '/jquery.js').read()
+        try:
+            urllib2.urlopen(base + '/../get_readings.py')
+            assert False, "served a file it shouldn't have"
+        except urllib2.HTTPError, e:
+            assert e.code == 404
+
+        # urllib2 wants to fill its buffer before it returns a line
+        events = socket.create_connection(server.server_address, 5)
+        events.sendall('GET /live/events?since=1 HTTP/1.0\r\n\r\n')
+        response = ''
+        while not response.endswith('\n\n'):
+            response += events.recv(4096)
+        events.close()
+        headers, body = response.split('\r\n\r\n', 1)
+        assert 'Content-Type: text/event-stream' in headers
+        id, data = body.splitlines()[:2]
+        assert id == 'id: 3'
+        assert data.startswith('data: [[1212143497.0, 10001, "/url/1",')
+        assert json.loads(data[6:])[-1][2] == '/url/2'
+    finally:
+        server.stop()
@@ -0,0 +1,68 @@
+import sys
+sys.path.insert(0, '..')
+from logparser import parse_line, request_of, log_timestamp
+
+LINE = '127.0.0.1 - Anonymous [30/May/2008:11:31:36 +0100] ' \
+       '"GET /some/url?x=1 HTTP/1.1" 200 1234 "http://example.com/" ' \
+       '"Mozilla/5.0 (X11)"'
+
+
+def test_parse_line():
+    record = parse_line(LINE)
+    assert record.host == '127.0.0.1'
+    assert record.user == 'Anonymous'
+    assert record.timestamp == 1212143496
+    assert (record.method, record.uri, record.protocol) == \
+      ('GET', '/some/url?x=1', 'HTTP/1.1')
+    assert (record.status, record.size) == (200, 1234)
+    assert record.referer == 'http://example.com/'
+    assert record.agent == 'Mozilla/5.0 (X11)'
+    assert record.duration is None
+    
+    
+def test_parse_line_duration():
+    assert parse_line(LINE + ' 250000', 'D').duration == 0.25
+    assert parse_line(LINE + ' 3', 'T').duration == 3.0
+    # not configured
+    assert parse_line(LINE + ' 3').duration is None
+    
+    
+def test_parse_line_common():
+    record = parse_line('10.0.0.1 - - [30/May/2008:11:31:36 +0100] '
+                        '"PROPFIND /dav/ HTTP/1.0" 207 -')
+    assert record.method == 'PROPFIND'
+    assert record.size == 0
+    assert record.referer is None
+    
+    
+def test_parse_line_bad():
+    assert parse_line('') is None
+    assert parse_line('not a log line') is None
+    assert parse_line(LINE.replace('May', 'Foo')) is None
+    # a request line that isn't one
+    record = parse_line(LINE.replace('GET /some/url?x=1 HTTP/1.1', 'junk'))
+    assert (record.method, record.uri) == (None, 'junk')
+    
+    
+def test_log_timestamp():
+    assert log_timestamp(LINE) == 1212143496
+    assert log_timestamp(LINE.replace('+0100', '-0130')) == \
+      1212143496 + 9000
+    # from the cache this time
+    assert log_timestamp(LINE.replace(':36 ', ':59 ')) == 1212143519
+    assert log_timestamp('no time here') is None
+    
+    
+def test_parse_line_escaped_quote():
+    record = parse_line('10.0.0.1 - - [30/May/2008:11:31:36 +0100] '
+                        '"GET /a\\" 1 HTTP/1.1" 200 5 "-" "x"')
+    assert record.uri == '/a\\" 1'
+    assert (record.status, record.size) == (200, 5)
+    
+    
+def test_request_of():
+    for method in ('GET', 'POST', 'HEAD', 'PUT', 'DELETE', 'PROPFIND'):
+        assert request_of(LINE.replace('GET', method)) == \
+          (method, '/some/url?x=1')
+    assert request_of('no request') is None
+    assert request_of('"junk"') is None
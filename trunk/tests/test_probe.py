@@ -0,0 +1,120 @@
+import os
+import time
+import tempfile
+
+import sys
+sys.path.insert(0, '..')
+from probe import Probe, ProbeListener, type_census, cache_sizes
+from get_readings import get_instance_readings
+from urltable import URLTable
+
+ADDRESS = os.path.join(tempfile.gettempdir(), 'test-probe-%d.sock' % os.getpid())
+
+
+class FakeDB(object):
+    def cacheDetailSize(self):
+        return [{'connection': 'a', 'ngsize': 10, 'size': 25},
+                {'connection': 'b', 'ngsize': 0, 'size': 3}]
+
+
+class Lots(object):
+    pass
+
+
+def test_type_census():
+    lots = [Lots() for i in range(20000)]
+    census = type_census(stride=10, top=5)
+    assert len(census) == 5
+    counts = dict(census)
+    # an estimate from every 10th object
+    assert 15000 < counts['test_probe.Lots'] < 25000
+    assert census == sorted(census, key=lambda x: x[1], reverse=True)
+
+
+def test_cache_sizes():
+    assert cache_sizes(FakeDB()) == [[10, 25], [0, 3]]
+
+
+def test_snapshot():
+    probe = Probe(ADDRESS, db=FakeDB(), census_every=3)
+    snapshots = [probe.snapshot() for i in range(4)]
+    assert snapshots[0]['pid'] == os.getpid()
+    assert snapshots[0]['caches'] == [[10, 25], [0, 3]]
+    assert len(snapshots[0]['gc']) == 3
+    # the census is only taken every 3rd snapshot
+    assert ['types' in s for s in snapshots] == [True, False, False, True]
+    probe.socket.close()
+
+
+def test_send_receive():
+    probe = Probe(ADDRESS)
+    # nobody's listening, it's dropped
+    assert not probe.send({'pid': 1})
+    listener = ProbeListener(ADDRESS)
+    try:
+        assert listener.receive() == []
+        assert probe.send({'pid': 1})
+        assert probe.send({'pid': 2})
+        assert listener.receive() == [{'pid': 1}, {'pid': 2}]
+    finally:
+        listener.close()
+        probe.socket.close()
+    assert not os.path.exists(ADDRESS)
+
+
+def test_listener_keeps_other_files():
+    open(ADDRESS, 'w').write('not a socket')
+    try:
+        try:
+            ProbeListener(ADDRESS)
+        except ValueError:
+            pass
+        else:
+            assert False, "replaced a file"
+        assert open(ADDRESS).read() == 'not a socket'
+    finally:
+        os.remove(ADDRESS)
+    # but one left over from last time is replaced
+    ProbeListener(ADDRESS)
+    listener = ProbeListener(ADDRESS)
+    listener.close()
+
+
+def test_probe_thread():
+    listener = ProbeListener(ADDRESS)
+    probe = Probe(ADDRESS, interval=0.01)
+    try:
+        probe.start()
+        time.sleep(0.1)
+        probe.stop()
+        probe.join()
+        assert probe.sent >= 2
+        assert len(listener.receive()) == min(probe.sent, 10)
+    finally:
+        listener.close()
+        probe.socket.close()
+
+
+def test_get_readings_probe():
+    fd, filename = tempfile.mkstemp()
+    os.close(fd)
+    listener = ProbeListener(ADDRESS)
+    probe = Probe(ADDRESS, db=FakeDB())
+    try:
+        snapshots = []
+        readings = get_instance_readings([(filename, os.getpid())],
+                                         urls=URLTable(), probe=listener,
+                                         on_snapshot=snapshots.append)
+        probe.send(probe.snapshot())
+        # from another process, dropped
+        probe.send({'pid': 1, 'time': 1.0})
+        open(filename, 'a').write('"GET /some/url HTTP/1.1"\n')
+        readings.next()
+        assert len(snapshots) == 1
+        assert snapshots[0].instance == 0
+        assert snapshots[0].data['caches'] == [[10, 25], [0, 3]]
+        readings.close()
+    finally:
+        listener.close()
+        probe.socket.close()
+        os.remove(filename)
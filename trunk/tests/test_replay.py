@@ -0,0 +1,108 @@
+import os
+import gzip
+import shutil
+import tempfile
+
+import sys
+sys.path.insert(0, '..')
+from nose.tools import with_setup
+from replay import log_files_in_order, iter_log, iter_records, \
+  read_timeline, replay, in_flight
+from urltable import URLTable
+
+LINE = '127.0.0.1 - Anonymous [30/May/2008:11:31:36 +0100] ' \
+       '"GET /some/url HTTP/1.1" 200 1234 "-" "Mozilla/5.0"'
+
+
+DIRECTORY = os.path.join(tempfile.gettempdir(), 'test-replay')
+
+def _make_directory():
+    os.mkdir(DIRECTORY)
+    
+def _remove_directory():
+    shutil.rmtree(DIRECTORY)
+    
+
+def _line(minute, second, uri):
+    return LINE.replace('31:36', '%02d:%02d' % (minute, second)) \
+               .replace('/some/url', uri) + '\n'
+
+
+def _write_logs():
+    # rotated: Z2.log.1.gz is the oldest, then Z2.log.1 and Z2.log
+    filenames = []
+    for name, minute in (('Z2.log', 33), ('Z2.log.1', 32), 
+                         ('Z2.log.1.gz', 31)):
+        filename = os.path.join(DIRECTORY, name)
+        if name.endswith('.gz'):
+            f = gzip.open(filename, 'wb')
+        else:
+            f = open(filename, 'wb')
+        for second in (0, 30):
+            f.write(_line(minute, second, '/%s/%s' % (minute, second)))
+        f.close()
+        filenames.append(filename)
+    return filenames
+    
+
+@with_setup(_make_directory, _remove_directory)
+def test_iter_log():
+    filenames = _write_logs()
+    assert [os.path.basename(x) for x in log_files_in_order(filenames)] == \
+      ['Z2.log.1.gz', 'Z2.log.1', 'Z2.log']
+    lines = list(iter_log(filenames))
+    assert [t for t, line in lines] == [1212143460, 1212143490, 1212143520,
+                                        1212143550, 1212143580, 1212143610]
+    assert '"GET /31/30 HTTP' in lines[1][1]
+    
+    
+@with_setup(_make_directory, _remove_directory)
+def test_iter_records():
+    filename = os.path.join(DIRECTORY, 'Z2.log')
+    f = open(filename, 'wb')
+    # the last line has no newline, and the one before isn't a request
+    f.write(_line(31, 0, '/a') + 'garbage\n' + _line(31, 1, '/b')[:-1])
+    f.close()
+    assert [r.uri for r in iter_records([filename])] == ['/a', '/b']
+    
+    
+@with_setup(_make_directory, _remove_directory)
+def test_replay():
+    filenames = _write_logs()
+    timeline = os.path.join(DIRECTORY, 'memory.txt')
+    open(timeline, 'w').write('# timestamp VmSize VmRSS\n'
+                              '1212143400 1000 800\n'
+                              '1212143470 1000 800\n'
+                              '1212143500 1100 900\n'
+                              '1212143560 1200\n')
+    samples = list(read_timeline(timeline))
+    assert samples[3] == (1212143560.0, (1200, None, None, None, None, None))
+    urls = URLTable()
+    readings = list(replay(filenames, samples, urls))
+    assert [(urls[r.url][1], r.memory, r.rss, r.timestamp) 
+            for r in readings] == [('/31/0', 1000, 800, 1212143460),
+                                   ('/32/0', 1100, 900, 1212143520),
+                                   ('/33/0', 1200, None, 1212143580)]
+    
+    
+@with_setup(_make_directory, _remove_directory)
+def test_in_flight():
+    filename = os.path.join(DIRECTORY, 'Z2.log')
+    f = open(filename, 'w')
+    # /slow runs for 20 seconds from 11:31:00, /quick for 2 from 11:31:10
+    f.write(_line(31, 10, '/quick').rstrip() + ' 2000000\n')
+    f.write(_line(31, 0, '/slow').rstrip() + ' 20000000\n')
+    f.close()
+    t0 = 1212143460
+    timeline = [(t0 - 10, (1000,)), (t0 + 10, (1100,)),
+                (t0 + 12, (1200,)), (t0 + 20, (1200,)), (t0 + 40, (1250,))]
+    urls = URLTable()
+    attribution = in_flight([filename], timeline, urls, duration='D')
+    rows = dict([(urls[row[0]][1], row[1:])
+                 for row in attribution.stats.rows()])
+    # only /slow was running for the first 100, the second 100 is shared
+    # equally and the last 50 came after both were done
+    assert rows['/slow'][0] == 1
+    assert rows['/slow'][2] == 100 + 50
+    assert rows['/quick'][2] == 50
+    assert attribution.unattributed == 50
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+
+import sys
+sys.path.insert(0, '..')
+from nose.tools import with_setup
+from retention import Rollup, RetentionStore, read_store, \
+  read_rollups, DAY
+from record import Reading
+from urltable import URLTable
+
+
+def _reading(url, memory, timestamp, rss=None, instance=0):
+    return Reading(url, memory, timestamp, rss, None, None, None, None,
+                   instance)
+
+
+def test_rollup():
+    urls = URLTable()
+    a, b = urls.intern(('GET', '/a')), urls.intern(('POST', '/a'))
+    rollup = Rollup(60, urls)
+    assert rollup.add(_reading(a, 100, 120.5, 10)) == []
+    assert rollup.add(_reading(b, 300, 130, 30)) == []
+    assert rollup.add(_reading(a, 50, 125, instance=1)) == []
+    done = rollup.add(_reading(a, 200, 180))
+    assert done == [{"t": 120, "i": 0, "n": 2, "memory": [100, 300, 200.0],
+                     "rss": [10, 30, 20.0], "urls": {"/a": 2}}]
+    assert [(x['t'], x['i'], x['rss']) for x in rollup.flush()] == \
+      [(180, 0, None), (120, 1, None)]
+    
+    
+DIRECTORY = os.path.join(tempfile.gettempdir(), 'test-retention')
+
+def _remove_store():
+    if os.path.isdir(DIRECTORY):
+        shutil.rmtree(DIRECTORY)
+    
+    
+@with_setup(_remove_store, _remove_store)
+def test_store():
+    urls = URLTable()
+    store = RetentionStore(DIRECTORY, urls, raw_hours=2, minute_days=1)
+    t0 = 1212143496
+    # a reading every 10 minutes for two days
+    readings = [_reading(('GET', '/%d' % (i % 4)), 1000 + i, t0 + i * 600)
+                for i in range(2 * 24 * 6)]
+    for reading in readings:
+        store.write(reading)
+    store.close()
+    
+    
+    # only the raw files of the last two hours or so are kept
+    recorded, names, _ = read_store(DIRECTORY)
+    recorded = list(recorded)
+    assert len(recorded) < 24
+    assert recorded == [r._replace(url=urls.intern(r.url))
+                        for r in readings[-len(recorded):]]
+    assert names[recorded[0].url] == readings[-len(recorded)].url
+    
+    minutes = list(read_rollups(DIRECTORY, 'minutes'))
+    assert minutes[-1]['t'] == (t0 + 287 * 600) // 60 * 60
+    assert minutes[0]['t'] > readings[-1].timestamp - 2 * DAY
+    hours = list(read_rollups(DIRECTORY, 'hours'))
+    assert len(hours) == 49
+    assert sum([h['n'] for h in hours]) == len(readings)
+    assert hours[1]['urls'] == {'/0': 2, '/1': 1, '/2': 1, '/3': 2}
@@ -0,0 +1,19 @@
+import sys
+sys.path.insert(0, '..')
+from ringbuffer import RingBuffer
+
+
+def test_ring_buffer():
+    ring = RingBuffer(3)
+    for i in range(2):
+        ring.append(i)
+    assert list(ring) == [0, 1]
+    for i in range(2, 7):
+        ring.append(i)
+    assert list(ring) == [4, 5, 6]
+    assert len(ring) == 3
+    assert ring.last(2) == [5, 6]
+    assert ring.last(3) == [4, 5, 6]
+    assert ring.last(10) == [4, 5, 6]
+    assert ring.last(0) == []
+    assert RingBuffer(3).last(1) == []
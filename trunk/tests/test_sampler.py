@@ -0,0 +1,220 @@
+import os
+import time
+import tempfile
+
+import sys
+sys.path.insert(0, '..')
+from nose.tools import raises
+from sampler import ProcSampler, SamplerThread, RestartingSampler, \
+  parse_status_field, Memory
+from get_readings import get_mem_size, get_readings, NO_REQUEST, \
+  _sampled_readings
+from tailer import open_tailer
+from urltable import URLTable
+
+
+STATUS = """Name:\tpython
+VmPeak:\t  20000 kB
+VmSize:\t  12345 kB
+VmRSS:\t    678 kB
+"""
+
+def test_parse_status_field():
+    assert parse_status_field(STATUS, 'VmSize:') == 12345
+    assert parse_status_field(STATUS, 'VmRSS:') == 678
+    
+    
+@raises(ValueError)
+def test_parse_status_field_missing():
+    parse_status_field(STATUS, 'VmSwap:')
+    
+
+def test_proc_sampler():
+    pid = os.getpid()
+    status = ProcSampler(pid)
+    statm = ProcSampler(pid, source='statm')
+    expect = int(get_mem_size(pid))
+    assert status.vmsize() == expect
+    # read it again off the same file descriptor
+    assert status.vmsize() == expect
+    assert statm.vmsize() == expect
+    status.close()
+    statm.close()
+    
+    
+def test_proc_sampler_sample():
+    pid = os.getpid()
+    sampler = ProcSampler(pid, pss_every=3)
+    memory = sampler.sample()
+    assert memory.vmsize >= memory.rss > 0
+    assert memory.pss > 0
+    # Pss is carried over until the third sample
+    sampler._pss = -1
+    assert sampler.sample().pss == -1
+    assert sampler.sample().pss == -1
+    assert sampler.sample().pss > 0
+    sampler.close()
+    
+    statm = ProcSampler(pid, source='statm')
+    memory = statm.sample()
+    assert memory.swap is None and memory.pss is None
+    assert memory.rss == memory.rss_anon + memory.rss_file
+    statm.close()
+    
+    
+def test_sampler_thread():
+    sampler = ProcSampler(os.getpid())
+    thread = SamplerThread(sampler, rate=200, size=10)
+    thread.start()
+    time.sleep(0.2)
+    count, samples = thread.new_samples(0)
+    # only the last 10 are kept
+    assert count > 10 and len(samples) == 10
+    assert samples[-1][1].vmsize > 0
+    assert samples == sorted(samples)
+    count2, samples = thread.new_samples(count - 1)
+    assert count2 >= count and len(samples) == count2 - count + 1
+    thread.stop()
+    thread.join()
+    sampler.close()
+    
+    
+def test_get_readings_sample_rate():
+    fd, filename = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        urls = URLTable()
+        readings = get_readings(filename, os.getpid(), sample_rate=100,
+                                urls=urls)
+        time.sleep(0.05)
+        f = open(filename, 'a')
+        f.write('"GET /some/url HTTP/1.1"\n')
+        f.close()
+        # the first sample is a change and is put down to the first line
+        reading = readings.next()
+        assert urls[reading.url] == ('GET', '/some/url')
+        assert reading.memory > 0
+        # grow while nothing is being logged
+        junk = 'x' * (20 * 1024 * 1024)
+        reading = readings.next()
+        assert urls[reading.url] == NO_REQUEST
+        readings.close()
+    finally:
+        os.remove(filename)
+
+    
+    
+class FakeSamplerThread(object):
+    def __init__(self, samples):
+        self.samples = samples
+        self.count = len(samples)
+        self.busy = 0.0
+
+    def new_samples(self, seen):
+        return self.count, self.samples[seen:]
+
+    def stop(self):
+        pass
+
+
+def test_sampled_readings_in_order():
+    filenames = []
+    for i in range(2):
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        filenames.append(filename)
+    t0 = time.time() - 100
+    def memory(kb):
+        return Memory(kb, kb, 0, kb, 0, None)
+    threads = [FakeSamplerThread([(t0 + 10, memory(1000))]),
+               FakeSamplerThread([(t0 + 5, memory(2000)),
+                                  (t0 + 20, memory(2100))])]
+    tails = [open_tailer(filename) for filename in filenames]
+    try:
+        urls = URLTable()
+        readings = _sampled_readings(tails, threads, urls, lambda: None)
+        # the first instance logs first, but the second one's older
+        # changes come out first
+        for instance, filename in enumerate(filenames):
+            f = open(filename, 'a')
+            f.write('"GET /%d HTTP/1.1"\n' % instance)
+            f.close()
+        got = [readings.next() for i in range(3)]
+        assert [r.timestamp for r in got] == \
+               [round(t0 + 5, 2), round(t0 + 10, 2), round(t0 + 20, 2)]
+        assert [r.instance for r in got] == [1, 0, 1]
+        assert urls[got[1].url] == ('GET', '/0')
+        readings.close()
+    finally:
+        for tail in tails:
+            tail.close()
+        for filename in filenames:
+            os.remove(filename)
+
+
+def test_restarting_sampler():
+    import subprocess
+    fd, pid_filename = tempfile.mkstemp()
+    os.close(fd)
+    zopes = []
+    def start_zope():
+        zope = subprocess.Popen(['sleep', '60'])
+        open(pid_filename, 'w').write('%d\n' % zope.pid)
+        zopes.append(zope)
+        return zope
+    try:
+        first = start_zope()
+        restarts = []
+        sampler = RestartingSampler(pid_filename, retry=0,
+                                    on_restart=lambda *pids:
+                                      restarts.append(pids))
+        assert sampler.sample().vmsize > 0
+        first.kill()
+        first.wait()
+        # gone, and the pid file still names it
+        assert sampler.sample() is None
+        assert sampler.sample() is None
+        second = start_zope()
+        assert sampler.sample().vmsize > 0
+        assert sampler.pid == second.pid
+        assert restarts == [(first.pid, second.pid)]
+        assert sampler.restarts == 1
+        sampler.close()
+    finally:
+        for zope in zopes:
+            if zope.poll() is None:
+                zope.kill()
+                zope.wait()
+        os.remove(pid_filename)
+    
+    
+def test_get_readings_restart():
+    import subprocess
+    fd, filename = tempfile.mkstemp()
+    os.close(fd)
+    fd, pid_filename = tempfile.mkstemp()
+    os.close(fd)
+    zope = subprocess.Popen(['sleep', '60'])
+    open(pid_filename, 'w').write('%d\n' % zope.pid)
+    try:
+        events = []
+        readings = get_readings(filename, pid_filename,
+                                on_event=events.append)
+        open(filename, 'a').write('"GET /before HTTP/1.1"\n')
+        readings.next()
+        zope.kill()
+        zope.wait()
+        zope = subprocess.Popen(['sleep', '60'])
+        open(pid_filename, 'w').write('%d\n' % zope.pid)
+        time.sleep(0.02)
+        open(filename, 'a').write('"GET /after HTTP/1.1"\n')
+        readings.next()
+        assert [e.kind for e in events] == ['restart']
+        assert events[0].detail.endswith('-> %d' % zope.pid)
+        assert events[0].instance == 0
+        readings.close()
+    finally:
+        zope.kill()
+        zope.wait()
+        os.remove(filename)
+        os.remove(pid_filename)
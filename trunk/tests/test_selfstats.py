@@ -0,0 +1,98 @@
+import os
+import time
+import signal
+import tempfile
+from StringIO import StringIO
+
+import sys
+sys.path.insert(0, '..')
+from selfstats import MonitorStats, StatsReporter, SignalProfiler, \
+  format_report, own_rss
+from get_readings import get_instance_readings
+from urltable import URLTable
+
+
+def test_report():
+    stats = MonitorStats()
+    stats.counts['lines'] += 10
+    stats.seconds['write'] += 0.5
+    stats.add_source(lambda: {'samples': 7, 'sample': 0.25})
+    stats.add_gauge('queue', lambda: 3)
+    report = stats.report()
+    assert report['counts']['lines'] == 10
+    assert report['counts']['samples'] == 7
+    assert report['seconds'] == {'sample': 0.25, 'get_url': 0.0,
+                                 'write': 0.5}
+    assert report['depths'] == {'queue': 3}
+    assert report['rss'] == own_rss() or report['rss'] > 0
+    assert report['cpu'] > 0
+
+    later = dict(report, time=report['time'] + 2,
+                 counts=dict(report['counts'], lines=30))
+    line = format_report(later, report)
+    assert '10.0 lines/s' in line
+    assert 'queue 3' in line
+    assert 'rss ' in line and 'MB' in line
+
+
+def test_reporter():
+    out = StringIO()
+    reporter = StatsReporter(MonitorStats(), 0.01, out)
+    reporter.start()
+    time.sleep(0.1)
+    reporter.stop()
+    reporter.join()
+    lines = out.getvalue().splitlines()
+    assert lines and lines[0].startswith('stats: ')
+
+
+def _busy():
+    return sum([i * i for i in range(10000)])
+
+
+def test_signal_profiler():
+    prefix = os.path.join(tempfile.gettempdir(), 'test-profile')
+    old = signal.getsignal(signal.SIGUSR1), signal.getsignal(signal.SIGALRM)
+    profiler = SignalProfiler(prefix, out=StringIO()).install()
+    try:
+        os.kill(os.getpid(), signal.SIGUSR1)
+        assert profiler.profile is not None
+        _busy()
+        os.kill(os.getpid(), signal.SIGUSR1)
+        assert profiler.profile is None
+        filename, = profiler.filenames
+        import pstats
+        names = [f[2] for f in pstats.Stats(filename).stats]
+        assert '_busy' in names
+        os.remove(filename)
+
+        # stops on its own
+        profiler = SignalProfiler(prefix, window=0.05, out=StringIO())
+        profiler.install()
+        os.kill(os.getpid(), signal.SIGUSR1)
+        assert profiler.profile is not None
+        time.sleep(0.2)
+        assert profiler.profile is None
+        os.remove(profiler.filenames[0])
+    finally:
+        signal.signal(signal.SIGUSR1, old[0])
+        signal.signal(signal.SIGALRM, old[1])
+
+
+def test_get_readings_stats():
+    fd, filename = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        stats = MonitorStats()
+        readings = get_instance_readings([(filename, os.getpid())],
+                                         urls=URLTable(), stats=stats)
+        open(filename, 'a').write('"GET /a HTTP/1.1"\n"GET /b HTTP/1.1"\n')
+        readings.next()
+        report = stats.report()
+        assert report['counts']['lines'] == 2
+        assert report['counts']['samples'] == 1
+        assert report['seconds']['sample'] > 0
+        assert report['depths'] == {'events': 0}
+        readings.close()
+    finally:
+        os.remove(filename)
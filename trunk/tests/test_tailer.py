@@ -0,0 +1,193 @@
+import os
+import time
+import tempfile
+
+import sys
+sys.path.insert(0, '..')
+from tailer import PollTailer, InotifyTailer, open_tailer, multiplex
+
+
+def _tempfile(content=''):
+    fd, filename = tempfile.mkstemp()
+    os.write(fd, content)
+    os.close(fd)
+    return filename
+
+
+def _check_tailer(klass):
+    filename = _tempfile('already there\n')
+    try:
+        tail = klass(filename)
+        assert tail.read_lines() == []
+        
+        f = open(filename, 'a')
+        f.write('one\ntwo\nthr')
+        f.flush()
+        assert tail.read_lines() == ['one', 'two']
+        
+        f.write('ee\n')
+        f.flush()
+        assert tail.read_lines() == ['three']
+        assert tail.read_lines() == []
+        f.close()
+        tail.close()
+    finally:
+        os.remove(filename)
+        
+
+def test_poll_tailer():
+    _check_tailer(PollTailer)
+    
+    
+def test_inotify_tailer():
+    _check_tailer(InotifyTailer)
+    
+    
+def test_inotify_wait():
+    filename = _tempfile()
+    try:
+        tail = InotifyTailer(filename)
+        t0 = time.time()
+        tail.wait(0.05)
+        assert time.time() - t0 >= 0.04
+        
+        open(filename, 'a').write('hello\n')
+        t0 = time.time()
+        tail.wait(5)
+        assert time.time() - t0 < 1
+        assert tail.read_lines() == ['hello']
+        tail.close()
+    finally:
+        os.remove(filename)
+        
+        
+def test_open_tailer():
+    filename = _tempfile('x\n')
+    try:
+        tail = open_tailer(filename, backend='poll')
+        assert isinstance(tail, PollTailer)
+        tail.close()
+        
+        tail = open_tailer(filename, from_end=False)
+        assert tail.read_lines() == ['x']
+        tail.close()
+    finally:
+        os.remove(filename)
+        
+        
+def test_multiplex():
+    filenames = [_tempfile(), _tempfile()]
+    try:
+        tails = [InotifyTailer(filenames[0]), PollTailer(filenames[1])]
+        lines = multiplex(tails)
+        open(filenames[1], 'a').write('b\n')
+        assert lines.next() == (1, ['b'])
+        open(filenames[0], 'a').write('a1\na2\n')
+        assert lines.next() == (0, ['a1', 'a2'])
+        t0 = time.time()
+        lines = multiplex(tails[:1], timeout=0.05)
+        assert lines.next() == (None, [])
+        assert time.time() - t0 < 1
+        for tail in tails:
+            tail.close()
+    finally:
+        for filename in filenames:
+            os.remove(filename)
+        
+        
+def _check_rotation(klass):
+    filename = _tempfile()
+    try:
+        tail = klass(filename)
+        reopened = []
+        tail.on_reopen = reopened.append
+        f = open(filename, 'a')
+        f.write('one\n')
+        f.flush()
+        assert tail.read_lines() == ['one']
+        # logrotate moves it away and the Zope writes a last line to it
+        # before reopening its log
+        os.rename(filename, filename + '.1')
+        f.write('two\nthr')
+        f.close()
+        f = open(filename, 'a')
+        f.write('four\n')
+        f.close()
+        tail.wait(1)
+        assert tail.read_lines() == ['two']
+        assert tail.read_lines() == ['thr', 'four']
+        assert reopened == ['rotate'] and tail.rotations == 1
+        open(filename, 'a').write('five\n')
+        tail.wait(1)
+        assert tail.read_lines() == ['five']
+        
+        # copytruncate
+        open(filename, 'w').close()
+        open(filename, 'a').write('six\n')
+        tail.wait(1)
+        assert tail.read_lines() == ['six']
+        assert reopened == ['rotate', 'truncate']
+        assert tail.truncations == 1
+        
+        # gone for a while
+        os.remove(filename)
+        tail.wait(0.05)
+        assert tail.read_lines() == []
+        open(filename, 'a').write('seven\n')
+        tail.wait(1)
+        assert tail.read_lines() == ['seven']
+        assert tail.rotations == 2
+        tail.close()
+    finally:
+        for name in (filename, filename + '.1'):
+            if os.path.exists(name):
+                os.remove(name)
+
+
+def test_rotation_complete_last_line():
+    filename = _tempfile()
+    try:
+        tail = PollTailer(filename)
+        f = open(filename, 'a')
+        os.rename(filename, filename + '.1')
+        open(filename, 'a').write('four\n')
+        # the last line goes into the old file between reading it and
+        # noticing the new one
+        read_chunks = tail._read_chunks
+        def nothing_yet():
+            tail._read_chunks = read_chunks
+            f.write('two\n')
+            f.close()
+            return []
+        tail._read_chunks = nothing_yet
+        assert tail.read_lines() == ['two', 'four']
+        tail.close()
+    finally:
+        for name in (filename, filename + '.1'):
+            if os.path.exists(name):
+                os.remove(name)
+
+
+def test_poll_rotation():
+    _check_rotation(PollTailer)
+
+
+def test_inotify_rotation():
+    _check_rotation(InotifyTailer)
+
+
+def test_inotify_wakes_up_on_rotation():
+    filename = _tempfile()
+    try:
+        tail = InotifyTailer(filename)
+        os.rename(filename, filename + '.1')
+        open(filename, 'a').write('new\n')
+        t0 = time.time()
+        tail.wait(5)
+        assert time.time() - t0 < 1
+        assert tail.read_lines() == ['new']
+        tail.close()
+    finally:
+        for name in (filename, filename + '.1'):
+            if os.path.exists(name):
+                os.remove(name)
@@ -0,0 +1,42 @@
+import sys
+sys.path.insert(0, '..')
+from urltable import URLTable, strip_query, collapse_numbers, uri_of, \
+  OTHER_URLS
+
+
+def test_intern():
+    table = URLTable()
+    assert table.intern(('GET', '/a')) == 0
+    assert table.intern(('POST', '/a')) == 1
+    assert table.intern(('GET', '/a')) == 0
+    assert table.intern("'garbage'") == 2
+    assert len(table) == 3
+    assert table[1] == ('POST', '/a')
+    assert uri_of(table[1]) == '/a'
+    assert uri_of(table[2]) == "'garbage'"
+    
+    
+def test_rules():
+    assert strip_query('/view?id=1') == '/view'
+    assert collapse_numbers('/issue/123/view') == '/issue/N/view'
+    assert collapse_numbers('/issue/123') == '/issue/N'
+    assert collapse_numbers('/issue/123abc') == '/issue/123abc'
+    
+    table = URLTable([strip_query, collapse_numbers])
+    assert table.intern(('GET', '/issue/1/view?x=1')) == 0
+    assert table.intern(('GET', '/issue/2/view?x=2')) == 0
+    assert table.intern(('GET', '/issue/2/edit')) == 1
+    assert table.urls == [('GET', '/issue/N/view'), ('GET', '/issue/N/edit')]
+
+
+def test_max_urls():
+    table = URLTable(max_urls=3)
+    assert table.intern(('GET', '/a')) == 0
+    assert table.intern(('GET', '/b')) == 1
+    # the table is full, the rest share the last place
+    assert table.intern(('GET', '/c')) == 2
+    assert table.intern(('GET', '/d')) == 2
+    assert table[2] == OTHER_URLS
+    # but the ones already in there keep theirs
+    assert table.intern(('GET', '/a')) == 0
+    assert len(table) == 3
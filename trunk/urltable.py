@@ -0,0 +1,80 @@
+"""
+Intern the URLs of the readings into a table of integer ids.
+
+Most hits on a site go to a few hundred distinct URLs so a reading only
+keeps the id of its URL and the string is stored once, in the table.
+Optionally URLs are normalised before they're interned so that e.g.
+'/view?id=1' and '/view?id=2' end up as the same entry.
+"""
+import re
+
+numeric_segment_regex = re.compile(r'/\d+(?=/|$)')
+
+
+def strip_query(uri):
+    """ '/foo/bar?x=1' -> '/foo/bar' """
+    return uri.split('?', 1)[0]
+
+
+def collapse_numbers(uri):
+    """ '/issue/123/view' -> '/issue/N/view' """
+    return numeric_segment_regex.sub('/N', uri)
+
+
+# the URL of everything that didn't fit in a full table
+OTHER_URLS = '(other URLs)'
+
+
+class URLTable(object):
+    """ a table of URLs, each one a (method, uri) tuple or, for log lines
+    that couldn't be parsed, just a string.
+
+    @rules is a list of functions that take a uri and return it
+    normalised, e.g. strip_query and collapse_numbers.
+
+    If @max_urls is set the table doesn't grow past that many, the URLs
+    that come after are all interned as OTHER_URLS.
+    """
+
+    def __init__(self, rules=(), max_urls=None):
+        self.rules = list(rules)
+        self.max_urls = max_urls
+        self.ids = {}
+        self.urls = []
+
+    def normalise(self, url):
+        if not self.rules or not isinstance(url, tuple):
+            return url
+        method, uri = url
+        for rule in self.rules:
+            uri = rule(uri)
+        return method, uri
+
+    def intern(self, url):
+        """ return the id of @url, adding it to the table if it's new """
+        url = self.normalise(url)
+        try:
+            return self.ids[url]
+        except KeyError:
+            if self.max_urls is not None and \
+               len(self.urls) >= self.max_urls - 1:
+                # full, keep the last place for the rest
+                url = OTHER_URLS
+                if url in self.ids:
+                    return self.ids[url]
+            id = self.ids[url] = len(self.urls)
+            self.urls.append(url)
+            return id
+
+    def __getitem__(self, id):
+        return self.urls[id]
+
+    def __len__(self):
+        return len(self.urls)
+
+
+def uri_of(url):
+    """ the uri part of a URL from the table """
+    if isinstance(url, tuple):
+        return url[1]
+    return url